@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the hot paths (run_benchmarks.py, kernels.py) and of the
+import and start-up times (import_time.py), run from the repository root:
+
+    python -m benchmarks.run_benchmarks --quick
+    python -m benchmarks.import_time
+"""
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Import time of the library modules and start-up time of the command line
+entry points, each measured in a fresh interpreter (python -X importtime,
+best of --repeat runs).
+
+    python -m benchmarks.import_time --output import_times.json
+
+For reference, the import time of numpy and of matplotlib.pyplot are
+measured the same way. The exit code is 1 if importing a library module
+imports matplotlib (only plotting.py, the __main__ demos and --plot
+should).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "single_population_growth.single_population_growth",
+    "monte_carlo_methods.mcmc",
+    "monte_carlo_methods.ising_model",
+    "monte_carlo_methods.ising_cluster",
+    "monte_carlo_methods.multivariate_mcmc",
+    "monte_carlo_methods.importance_sampling",
+    "monte_carlo_methods.streaming_importance_sampling",
+    "monte_carlo_methods.parallel_tempering",
+    "iterative_maps.iterative_maps",
+    "diffusion_process.diffusion",
+    "diffusion_process.parallel_diffusion",
+    "diffusion_process.multigrid",
+    "diffusion_process.snapshots",
+    "common.instrumentation",
+]
+REFERENCES = ["numpy", "matplotlib.pyplot"]
+ENTRY_POINTS = ["single_population_growth", "monte_carlo_methods",
+                "iterative_maps", "diffusion_process"]
+
+
+def import_time(module, repeat=5):
+    # Cumulative import time of module (seconds) and whether matplotlib was
+    # imported with it
+    best = float("inf")
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                                  f"import {module}"],
+                                 cwd=ROOT, capture_output=True, text=True,
+                                 check=True)
+        # Lines "import time: self [us] | cumulative | imported package"
+        imported = {}
+        for line in process.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                imported[fields[2].strip()] = int(fields[1])
+        best = min(best, imported[module]*1e-6)
+    return best, any(name.split(".")[0] == "matplotlib" for name in imported)
+
+def startup_time(entry_point, repeat=5):
+    # Wall time of python -m entry_point --help (interpreter included)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", entry_point, "--help"],
+                       cwd=ROOT, capture_output=True, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="JSON file of the results")
+    args = parser.parse_args(argv)
+
+    results = {"imports": [], "entry_points": []}
+    for module in REFERENCES + MODULES:
+        seconds, matplotlib = import_time(module, args.repeat)
+        results["imports"].append({"module": module, "seconds": seconds,
+                                   "imports_matplotlib": matplotlib,
+                                   "reference": module in REFERENCES})
+        print(f"import {module:52s} {1e3*seconds:8.1f} ms"
+              + (" (matplotlib)" if matplotlib else ""))
+    for entry_point in ENTRY_POINTS:
+        seconds = startup_time(entry_point, args.repeat)
+        results["entry_points"].append({"entry_point": entry_point,
+                                        "seconds": seconds})
+        print(f"python -m {entry_point:24s} --help {1e3*seconds:30.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       **results}, file, indent=2)
+
+    failed = [r["module"] for r in results["imports"]
+              if r["imports_matplotlib"] and not r["reference"]]
+    for module in failed:
+        print(f"{module} imports matplotlib")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Hot paths of the repository benchmarked by run_benchmarks.py.
+
+Each benchmark is a dict with:
+    - sizes: problem sizes of the scaling curve
+    - unit: unit of work of the throughput (work/s)
+    - setup(size, seed) -> (run, work, check): run() is the timed call,
+      work the amount of work it does and check(result) the dict of quality
+      metrics computed from its result (not timed)
+    - quality: bounds (low, high) of the quality metrics, so that a speedup
+      breaking the results is caught
+"""
+import numpy as np
+from single_population_growth.single_population_growth import (
+    euler, runge_kutta, P_max_capacity, slope_max_capacity)
+from monte_carlo_methods.mcmc import mcmc
+from monte_carlo_methods.ising_model import ising_mcmc, ising_checkerboard, \
+    ising_energy, neighbour_table
+from monte_carlo_methods.resampling import resample
+from iterative_maps.iterative_maps import iterate, F_logistic
+from diffusion_process.spatio_temporal_diffusion_process_euler_method import (
+    apply_boundary_cond, euler_step)
+from diffusion_process.diffusion import DiffusionSolver
+
+
+def _ode(method):
+    # Logistic growth up to t=20 in size steps, max error relative to M
+    # against the exact solution P_max_capacity
+    P0, r, M, tmax = 5, 0.5, 100, 20
+    def setup(size, seed):
+        delta_t = tmax/size
+        slope = lambda P: slope_max_capacity(P, r, M)
+        run = lambda: method(np.array([0, tmax]), P0, slope, delta_t)
+        def check(result):
+            ts, Ps, _ = result
+            error = np.max(np.abs(np.array(Ps)
+                                  - P_max_capacity(np.array(ts), P0, r, M)))
+            return {"max_relative_error": error/M}
+        return run, size, check
+    return setup
+
+def _mcmc(size, seed):
+    # Random walk Metropolis-Hastings on N(0, 1)
+    rng = np.random.default_rng(seed)
+    run = lambda: mcmc(lambda x: -x**2/2, 0.0,
+                       algorithm="metropolis-hastings", tmax=size,
+                       log_density=True, rng=rng,
+                       sample_candidate=lambda x: rng.normal(x, 2.4),
+                       proposal_distr=lambda x_new, x: 1)
+    def check(samples):
+        return {"mean": np.mean(samples), "variance": np.var(samples)}
+    return run, size, check
+
+def _ising(size, seed):
+    # Single spin flips at k_B*T = 3 (disordered phase), J = 1/4: the
+    # running energy must match the recomputed one
+    rng = np.random.default_rng(seed)
+    s = 2*rng.integers(2, size=size**2) - 1
+    num_sweeps = 20
+    J = 1/4
+    run = lambda: ising_mcmc(s, J, 3.0, num_sweeps, rng=rng)
+    def check(logs):
+        return {"energy_drift": abs(logs["energies"][-1]
+                                    - ising_energy(s, neighbour_table(size), J)),
+                "mean_abs_magnetization":
+                    np.mean(np.abs(logs["magnetizations"][5:]))/size**2}
+    return run, num_sweeps*size**2, check
+
+def _ising_checkerboard(size, seed):
+    rng = np.random.default_rng(seed)
+    s = (2*rng.integers(2, size=(size, size)) - 1).astype(np.int8)
+    num_sweeps = 20
+    run = lambda: ising_checkerboard(s, 1/4, 3.0, num_sweeps, rng=rng)
+    def check(logs):
+        return {"mean_abs_magnetization":
+                    np.mean(np.abs(logs["magnetizations"][5:]))/size**2}
+    return run, num_sweeps*size**2, check
+
+def _sir(scheme):
+    # Sampling importance resampling of Laplace(1.5, 1) (mean 1.5,
+    # variance 2) from N(1.5, 2) samples, as in importance_sampling.py
+    def setup(size, seed):
+        rng = np.random.default_rng(seed)
+        samples = rng.normal(1.5, 2, size=size)
+        log_weights = -np.abs(samples - 1.5) + (samples - 1.5)**2/8
+        run = lambda: samples[resample(log_weights, scheme=scheme, rng=rng)]
+        def check(resampled):
+            return {"mean": np.mean(resampled),
+                    "variance": np.var(resampled)}
+        return run, size, check
+    return setup
+
+def _iterate(size, seed):
+    # Logistic map with gamma = 3.2: the limit cycle of period 2
+    gamma = 3.2
+    run = lambda: iterate(0.3, size, F_logistic, gamma=gamma)
+    cycle = (1 + gamma + np.array([-1, 1])*np.sqrt((gamma-3)*(gamma+1)))/(2*gamma)
+    def check(xs):
+        return {"n_points": len(xs),
+                "max_error": max(np.min(np.abs(cycle - x)) for x in xs)}
+    return run, size, check
+
+def _diffusion(solver):
+    # 10**7 cell updates on a size x size grid, bitwise identical to the
+    # np.roll update of the script
+    def setup(size, seed):
+        num_steps = max(2, 10**7//size**2)
+        s_0 = 0.2*np.ones((size, size))
+        apply_boundary_cond(s_0)
+        if solver:
+            run = lambda: DiffusionSolver(s_0, 0.5, 0.1).step(num_steps)
+        else:
+            def run():
+                s = s_0
+                for _ in range(num_steps):
+                    s = euler_step(s, 0.5, 0.1, 1)
+                return s
+        def check(s):
+            reference = s_0
+            for _ in range(num_steps):
+                reference = euler_step(reference, 0.5, 0.1, 1)
+            return {"max_difference": np.max(np.abs(s - reference))}
+        return run, num_steps*size**2, check
+    return setup
+
+
+BENCHMARKS = {
+    "euler": {"sizes": [10**3, 10**4, 10**5], "unit": "steps",
+              "setup": _ode(euler),
+              "quality": {"max_relative_error": (0, 1e-2)}},
+    "runge_kutta": {"sizes": [10**3, 10**4, 10**5], "unit": "steps",
+                    "setup": _ode(runge_kutta),
+                    "quality": {"max_relative_error": (0, 1e-5)}},
+    "mcmc": {"sizes": [10**4, 10**5], "unit": "samples", "setup": _mcmc,
+             "quality": {"mean": (-0.1, 0.1), "variance": (0.85, 1.15)}},
+    "ising_mcmc": {"sizes": [16, 32, 64], "unit": "spin flips",
+                   "setup": _ising,
+                   "quality": {"energy_drift": (0, 1e-9),
+                               "mean_abs_magnetization": (0, 0.3)}},
+    "ising_checkerboard": {"sizes": [16, 64, 256], "unit": "spin flips",
+                           "setup": _ising_checkerboard,
+                           "quality": {"mean_abs_magnetization": (0, 0.3)}},
+    "sir_multinomial": {"sizes": [10**4, 10**5, 10**6], "unit": "particles",
+                        "setup": _sir("multinomial"),
+                        "quality": {"mean": (1.4, 1.6),
+                                    "variance": (1.7, 2.3)}},
+    "sir_systematic": {"sizes": [10**4, 10**5, 10**6], "unit": "particles",
+                       "setup": _sir("systematic"),
+                       "quality": {"mean": (1.4, 1.6),
+                                   "variance": (1.7, 2.3)}},
+    "iterate": {"sizes": [250, 1000, 4000], "unit": "steps",
+                "setup": _iterate,
+                "quality": {"n_points": (2, 2), "max_error": (0, 1e-4)}},
+    "diffusion_euler_step": {"sizes": [100, 512, 1024], "unit": "cells",
+                             "setup": _diffusion(solver=False),
+                             "quality": {"max_difference": (0, 0)}},
+    "diffusion_solver": {"sizes": [100, 512, 1024], "unit": "cells",
+                         "setup": _diffusion(solver=True),
+                         "quality": {"max_difference": (0, 0)}},
+}
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of the hot paths (see kernels.py): throughput at several
+problem sizes (scaling curves), peak memory and quality checks, with fixed
+seeds and no display.
+
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --baseline results.json \
+        --threshold 0.25 --threshold mcmc=0.4
+
+(python benchmarks/run_benchmarks.py also works.)
+
+The throughput is the best of --repeat runs, the peak memory (numpy arrays
+and Python objects, tracemalloc) comes from one more run. With a baseline,
+a throughput below (1 - threshold) times the baseline one is a regression.
+The exit code is 1 if there is a regression or a failed quality check.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+try:
+    from .kernels import BENCHMARKS
+except ImportError:  # run as a script: python benchmarks/run_benchmarks.py
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from benchmarks.kernels import BENCHMARKS
+
+
+def run_benchmark(name, size, seed=0, repeat=3):
+    benchmark = BENCHMARKS[name]
+    seconds = np.inf
+    for _ in range(repeat):
+        run, work, check = benchmark["setup"](size, seed)
+        start = time.perf_counter()
+        result = run()
+        seconds = min(seconds, time.perf_counter() - start)
+    quality = {metric: float(value) for metric, value in check(result).items()}
+    failed = [metric for metric, (low, high) in benchmark["quality"].items()
+              if not low <= quality[metric] <= high]
+
+    run, work, check = benchmark["setup"](size, seed)
+    tracemalloc.start()
+    run()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"benchmark": name,
+            "size": size,
+            "unit": benchmark["unit"],
+            "work": work,
+            "seconds": seconds,
+            "throughput": work/seconds,
+            "peak_memory": peak_memory,
+            "quality": quality,
+            "failed_checks": failed}
+
+def compare(results, baseline, thresholds, default_threshold=0.25):
+    # Regressions: (benchmark, size, ratio of the throughputs)
+    reference = {(r["benchmark"], r["size"]): r["throughput"]
+                 for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = (result["benchmark"], result["size"])
+        if key not in reference:
+            continue
+        ratio = result["throughput"]/reference[key]
+        result["baseline_ratio"] = ratio
+        threshold = thresholds.get(result["benchmark"], default_threshold)
+        if ratio < 1 - threshold:
+            regressions.append((*key, ratio))
+    return regressions
+
+def plot_scaling(results, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(8, 6))
+    for name in dict.fromkeys(r["benchmark"] for r in results):
+        curve = [r for r in results if r["benchmark"] == name]
+        ax.loglog([r["size"] for r in curve],
+                  [r["throughput"] for r in curve], "o-",
+                  label=f"{name} ({curve[0]['unit']}/s)")
+    ax.set_xlabel("Problem size")
+    ax.set_ylabel("Throughput")
+    ax.legend(fontsize="small")
+    fig.savefig(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS),
+                        help="benchmarks to run (default: all)")
+    parser.add_argument("--quick", action="store_true",
+                        help="smallest size of each benchmark only")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON file of the results")
+    parser.add_argument("--baseline", help="JSON file of baseline results")
+    parser.add_argument("--threshold", action="append", default=[],
+                        help="allowed throughput loss (fraction), either "
+                             "global (0.25) or per benchmark (mcmc=0.4)")
+    parser.add_argument("--plot", help="image of the scaling curves")
+    args = parser.parse_args(argv)
+
+    default_threshold = 0.25
+    thresholds = {}
+    for threshold in args.threshold:
+        if "=" in threshold:
+            name, value = threshold.split("=")
+            thresholds[name] = float(value)
+        else:
+            default_threshold = float(threshold)
+
+    results = []
+    for name in args.only or BENCHMARKS:
+        sizes = BENCHMARKS[name]["sizes"]
+        for size in sizes[:1] if args.quick else sizes:
+            result = run_benchmark(name, size, args.seed, args.repeat)
+            results.append(result)
+            quality = ", ".join(f"{metric}={value:.3g}"
+                                for metric, value in result["quality"].items())
+            print(f"{name:22s} {size:>8}: {result['throughput']:10.4g} "
+                  f"{result['unit']}/s, peak {result['peak_memory']/2**20:7.1f} "
+                  f"MiB, {quality}"
+                  + (f" FAILED {result['failed_checks']}"
+                     if result["failed_checks"] else ""))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, thresholds, default_threshold)
+        for name, size, ratio in regressions:
+            print(f"Regression: {name} (size {size}) at {ratio:.2f}x the "
+                  f"baseline throughput")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"date": datetime.now(timezone.utc).isoformat(),
+                       "python": platform.python_version(),
+                       "numpy": np.__version__,
+                       "platform": platform.platform(),
+                       "seed": args.seed,
+                       "results": results}, file, indent=2)
+    if args.plot:
+        plot_scaling(results, args.plot)
+
+    failed = [r for r in results if r["failed_checks"]]
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+Code shared by the packages: opt-in instrumentation of the samplers and
+solvers (instrumentation.py). Its demo runs from the repository root:
+
+    python -m common.instrumentation
+"""
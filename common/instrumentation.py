@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation of the samplers and solvers: mcmc.mcmc,
+ising_model.ising_mcmc, single_population_growth.euler/runge_kutta and the
+solvers of diffusion_process/diffusion.py take an instrument=None argument.
+Without it, the only cost is one "instrument is not None" test per step.
+
+The hot paths only use a few methods of the instrument (duck typing, they
+don't import this module):
+
+    - begin(**info) before the loop, end(**values) after it
+    - count(name, n=1): counters (proposals, accepted, density_evals, ...)
+    - step(**values) after each step (or sweep): every `every` steps, a
+      record with the counters, rates (acceptance rate, evaluations/s,
+      steps/s, ...), the ESS estimate of the `ess_of` value and the given
+      values (callables are only called then, e.g. a residual) is passed
+      to the callback and written to the sink
+    - timed(name, func) (profile mode): func wrapped so that its time is
+      attributed to the phase name (proposal, density, acceptance,
+      recording, ...), the wrappers are only installed when profiling
+
+Overhead of the hooks and profile of the phases, from the repository root:
+
+    python -m common.instrumentation
+"""
+import csv
+import json
+import logging
+import time
+
+
+class BatchMeansESS:
+    # Streaming effective sample size of a scalar chain by batch means:
+    # ESS = n*var(x)/(b*var(batch means)), batches of b values
+    def __init__(self, batch_size=100):
+        self.batch_size = batch_size
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.batch_total = 0.0
+        self.batch_means = []
+
+    def add(self, x):
+        x = float(x)
+        self.n += 1
+        self.total += x
+        self.total_sq += x*x
+        self.batch_total += x
+        if self.n % self.batch_size == 0:
+            self.batch_means.append(self.batch_total/self.batch_size)
+            self.batch_total = 0.0
+
+    def ess(self):
+        k = len(self.batch_means)
+        if k < 2:
+            return float("nan")
+        mean = self.total/self.n
+        variance = self.total_sq/self.n - mean**2
+        batch_mean = sum(self.batch_means)/k
+        batch_variance = sum((m - batch_mean)**2 for m in self.batch_means)/(k-1)
+        if batch_variance == 0:
+            return float(self.n)
+        return min(self.n, self.n*variance/(self.batch_size*batch_variance))
+
+
+class Instrument:
+    # every: steps between two records, callback(record) and sink (with
+    # write(record)) receive them, ess_of: name of the step value whose ESS
+    # is estimated, profile: time the phases (see timed).
+    def __init__(self, every=1000, callback=None, sink=None, profile=False,
+                 ess_of=None, clock=time.perf_counter):
+        self.every = every
+        self.callback = callback
+        self.sink = sink
+        self.profile = profile
+        self.ess_of = ess_of
+        self.clock = clock
+        self.records = []
+        self.begin()
+
+    def begin(self, **info):
+        self.info = info
+        self.counters = {}
+        self.timers = {}
+        self.n_steps = 0
+        self._ess = BatchMeansESS() if self.ess_of is not None else None
+        self._start = self.clock()
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def timed(self, name, func):
+        timers = self.timers
+        timers.setdefault(name, 0.0)
+        clock = self.clock
+        def wrapper(*args, **kwargs):
+            start = clock()
+            result = func(*args, **kwargs)
+            timers[name] += clock() - start
+            return result
+        return wrapper
+
+    def step(self, **values):
+        self.n_steps += 1
+        if self._ess is not None:
+            self._ess.add(values[self.ess_of])
+        if self.n_steps % self.every == 0:
+            self.report(**values)
+
+    def end(self, **values):
+        return self.report(final=True, **values)
+
+    def report(self, **values):
+        elapsed = self.clock() - self._start
+        record = {"step": self.n_steps, "elapsed": elapsed,
+                  "steps_per_s": self.n_steps/elapsed if elapsed else 0.0}
+        record.update(self.info)
+        record.update(self.counters)
+        for name, n in self.counters.items():
+            if name.endswith("evals"):
+                record[name + "_per_s"] = n/elapsed if elapsed else 0.0
+        if "proposals" in self.counters and "accepted" in self.counters:
+            record["acceptance_rate"] = (self.counters["accepted"]
+                                         / max(self.counters["proposals"], 1))
+        if self._ess is not None:
+            record["ess"] = self._ess.ess()
+        for name, seconds in self.timers.items():
+            record["time_" + name] = seconds
+            record["fraction_" + name] = seconds/elapsed if elapsed else 0.0
+        for name, value in values.items():
+            value = value() if callable(value) else value
+            if hasattr(value, "item") and getattr(value, "size", 0) == 1:
+                value = value.item()
+            if isinstance(value, (int, float, str, bool)):
+                record[name] = value
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+        if self.sink is not None:
+            self.sink.write(record)
+        return record
+
+
+class JSONLinesSink:
+    def __init__(self, path):
+        self.file = open(path, "w")
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CSVSink:
+    # Columns: the keys of the first record (later keys are ignored)
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.writer = None
+
+    def write(self, record):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(record),
+                                         extrasaction="ignore")
+            self.writer.writeheader()
+        self.writer.writerow(record)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class LogSink:
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logging.getLogger(__name__) if logger is None else logger
+        self.level = level
+
+    def write(self, record):
+        self.logger.log(self.level, " ".join(
+            f"{name}={value:.4g}" if isinstance(value, float)
+            else f"{name}={value}" for name, value in record.items()))
+
+    def close(self):
+        pass
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import numpy as np
+    from monte_carlo_methods.mcmc import mcmc
+    from monte_carlo_methods.ising_model import ising_mcmc
+    from single_population_growth.single_population_growth import (
+        runge_kutta, slope_max_capacity)
+    from diffusion_process.diffusion import DiffusionSolver
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
+    # Overhead of the hooks (disabled, enabled) and profile of the phases
+    rng = np.random.default_rng(0)
+    run = lambda instrument: mcmc(lambda x: -x**2/2, 0.0, tmax=10**5,
+                                  log_density=True, rng=rng,
+                                  instrument=instrument)
+    for name, instrument in [("disabled", None),
+                             ("enabled", Instrument(every=10**4,
+                                                    ess_of="log_f")),
+                             ("profile", Instrument(every=10**4,
+                                                    ess_of="log_f",
+                                                    profile=True))]:
+        start = time.perf_counter()
+        run(instrument)
+        print(f"mcmc, instrument {name}: "
+              f"{10**5/(time.perf_counter()-start):.4g} steps/s")
+    record = instrument.records[-1]
+    print("Acceptance rate {acceptance_rate:.3f}, ESS {ess:.0f}, ".format(**record)
+          + ", ".join(f"{name[9:]} {100*value:.0f}%" for name, value
+                      in record.items() if name.startswith("fraction_")))
+    
+    with tempfile.TemporaryDirectory() as directory:
+        # CSV and JSON lines sinks
+        sink = CSVSink(os.path.join(directory, "ising.csv"))
+        s = 2*rng.integers(2, size=32**2) - 1
+        ising_mcmc(s, 1/4, 1.5, 100, rng=rng,
+                   instrument=Instrument(every=25, sink=sink))
+        sink.close()
+        with open(os.path.join(directory, "ising.csv")) as file:
+            print(file.read())
+        sink = JSONLinesSink(os.path.join(directory, "ode.jsonl"))
+        runge_kutta(np.array([0, 20]), 5, lambda P: slope_max_capacity(P, 0.5, 100),
+                    delta_t=1e-3, instrument=Instrument(every=10**4, sink=sink))
+        sink.close()
+        with open(os.path.join(directory, "ode.jsonl")) as file:
+            print(file.readlines()[-1])
+    
+    # Log of the diffusion solver (the update norm is only computed every
+    # 1000 steps)
+    solver = DiffusionSolver(0.2*np.ones((100, 100)), 0.5, 0.1,
+                             instrument=Instrument(every=1000, sink=LogSink()))
+    solver.step(5000)
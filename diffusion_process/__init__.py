@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+Spatio-temporal diffusion process: explicit and ADI solvers (diffusion),
+shared memory parallel solver (parallel_diffusion), multigrid steady state
+(multigrid) and snapshots of the fields (snapshots).
+
+Importing the package or its modules only needs numpy: render_snapshots and
+plotting.py import matplotlib when called. Experiments run headless from the
+command line, see __main__.py:
+
+    python -m diffusion_process simulate --n 256 --tmax 1000 \
+        --snapshot-every 100 --output-dir results/diffusion
+"""
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Headless experiments of the diffusion process.
+
+    python -m diffusion_process simulate --n 256 --tmax 1000 \
+        --solver euler --snapshot-every 500 --output-dir results/diffusion
+    python -m diffusion_process steady-state --n 1024 --tol 1e-8 \
+        --output-dir results/steady --plot
+
+Each experiment writes {experiment}.npz (arrays) and {experiment}.json
+(parameters and summary) in the output directory, plus images with --plot
+(the only case where matplotlib is imported). The initial field is 0.2 plus
+a uniform noise of amplitude --noise drawn from the seed, with the
+boundaries of apply_boundary_cond.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+
+def _save(args, summary, **arrays):
+    name = os.path.join(args.output_dir, args.experiment)
+    if arrays:
+        np.savez(name + ".npz", **arrays)
+    parameters = {key: value for key, value in vars(args).items()
+                  if key not in ("run", "output_dir", "plot")}
+    with open(name + ".json", "w") as file:
+        json.dump({"parameters": parameters, "summary": summary}, file,
+                  indent=2)
+    return name
+
+def _initial_field(args):
+    from .spatio_temporal_diffusion_process_euler_method import \
+        apply_boundary_cond
+    rng = np.random.default_rng(args.seed)
+    s_0 = 0.2 + args.noise*rng.uniform(-1, 1, size=(args.n, args.m or args.n))
+    apply_boundary_cond(s_0)
+    return s_0
+
+def _simulate(args):
+    from .diffusion import DiffusionSolver, ADISolver
+    from .parallel_diffusion import ParallelDiffusionSolver
+    from .snapshots import SnapshotWriter
+    s_0 = _initial_field(args)
+    if args.solver == "adi":
+        solver = ADISolver(s_0, args.D, args.delta_t, args.delta_x)
+    elif args.solver == "parallel":
+        solver = ParallelDiffusionSolver(s_0, args.D, args.delta_t,
+                                         args.delta_x, n_workers=args.workers)
+    else:
+        solver = DiffusionSolver(s_0, args.D, args.delta_t, args.delta_x)
+    # Same number of steps as DiffusionSolver.run(tmax)
+    num_steps = 0
+    t = 0
+    while t < args.tmax:
+        t += args.delta_t
+        num_steps += 1
+    snapshots = os.path.join(args.output_dir, "snapshots")
+    every = args.snapshot_every or num_steps
+    start = time.perf_counter()
+    try:
+        with SnapshotWriter(snapshots) as writer:
+            writer.write(0, solver.s)
+            while solver.num_steps < num_steps:
+                solver.step(min(every, num_steps - solver.num_steps))
+                writer.write(solver.num_steps, solver.s)
+        s = solver.s.copy()
+    finally:
+        if args.solver == "parallel":
+            solver.close()
+    elapsed = time.perf_counter() - start
+    summary = {"num_steps": num_steps, "t": num_steps*args.delta_t,
+               "mean": np.mean(s), "steps_per_s": num_steps/elapsed,
+               "cells_per_s": num_steps*s.size/elapsed}
+    name = _save(args, summary, s=s)
+    if args.plot:
+        from .plotting import plot_field
+        from .snapshots import render_snapshots
+        render_snapshots(snapshots, os.path.join(args.output_dir, "images"),
+                         vmin=0, vmax=1)
+        plot_field(name + ".png", s,
+                   title=f"{args.solver}, t={summary['t']:.6g}")
+    return summary
+
+def _steady_state(args):
+    from .multigrid import steady_state
+    s_0 = _initial_field(args)
+    start = time.perf_counter()
+    s, norms = steady_state(s_0, args.delta_x, tol=args.tol,
+                            max_iter=args.max_iter,
+                            preconditioned=not args.plain_v_cycles)
+    elapsed = time.perf_counter() - start
+    summary = {"iterations": len(norms) - 1, "residual": norms[-1],
+               "converged": bool(norms[-1] < args.tol), "seconds": elapsed}
+    name = _save(args, summary, s=s, norms=np.array(norms))
+    if args.plot:
+        from .plotting import plot_field, plot_residuals
+        plot_field(name + ".png", s, title="Steady state")
+        plot_residuals(name + "_residuals.png", norms)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m diffusion_process",
+                                     description=__doc__.split("\n\n")[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--seed", type=int, default=0,
+                        help="seed of the noise of the initial field")
+    common.add_argument("--output-dir", default=".")
+    common.add_argument("--plot", action="store_true",
+                        help="also save images (imports matplotlib)")
+    common.add_argument("--n", type=int, default=100, help="number of rows")
+    common.add_argument("--m", type=int, default=None,
+                        help="number of columns (default: n)")
+    common.add_argument("--noise", type=float, default=0.0)
+    common.add_argument("--delta-x", type=float, default=1.0)
+    experiments = parser.add_subparsers(dest="experiment", required=True)
+
+    simulate = experiments.add_parser("simulate", parents=[common],
+                                      help="time stepping with snapshots")
+    simulate.add_argument("--solver", choices=["euler", "adi", "parallel"],
+                          default="euler")
+    simulate.add_argument("--D", type=float, default=0.5)
+    simulate.add_argument("--delta-t", type=float, default=0.1)
+    simulate.add_argument("--tmax", type=float, default=1000.0)
+    simulate.add_argument("--snapshot-every", type=int, default=None,
+                          help="steps between snapshots (default: first "
+                               "and last field only)")
+    simulate.add_argument("--workers", type=int, default=None,
+                          help="worker processes of the parallel solver")
+    simulate.set_defaults(run=_simulate)
+
+    steady = experiments.add_parser("steady-state", parents=[common],
+                                    help="multigrid solve of the steady "
+                                         "state")
+    steady.add_argument("--tol", type=float, default=1e-6)
+    steady.add_argument("--max-iter", type=int, default=100)
+    steady.add_argument("--plain-v-cycles", action="store_true",
+                        help="V-cycles without conjugate gradients")
+    steady.set_defaults(run=_steady_state)
+
+    args = parser.parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary = args.run(args)
+    print(", ".join(f"{key}={value:.6g}" if isinstance(value, float)
+                    else f"{key}={value}" for key, value in summary.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Reusable solver of the diffusion process of
+spatio_temporal_diffusion_process_euler_method.py: same forward Euler
+update and same boundaries (apply_boundary_cond), without any allocation in
+the time loop.
+
+The field lives in two preallocated padded buffers (current and next state)
+with one extra halo column on the left, holding the last column (the
+periodic neighbour that np.roll gives to the first column). Only the free
+cells are updated, with in-place (out=) ufuncs on slices, in the same order
+of floating point operations as np.roll version, so the results are
+bitwise identical. Fixed cells are written once in both buffers and never
+recomputed.
+
+ADISolver is an implicit alternative (Crank-Nicolson with alternating
+direction implicit half steps, Peaceman-Rachford): unconditionally stable,
+so that steps can be much larger than the explicit limit
+D*delta_t/delta_x**2 <= 1/4.
+
+Grid layout (apply_boundary_cond): first row 0, last row 1 (except its
+last cell), column 1 is 1, last column 0. Free cells: rows 1 to n-2 of
+column 0 (its left neighbour wraps to the last column) and of columns 2 to
+m-2.
+"""
+import time
+import numpy as np
+from .spatio_temporal_diffusion_process_euler_method import (apply_boundary_cond,
+                                                             euler_step)
+
+
+class DiffusionSolver:
+    # buffers and rows are used by parallel_diffusion.py: the two padded
+    # buffers (n, m+1) can be given (already initialized, e.g. in shared
+    # memory) and the solver can update only the free rows
+    # rows[0], ..., rows[1]-1 (default: all of them, 1 to n-2).
+    # instrument (see common/instrumentation.py) gets the number of cell updates
+    # and the update norm (only computed when a record is emitted) after
+    # each step.
+    def __init__(self, s_0, D, delta_t, delta_x=1, buffers=None, rows=None,
+                 instrument=None):
+        s_0 = np.array(s_0, dtype=float)
+        apply_boundary_cond(s_0)
+        n, m = s_0.shape
+        if n < 3 or m < 4:
+            raise ValueError("The grid must be at least 3x4")
+        self.D = D
+        self.delta_t = delta_t
+        self.delta_x = delta_x
+        self.num_steps = 0
+        # Same scalars as in euler_step
+        self._c = 1/delta_x**2
+        self._dt_D = delta_t*D
+
+        # Padded buffers: column 0 is the halo (copy of the last column,
+        # fixed), columns 1 to m are the field
+        if buffers is None:
+            buffers = [np.empty((n, m+1)), np.empty((n, m+1))]
+            for buffer in buffers:
+                buffer[:, 1:] = s_0
+                buffer[:, 0] = s_0[:, -1]
+        self._buffers = buffers
+        r0, r1 = (1, n-1) if rows is None else rows
+        self.instrument = instrument
+        if instrument is not None:
+            instrument.begin(solver="explicit", shape=f"{n}x{m}")
+        # Free regions (in padded columns): column 0 and columns 2 to m-2
+        regions = [(1, 2), (3, m)]
+        self._temporaries = [[np.empty((r1-r0, c1-c0)) for _ in range(3)]
+                             for c0, c1 in regions]
+        # Cells updated per step (for the instrument)
+        self._n_cells = sum(t1.size for t1, _, _ in self._temporaries)
+        # Views of each buffer (current state) for both parities, created
+        # once: (s, s_right, s_left, s_down, s_up, new_s) per region
+        self._views = []
+        for parity in range(2):
+            A = self._buffers[parity]
+            B = self._buffers[1-parity]
+            self._views.append([(A[r0:r1, c0:c1], A[r0:r1, c0-1:c1-1],
+                                 A[r0:r1, c0+1:c1+1], A[r0-1:r1-1, c0:c1],
+                                 A[r0+1:r1+1, c0:c1], B[r0:r1, c0:c1])
+                                for c0, c1 in regions])
+
+    @property
+    def s(self):
+        # Current field (a view, valid until the next step)
+        return self._buffers[self.num_steps % 2][:, 1:]
+
+    @property
+    def t(self):
+        # Exact time (no accumulated rounding errors)
+        return self.num_steps*self.delta_t
+
+    def update_norm(self):
+        # max|s_n - s_{n-1}|/(D*delta_t) (the max of the laplacian on the
+        # free cells, see run_to_steady_state)
+        return (np.max(np.abs(self._buffers[0][:, 1:] - self._buffers[1][:, 1:]))
+                /(self.D*self.delta_t))
+
+    def step(self, num_steps=1):
+        c = self._c
+        dt_D = self._dt_D
+        instrument = self.instrument
+        for _ in range(num_steps):
+            views = self._views[self.num_steps % 2]
+            for (s, s_right, s_left, s_down, s_up, new_s), (t1, t2, t3) in \
+                    zip(views, self._temporaries):
+                # pdv_2_x = c*((s_right - 2*s) + s_left)
+                np.multiply(2, s, out=t1)
+                np.subtract(s_right, t1, out=t2)
+                np.add(t2, s_left, out=t2)
+                np.multiply(c, t2, out=t2)
+                # pdv_2_y = c*((s_down - 2*s) + s_up)
+                np.subtract(s_down, t1, out=t3)
+                np.add(t3, s_up, out=t3)
+                np.multiply(c, t3, out=t3)
+                # new_s = s + dt_D*(pdv_2_x + pdv_2_y)
+                np.add(t2, t3, out=t2)
+                np.multiply(dt_D, t2, out=t2)
+                np.add(s, t2, out=new_s)
+            self.num_steps += 1
+            if instrument is not None:
+                instrument.count("cell_updates", self._n_cells)
+                instrument.step(t=self.t, update_norm=self.update_norm)
+        return self.s
+
+    def run(self, tmax):
+        # Steps until t >= tmax (same number of steps as the while loop of
+        # the script)
+        t = self.t
+        num_steps = 0
+        while t < tmax:
+            t += self.delta_t
+            num_steps += 1
+        return self.step(num_steps)
+
+
+def _factorize(free, r):
+    # LU factorization (Thomas algorithm) of the tridiagonal systems
+    # (1 + 2r) u_k - r u_{k-1} - r u_{k+1} along axis 0 of free (one system
+    # per column of free). Fixed cells are identity rows.
+    a = np.where(free, -r, 0.0)  # coefficients of u_{k-1}
+    a[0] = 0
+    c = np.where(free, -r, 0.0)  # coefficients of u_{k+1}
+    c[-1] = 0
+    b = np.where(free, 1 + 2*r, 1.0)
+    c_prime = np.empty_like(b)
+    denominators = np.empty_like(b)
+    denominators[0] = b[0]
+    c_prime[0] = c[0]/b[0]
+    for k in range(1, len(b)):
+        denominators[k] = b[k] - a[k]*c_prime[k-1]
+        c_prime[k] = c[k]/denominators[k]
+    return a, c_prime, denominators
+
+def _solve(factors, d, tmp):
+    # Solves the factorized systems in place (d of the same shape as free),
+    # all the systems at once
+    a, c_prime, denominators = factors
+    d[0] /= denominators[0]
+    for k in range(1, len(d)):
+        np.multiply(a[k], d[k-1], out=tmp)
+        d[k] -= tmp
+        d[k] /= denominators[k]
+    for k in range(len(d)-2, -1, -1):
+        np.multiply(c_prime[k], d[k+1], out=tmp)
+        d[k] -= tmp
+    return d
+
+
+class ADISolver:
+    # Same interface as DiffusionSolver. Each step of delta_t is made of two
+    # half steps, implicit in x and explicit in y, then the reverse:
+    #     (I - r d_xx) u* = (I + r d_yy) u^n
+    #     (I - r d_yy) u^{n+1} = (I + r d_xx) u*
+    # with r = D*delta_t/(2*delta_x**2), i.e. batched tridiagonal solves
+    # along the rows, then along the columns, factorized once.
+    # The fixed cells are those set by apply_boundary_cond. Periodic
+    # neighbours (np.roll) of free cells must be fixed: their known values
+    # go in the right-hand side of the implicit solves.
+    # The first damping_steps steps are backward Euler steps (see step).
+    def __init__(self, s_0, D, delta_t, delta_x=1, damping_steps=2,
+                 instrument=None):
+        s_0 = np.array(s_0, dtype=float)
+        apply_boundary_cond(s_0)
+        mask = np.full(s_0.shape, np.nan)
+        apply_boundary_cond(mask)
+        fixed = ~np.isnan(mask)
+        free = ~fixed
+        if np.any(free[:, 0] & free[:, -1]) or np.any(free[0] & free[-1]):
+            raise ValueError("Periodic neighbours of free cells must be fixed")
+        self.D = D
+        self.delta_t = delta_t
+        self.delta_x = delta_x
+        self.num_steps = 0
+        self.damping_steps = damping_steps
+        self.r = D*delta_t/(2*delta_x**2)
+        self._u = s_0
+        self._previous = s_0
+        self._fixed = fixed
+        self._fixed_values = s_0[fixed]
+        self._free = free
+        self._x_factors = _factorize(free.T, self.r)
+        self._y_factors = _factorize(free, self.r)
+        self.instrument = instrument
+        if instrument is not None:
+            instrument.begin(solver="adi", shape=f"{s_0.shape[0]}x{s_0.shape[1]}")
+
+    @property
+    def s(self):
+        return self._u
+
+    @property
+    def t(self):
+        return self.num_steps*self.delta_t
+
+    def _rhs(self, u, implicit_axis, explicit=True):
+        # Right-hand side of the solve along implicit_axis (1: x, 0: y):
+        # (I + r d) u along the other axis (u itself for backward Euler) on
+        # the free cells, the fixed values elsewhere, plus the periodic
+        # neighbours
+        r = self.r
+        if explicit:
+            axis = 1 - implicit_axis
+            rhs = u + r*(np.roll(u, 1, axis=axis) - 2*u
+                         + np.roll(u, -1, axis=axis))
+        else:
+            rhs = u.copy()
+        rhs[self._fixed] = self._fixed_values
+        free = self._free
+        if implicit_axis == 1:
+            rhs[:, 0] += r*free[:, 0]*u[:, -1]
+            rhs[:, -1] += r*free[:, -1]*u[:, 0]
+        else:
+            rhs[0] += r*free[0]*u[-1]
+            rhs[-1] += r*free[-1]*u[0]
+        return rhs
+
+    def _sweeps(self, u, explicit, tmp_x, tmp_y):
+        # Implicit along x (systems along the rows, solved transposed), then
+        # along y
+        rhs = np.ascontiguousarray(self._rhs(u, 1, explicit).T)
+        u_star = _solve(self._x_factors, rhs, tmp_x).T
+        return _solve(self._y_factors, self._rhs(u_star, 0, explicit), tmp_y)
+
+    def update_norm(self):
+        return np.max(np.abs(self._u - self._previous))/(self.D*self.delta_t)
+
+    def step(self, num_steps=1):
+        n, m = self._u.shape
+        tmp_x = np.empty(n)
+        tmp_y = np.empty(m)
+        instrument = self.instrument
+        for _ in range(num_steps):
+            self._previous = self._u
+            if self.num_steps < self.damping_steps:
+                # Two split backward Euler steps of delta_t/2 (same
+                # matrices): they damp the high frequencies of the initial
+                # discontinuities, which Crank-Nicolson barely damps with
+                # large steps (Rannacher start-up)
+                u = self._sweeps(self._u, False, tmp_x, tmp_y)
+                self._u = self._sweeps(u, False, tmp_x, tmp_y)
+            else:
+                self._u = self._sweeps(self._u, True, tmp_x, tmp_y)
+            self.num_steps += 1
+            if instrument is not None:
+                instrument.count("cell_updates", np.count_nonzero(self._free))
+                instrument.step(t=self.t, update_norm=self.update_norm)
+        return self._u
+
+    run = DiffusionSolver.run
+
+
+def run_to_steady_state(solver, tol=1e-6, check_every=100, max_steps=10**8):
+    # Steps solver (DiffusionSolver, ADISolver, ParallelDiffusionSolver)
+    # until the update norm max|s_{n+1} - s_n|/(D*delta_t), i.e. max of
+    # the discrete laplacian on the free cells (for the explicit solvers),
+    # is below tol. It is only computed every check_every steps (one copy of
+    # the field). Returns the field and the last update norm.
+    norm = np.inf
+    while solver.num_steps < max_steps:
+        solver.step(check_every - 1)
+        previous = solver.s.copy()
+        solver.step()
+        norm = np.max(np.abs(solver.s - previous))/(solver.D*solver.delta_t)
+        if norm < tol:
+            break
+    return solver.s, norm
+
+def steps_per_second(step, num_steps):
+    start = time.perf_counter()
+    step(num_steps)
+    return num_steps/(time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    delta_x = 1
+    delta_t = 0.1
+    D = np.sqrt(delta_x**2/4)
+
+    # Same results as the np.roll loop of the script
+    s = 0.2*np.ones((100, 100))
+    apply_boundary_cond(s)
+    solver = DiffusionSolver(s, D, delta_t, delta_x)
+    for _ in range(1000):
+        s = euler_step(s, D, delta_t, delta_x)
+    print("Bitwise identical after 1000 steps:",
+          np.array_equal(solver.step(1000), s))
+
+    for n in [100, 512, 1024, 2048, 4096]:
+        num_steps = max(2, 10**7//n**2)
+        s_0 = 0.2*np.ones((n, n))
+        apply_boundary_cond(s_0)
+        solver = DiffusionSolver(s_0, D, delta_t, delta_x)
+
+        def roll_steps(num_steps, s=s_0):
+            for _ in range(num_steps):
+                s = euler_step(s, D, delta_t, delta_x)
+
+        roll = steps_per_second(roll_steps, num_steps)
+        in_place = steps_per_second(solver.step, num_steps)
+        print(f"{n}x{n}: np.roll {roll:.4g} steps/s, "
+              f"in place {in_place:.4g} steps/s ({in_place/roll:.1f}x)")
+
+    # Implicit ADI vs explicit Euler (stable up to delta_t = 0.5 here):
+    # error at t = 1000 against explicit Euler with delta_t = 0.01, and
+    # simulated time per second of computation
+    n = 100
+    tmax = 1000
+    s_0 = 0.2*np.ones((n, n))
+    reference = DiffusionSolver(s_0, D, 0.01, delta_x).step(100000)
+    for name, Solver, dt in [("Euler", DiffusionSolver, 0.1),
+                             ("Euler", DiffusionSolver, 0.5),
+                             ("ADI", ADISolver, 0.5),
+                             ("ADI", ADISolver, 5),
+                             ("ADI", ADISolver, 50),
+                             ("ADI", ADISolver, 200)]:
+        solver = Solver(s_0, D, dt, delta_x)
+        start = time.perf_counter()
+        s = solver.step(round(tmax/dt))
+        elapsed = time.perf_counter() - start
+        print(f"{name} delta_t={dt}: max error {np.max(np.abs(s-reference)):.1e}, "
+              f"{tmax/elapsed:.4g} time units/s")
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Steady state of the diffusion process: for the fixed boundaries of
+apply_boundary_cond, the field converges to the solution of the discrete
+Laplace equation
+
+    (s_right - 2*s + s_left) + (s_down - 2*s + s_up) = 0
+
+on the free cells (same neighbours as np.roll), which is solved directly
+with geometric multigrid instead of marching in time.
+
+Each level has the field (fixed cells hold the boundary values, zero on the
+coarse levels where only corrections are computed) and the mask of its
+free cells. The smoother is red-black Gauss-Seidel, the residual is
+restricted by full weighting to the even cells (a coarse cell is free if
+its 3x3 fine neighbours are, see coarsen) and the corrections are
+interpolated bilinearly.
+
+The fixed cells of apply_boundary_cond are on odd columns (column 1, last
+column if m is even), so the boundaries of the coarse problems are shifted
+with respect to the fine one and plain V-cycles only reduce the residual by
+~0.6 per cycle. A symmetric V-cycle is therefore used as the preconditioner
+of conjugate gradients (the operator is symmetric on the free cells), which
+converges in a number of iterations almost independent of the grid size.
+"""
+import time
+import numpy as np
+from .spatio_temporal_diffusion_process_euler_method import apply_boundary_cond
+
+
+def neighbour_sum(u):
+    return (np.roll(u, 1, axis=0) + np.roll(u, -1, axis=0)
+            + np.roll(u, 1, axis=1) + np.roll(u, -1, axis=1))
+
+def residual(u, f, free, h2):
+    # f - laplacian(u) on the free cells (h2: squared grid spacing)
+    r = f - (neighbour_sum(u) - 4*u)/h2
+    r[~free] = 0
+    return r
+
+def smooth(u, f, free, h2, colors, n_sweeps):
+    # Red-black Gauss-Seidel sweeps in place (colors: the two masks)
+    for _ in range(n_sweeps):
+        for color in colors:
+            u[color] = ((neighbour_sum(u) - h2*f)/4)[color]
+    return u
+
+def restrict(r):
+    # Full weighting onto the cells (2i, 2j)
+    p = np.pad(r, 1)
+    weighted = (4*p[1:-1, 1:-1]
+                + 2*(p[:-2, 1:-1] + p[2:, 1:-1] + p[1:-1, :-2] + p[1:-1, 2:])
+                + p[:-2, :-2] + p[:-2, 2:] + p[2:, :-2] + p[2:, 2:])/16
+    return weighted[::2, ::2]
+
+def prolong(e, shape):
+    # Bilinear interpolation of the coarse correction on a fine grid of the
+    # given shape (zero outside the coarse grid)
+    p = np.zeros((e.shape[0]+1, e.shape[1]+1))
+    p[:-1, :-1] = e
+    fine = np.empty((2*e.shape[0], 2*e.shape[1]))
+    fine[::2, ::2] = e
+    fine[1::2, ::2] = (p[:-1, :-1] + p[1:, :-1])/2
+    fine[::2, 1::2] = (p[:-1, :-1] + p[:-1, 1:])/2
+    fine[1::2, 1::2] = (p[:-1, :-1] + p[1:, :-1] + p[:-1, 1:] + p[1:, 1:])/4
+    return fine[:shape[0], :shape[1]]
+
+
+class Level:
+    def __init__(self, free, h2):
+        self.free = free
+        self.h2 = h2
+        parity = np.add.outer(np.arange(free.shape[0]),
+                              np.arange(free.shape[1])) % 2
+        self.colors = [free & (parity == 0), free & (parity == 1)]
+
+
+def coarsen(free):
+    # A coarse cell (2i, 2j) is free if the 3x3 fine cells around it are
+    # free: fixed cells on odd rows or columns (e.g. column 1) then still
+    # bound the coarse problem, one fine cell further at most
+    interior = free.copy()
+    for axis in [0, 1]:
+        for shift in [1, -1]:
+            interior &= np.roll(free, shift, axis=axis)
+    for shift in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
+        interior &= np.roll(free, shift, axis=(0, 1))
+    return interior[::2, ::2]
+
+def make_levels(free, h2, min_size=3):
+    levels = [Level(free, h2)]
+    while min(free.shape) > min_size and np.any(coarsen(free)):
+        free = coarsen(free)
+        h2 = 4*h2
+        levels.append(Level(free, h2))
+    return levels
+
+def v_cycle(levels, u, f, k=0, n_pre=2, n_post=2, n_coarse=50):
+    level = levels[k]
+    if k == len(levels) - 1:
+        return smooth(u, f, level.free, level.h2, level.colors, n_coarse)
+    smooth(u, f, level.free, level.h2, level.colors, n_pre)
+    r = residual(u, f, level.free, level.h2)
+    coarse = levels[k+1]
+    f_c = restrict(r)
+    e_c = v_cycle(levels, np.zeros(f_c.shape), f_c*coarse.free, k+1,
+                  n_pre, n_post, n_coarse)
+    e = prolong(e_c, u.shape)
+    u[level.free] += e[level.free]
+    # Colors in reverse order: symmetric V-cycle
+    return smooth(u, f, level.free, level.h2, level.colors[::-1], n_post)
+
+def steady_state(s_0, delta_x=1, tol=1e-6, max_iter=100, preconditioned=True):
+    # Discrete Laplace solution with the boundaries of apply_boundary_cond
+    # (s_0 only gives the initial guess of the free cells), with V-cycle
+    # preconditioned conjugate gradients (plain V-cycles if not
+    # preconditioned). Stops when the max of |laplacian(s)| on the free
+    # cells is below tol (same criterion as run_to_steady_state of
+    # diffusion.py). Returns the field and the residual norm after each
+    # iteration.
+    u = np.array(s_0, dtype=float)
+    apply_boundary_cond(u)
+    mask = np.full(u.shape, np.nan)
+    apply_boundary_cond(mask)
+    free = np.isnan(mask)
+    h2 = delta_x**2
+    levels = make_levels(free, h2)
+    zeros = np.zeros(u.shape)
+    r = residual(u, zeros, free, h2)
+    norms = [np.max(np.abs(r))]
+    if not preconditioned:
+        while norms[-1] >= tol and len(norms) <= max_iter:
+            v_cycle(levels, u, zeros)
+            norms.append(np.max(np.abs(residual(u, zeros, free, h2))))
+        return u, norms
+
+    # Conjugate gradients on laplacian(e) = r (negative definite: same
+    # iterates as on -laplacian), z = V-cycle(r) approximating e
+    z = v_cycle(levels, np.zeros(u.shape), r)
+    p = z.copy()
+    rz = np.sum(r*z)
+    while norms[-1] >= tol and len(norms) <= max_iter:
+        Ap = -residual(p, zeros, free, h2)
+        alpha = rz/np.sum(p*Ap)
+        u += alpha*p
+        r -= alpha*Ap
+        norms.append(np.max(np.abs(r)))
+        z = v_cycle(levels, np.zeros(u.shape), r)
+        rz, rz_old = np.sum(r*z), rz
+        p = z + rz/rz_old*p
+    return u, norms
+
+
+if __name__ == "__main__":
+    from .diffusion import DiffusionSolver, run_to_steady_state
+
+    # Time to steady state (max |laplacian| < tol) of the explicit march for
+    # tmax = 10001 as in the script, the explicit march stopped early
+    # (checked every 100 steps) and multigrid
+    D = 0.5
+    delta_t = 0.1
+    tol = 1e-6
+    for n in [100, 256, 1024, 2048, 4096]:
+        s_0 = 0.2*np.ones((n, n))
+        start = time.perf_counter()
+        u, norms = steady_state(s_0, tol=tol)
+        multigrid = time.perf_counter() - start
+        print(f"{n}x{n}: multigrid {multigrid:.3g} s ({len(norms)-1} "
+              f"iterations, residual {norms[-1]:.1e})")
+        if n > 256:
+            continue  # O(n^2) steps of O(n^2) each
+        solver = DiffusionSolver(s_0, D, delta_t)
+        start = time.perf_counter()
+        s, norm = run_to_steady_state(solver, tol=tol, check_every=100)
+        early = time.perf_counter() - start
+        print(f"  early exit march {early:.3g} s ({solver.num_steps} steps, "
+              f"update norm {norm:.1e}), max difference with multigrid "
+              f"{np.max(np.abs(s-u)):.1e}")
+        if n == 100:
+            solver = DiffusionSolver(s_0, D, delta_t)
+            start = time.perf_counter()
+            s = solver.run(10001)
+            fixed = time.perf_counter() - start
+            print(f"  fixed march {fixed:.3g} s ({solver.num_steps} steps), "
+                  f"max difference with multigrid {np.max(np.abs(s-u)):.1e}")
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel version of DiffusionSolver (diffusion.py) for large grids: the
+two padded buffers live in shared memory (multiprocessing.shared_memory)
+and the free rows are split into horizontal strips, one per worker process.
+
+At each step, a worker reads its strip and the row just above and below it
+(one-cell halos, written by its neighbours at the previous step) from the
+current buffer, writes its strip in the next buffer, then waits for the
+others on a barrier. Nothing else is exchanged. Each cell is computed
+exactly as in DiffusionSolver, so the results are bitwise identical to the
+serial solver whatever the number of workers.
+
+If a worker raises (or dies), the barrier is aborted so that the others
+stop waiting, the solver is closed and the error is raised by step. The
+workers are stopped and the shared memory is released by close(), or when
+the solver is garbage collected.
+"""
+import time
+import traceback
+import weakref
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from threading import BrokenBarrierError
+import numpy as np
+from .diffusion import DiffusionSolver, steps_per_second
+from .spatio_temporal_diffusion_process_euler_method import apply_boundary_cond
+
+
+def _worker(connection, barrier, memories, shape, rows, D, delta_t, delta_x):
+    # Replies (True, num_steps) after the steps, or (False, (exception,
+    # traceback)) after aborting the barrier
+    buffers = [np.ndarray(shape, dtype=float, buffer=memory.buf)
+               for memory in memories]
+    s_0 = buffers[0][:, 1:]
+    solver = DiffusionSolver(s_0, D, delta_t, delta_x, buffers=buffers,
+                             rows=rows)
+    while True:
+        num_steps = connection.recv()
+        if num_steps is None:
+            break
+        try:
+            for _ in range(num_steps):
+                solver.step()
+                barrier.wait()
+            reply = (True, solver.num_steps)
+        except Exception as error:
+            barrier.abort()
+            reply = (False, (error, traceback.format_exc()))
+        connection.send(reply)
+    del solver, buffers, s_0
+    for memory in memories:
+        memory.close()
+
+def _shutdown(connections, processes, memories):
+    # Stops the workers (terminated if they don't exit) and releases the
+    # shared memory, see ParallelDiffusionSolver.close
+    for connection in connections:
+        try:
+            connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        connection.close()
+    for process in processes:
+        process.join(timeout=1)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    for memory in memories:
+        try:
+            memory.close()
+        except BufferError:  # a view of the field is still referenced
+            pass
+        memory.unlink()
+
+
+class ParallelDiffusionSolver:
+    # Same interface as DiffusionSolver, n_workers processes (default: one
+    # per core). Call close() (or use it as a context manager) to stop the
+    # workers and free the shared memory.
+    def __init__(self, s_0, D, delta_t, delta_x=1, n_workers=None):
+        s_0 = np.array(s_0, dtype=float)
+        apply_boundary_cond(s_0)
+        n, m = s_0.shape
+        if n < 3 or m < 4:
+            raise ValueError("The grid must be at least 3x4")
+        self.D = D
+        self.delta_t = delta_t
+        self.delta_x = delta_x
+        self.num_steps = 0
+        n_workers = min(n-2, mp.cpu_count() if n_workers is None
+                        else n_workers)
+        self.n_workers = n_workers
+
+        shape = (n, m+1)
+        self._memories = [shared_memory.SharedMemory(
+                              create=True, size=n*(m+1)*np.dtype(float).itemsize)
+                          for _ in range(2)]
+        self._buffers = [np.ndarray(shape, dtype=float, buffer=memory.buf)
+                         for memory in self._memories]
+        for buffer in self._buffers:
+            buffer[:, 1:] = s_0
+            buffer[:, 0] = s_0[:, -1]
+
+        # Strips of (almost) equal numbers of free rows
+        bounds = np.linspace(1, n-1, n_workers+1).round().astype(int)
+        context = mp.get_context("fork" if "fork" in mp.get_all_start_methods()
+                                 else None)
+        self._barrier = context.Barrier(n_workers)
+        self._connections = []
+        self._processes = []
+        self._finalizer = weakref.finalize(self, _shutdown, self._connections,
+                                           self._processes, self._memories)
+        for r0, r1 in zip(bounds[:-1], bounds[1:]):
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker,
+                                      args=(child, self._barrier,
+                                            self._memories,
+                                            shape, (r0, r1), D, delta_t,
+                                            delta_x),
+                                      daemon=True)
+            process.start()
+            child.close()  # recv raises EOFError if the worker dies
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    @property
+    def s(self):
+        # Current field (a view in shared memory, valid until the next step
+        # or close)
+        return self._buffers[self.num_steps % 2][:, 1:]
+
+    @property
+    def t(self):
+        return self.num_steps*self.delta_t
+
+    def step(self, num_steps=1):
+        if not self._finalizer.alive:
+            raise ValueError("The solver is closed")
+        for connection in self._connections:
+            connection.send(num_steps)
+        errors = []
+        pending = dict(zip(self._connections, self._processes))
+        while pending:
+            ready = wait(list(pending)
+                         + [process.sentinel for process in pending.values()])
+            for connection, process in list(pending.items()):
+                reply = None
+                if connection in ready:
+                    try:
+                        ok, reply = connection.recv()
+                    except EOFError:
+                        ok = False
+                elif process.sentinel in ready:
+                    ok = False
+                else:
+                    continue
+                del pending[connection]
+                if not ok:
+                    # The others may wait for this worker on the barrier
+                    self._barrier.abort()
+                    if not isinstance(reply, tuple):
+                        process.join()
+                        reply = (RuntimeError(
+                                     f"Diffusion worker {process.pid} died "
+                                     f"(exit code {process.exitcode})"), "")
+                    errors.append(reply)
+        if errors:
+            self.close()
+            # The first error that isn't a consequence of the aborted barrier
+            errors.sort(key=lambda e: isinstance(e[0], BrokenBarrierError))
+            error, remote_traceback = errors[0]
+            raise error from RuntimeError("Traceback of the worker:\n"
+                                          + remote_traceback)
+        self.num_steps += num_steps
+        return self.s
+
+    run = DiffusionSolver.run
+
+    def close(self):
+        self._buffers = []
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == "__main__":
+    D = 0.5
+    delta_t = 0.1
+
+    # Bitwise identical to the serial solver
+    s_0 = 0.2*np.ones((300, 200))
+    serial = DiffusionSolver(s_0, D, delta_t).step(500)
+    for n_workers in [1, 3, 7]:
+        with ParallelDiffusionSolver(s_0, D, delta_t,
+                                     n_workers=n_workers) as solver:
+            print(f"{n_workers} worker(s), bitwise identical: "
+                  f"{np.array_equal(solver.step(500), serial)}")
+
+    # Strong scaling (fixed grid) and weak scaling (fixed strip per worker)
+    n_cores = mp.cpu_count()
+    workers = sorted({1, 2, 4, 8, 16, 32, 64, n_cores} & set(range(1, n_cores+1)))
+    n = 2048
+    serial = steps_per_second(DiffusionSolver(0.2*np.ones((n, n)), D,
+                                              delta_t).step, 20)
+    print(f"Serial {n}x{n}: {serial:.3g} steps/s")
+    for n_workers in workers:
+        with ParallelDiffusionSolver(0.2*np.ones((n, n)), D, delta_t,
+                                     n_workers=n_workers) as solver:
+            rate = steps_per_second(solver.step, 20)
+        print(f"Strong scaling, {n_workers} worker(s), {n}x{n}: "
+              f"{rate:.3g} steps/s (speed-up {rate/serial:.2f})")
+    rows = 512
+    for n_workers in workers:
+        with ParallelDiffusionSolver(0.2*np.ones((rows*n_workers, n)), D,
+                                     delta_t, n_workers=n_workers) as solver:
+            start = time.perf_counter()
+            solver.step(20)
+            elapsed = time.perf_counter() - start
+        print(f"Weak scaling, {n_workers} worker(s), {rows*n_workers}x{n}: "
+              f"{20/elapsed:.3g} steps/s, "
+              f"{20*rows*n_workers*n/elapsed/1e6:.3g} Mcells/s")
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Figures of the command line experiments (__main__.py), drawn on
+matplotlib.figure.Figure without pyplot (no GUI backend needed).
+matplotlib is only imported when this module is. The snapshots are
+rendered by render_snapshots of snapshots.py.
+"""
+import numpy as np
+from matplotlib.figure import Figure
+
+
+def plot_field(path, s, title=None, vmin=0, vmax=1):
+    fig = Figure(figsize=(6, 5))
+    ax = fig.subplots()
+    image = ax.imshow(s, vmin=vmin, vmax=vmax)
+    fig.colorbar(image, ax=ax)
+    if title is not None:
+        ax.set_title(title)
+    fig.tight_layout()
+    fig.savefig(path)
+    return fig
+
+def plot_residuals(path, norms, title=None):
+    # Residual norm after each iteration (multigrid.steady_state)
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    ax.semilogy(np.arange(len(norms)), norms, "o-")
+    ax.set_xlabel("Iteration")
+    ax.set_ylabel(r"max $|\Delta s|$")
+    if title is not None:
+        ax.set_title(title)
+    fig.tight_layout()
+    fig.savefig(path)
+    return fig
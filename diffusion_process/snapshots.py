@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshots of the diffusion fields: the raw values are handed to a
+background thread through a bounded queue (the solver only pays for a copy
+of the field) and stored in a directory as a time series indexed by the
+exact step number:
+
+    - chunk_00000.npy, chunk_00001.npy, ...: chunk_size frames each
+      (memory-mappable), or chunk_00000.npz, ... if compressed
+    - steps.npy: step number of each frame, written empty when the writer
+      opens and rewritten after each chunk so that it always describes the
+      chunks on disk (also if the writer stops early)
+
+Rendering them (PNG, GIF) is a separate offline pass (render_snapshots).
+"""
+import os
+import queue
+import threading
+import numpy as np
+
+
+class SnapshotWriter:
+    # Usage:
+    #     with SnapshotWriter(path, chunk_size=16) as writer:
+    #         ... writer.write(step, s) ...
+    # write blocks only if queue_size frames are waiting (the disk can't
+    # keep up with the solver).
+    def __init__(self, path, chunk_size=16, compress=False, dtype=None,
+                 queue_size=8):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.dtype = dtype
+        self.steps = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._write_steps()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, step, s):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((step, np.array(s, dtype=self.dtype, copy=True)))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        frames = []
+        n_chunks = 0
+        while True:
+            item = self._queue.get()
+            if self._error is not None:
+                if item is None:
+                    return
+                continue  # drain the queue so that writers never block
+            try:
+                if item is None or len(frames) == self.chunk_size:
+                    if frames:
+                        self._write_chunk(n_chunks, np.stack(frames))
+                        n_chunks += 1
+                        frames = []
+                        self._write_steps()
+                    if item is None:
+                        return
+                step, s = item
+                frames.append(s)
+                self.steps.append(step)
+            except Exception as error:
+                self._error = error
+                if item is None:
+                    return
+
+    def _write_steps(self):
+        # Replaced atomically: a reader never sees a partial file
+        name = os.path.join(self.path, "steps")
+        np.save(name + ".tmp.npy", np.array(self.steps, dtype=np.int64))
+        os.replace(name + ".tmp.npy", name + ".npy")
+
+    def _write_chunk(self, k, frames):
+        name = os.path.join(self.path, f"chunk_{k:05d}")
+        if self.compress:
+            np.savez_compressed(name + ".npz", frames=frames)
+        else:
+            np.save(name + ".npy", frames)
+
+
+class SnapshotReader:
+    # reader[step]: frame of this step, reader.frames(): (step, frame) in
+    # order. Uncompressed chunks are memory-mapped (only the frames read are
+    # loaded).
+    def __init__(self, path):
+        self.path = path
+        self.steps = np.load(os.path.join(path, "steps.npy"))
+        self.compress = os.path.exists(os.path.join(path, "chunk_00000.npz"))
+        first = self._chunk(0) if len(self.steps) else None
+        self.chunk_size = 0 if first is None else len(first)
+        self._cache = (0, first)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def _chunk(self, k):
+        name = os.path.join(self.path, f"chunk_{k:05d}")
+        if self.compress:
+            with np.load(name + ".npz") as data:
+                return data["frames"]
+        return np.load(name + ".npy", mmap_mode="r")
+
+    def frame(self, i):
+        # i-th frame (in the order of writing)
+        k, j = divmod(i, self.chunk_size)
+        if self._cache[0] != k:
+            self._cache = (k, self._chunk(k))
+        return self._cache[1][j]
+
+    def __getitem__(self, step):
+        i = np.searchsorted(self.steps, step)
+        if i == len(self.steps) or self.steps[i] != step:
+            raise KeyError(f"No snapshot at step {step}")
+        return self.frame(i)
+
+    def frames(self):
+        for i, step in enumerate(self.steps):
+            yield step, self.frame(i)
+
+
+def render_snapshots(path, image_dir, every=1, gif=None, duration=100,
+                     cmap=None, vmin=None, vmax=None):
+    # Offline rendering of the snapshots in path: one PNG per frame
+    # (diffusion_step{step}.png, one frame out of every) and optionally an
+    # animated GIF. Without vmin/vmax, the colors of all the frames use the
+    # same range (the one of the first frame).
+    from contextlib import ExitStack
+    from matplotlib.image import imsave
+    reader = SnapshotReader(path)
+    if len(reader) == 0:
+        return []
+    first = np.asarray(reader.frame(0))
+    vmin = np.min(first) if vmin is None else vmin
+    vmax = np.max(first) if vmax is None else vmax
+    os.makedirs(image_dir, exist_ok=True)
+    filenames = []
+    for i in range(0, len(reader), every):
+        filename = os.path.join(image_dir,
+                                f"diffusion_step{reader.steps[i]}.png")
+        imsave(filename, reader.frame(i), cmap=cmap, vmin=vmin, vmax=vmax)
+        filenames.append(filename)
+    if gif is not None:
+        from PIL import Image
+        with ExitStack() as stack:
+            images = [stack.enter_context(Image.open(filename))
+                      for filename in filenames]
+            images[0].save(gif, save_all=True, append_images=images[1:],
+                           duration=duration, loop=0)
+    return filenames
+
+
+if __name__ == "__main__":
+    # Throughput of the solver with and without snapshots
+    import time
+    import tempfile
+    from .diffusion import DiffusionSolver
+
+    n = 512
+    num_steps = 5000
+    every = 500  # as in spatio_temporal_diffusion_process_euler_method.py
+    s_0 = 0.2*np.ones((n, n))
+    for compress in [None, False, True]:
+        solver = DiffusionSolver(s_0, 0.5, 0.1)
+        with tempfile.TemporaryDirectory() as path:
+            start = time.perf_counter()
+            if compress is None:
+                solver.step(num_steps)
+            else:
+                with SnapshotWriter(path, compress=compress) as writer:
+                    for k in range(num_steps//every):
+                        writer.write(solver.num_steps, solver.s)
+                        solver.step(every)
+                    writer.write(solver.num_steps, solver.s)
+            elapsed = time.perf_counter() - start
+            label = ("no snapshots" if compress is None else
+                     f"snapshots every {every} steps"
+                     + (" (compressed)" if compress else ""))
+            print(f"{n}x{n}, {label}: {num_steps/elapsed:.4g} steps/s")
+            if compress is not None:
+                reader = SnapshotReader(path)
+                size = sum(os.path.getsize(os.path.join(path, filename))
+                           for filename in os.listdir(path))
+                print(f"  {len(reader)} frames ({size/2**20:.1f} MiB), "
+                      f"step {num_steps} identical: "
+                      f"{np.array_equal(reader[num_steps], solver.s)}")
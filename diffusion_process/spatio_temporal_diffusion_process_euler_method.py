@@ -5,7 +5,6 @@ Created on Fri Apr 14 16:44:28 2023
 @author: steph
 """
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 def apply_boundary_cond(s):
@@ -14,8 +13,29 @@ def apply_boundary_cond(s):
 
     s[:, -1] = 0
     s[0, :] = 0
+
+def euler_step(s, D, delta_t, delta_x):
+    # One forward Euler step of ds/dt = D*laplacian(s) (finite differences,
+    # periodic neighbours through np.roll), boundaries applied afterwards
+    s_up = np.roll(s, -1, axis=0)
+    s_down = np.roll(s, 1, axis=0)
+    s_left = np.roll(s, -1, axis=1)
+    s_right = np.roll(s, 1, axis=1)
+    
+    pdv_2_x = 1/delta_x**2*(s_right - 2*s + s_left)
+    pdv_2_y = 1/delta_x**2*(s_down - 2*s + s_up)
+    new_s = s + delta_t*D*(pdv_2_x + pdv_2_y)
+    apply_boundary_cond(new_s)
+    return new_s
     
 if __name__ == "__main__":
+    import os
+    import tempfile
+    # ./images in this directory, the raw snapshots in a temporary one
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    from .snapshots import SnapshotWriter, render_snapshots
+    snapshots = tempfile.TemporaryDirectory()
+    
     # Eulerian approach for the spatial component
     delta_x = 1
     delta_t = 0.1
@@ -28,19 +48,17 @@ if __name__ == "__main__":
     
     t = 0
     num_s = 0
-    while t < tmax:
-        s_up = np.roll(s, -1, axis=0)
-        s_down = np.roll(s, 1, axis=0)
-        s_left = np.roll(s, -1, axis=1)
-        s_right = np.roll(s, 1, axis=1)
-        
-        pdv_2_x = 1/delta_x**2*(s_right - 2*s + s_left)
-        pdv_2_y = 1/delta_x**2*(s_down - 2*s + s_up)
-        new_s = s + delta_t*D*(pdv_2_x + pdv_2_y)
-        apply_boundary_cond(new_s)
-        s = new_s
-        
-        if num_s % 500 == 0:
-            plt.imsave(f"./images/diffusion_t{t}.png", s)
-        num_s += 1
-        t += delta_t
\ No newline at end of file
+    # Raw fields written by a background thread, indexed by step number
+    with SnapshotWriter(snapshots.name) as writer:
+        while t < tmax:
+            s = euler_step(s, D, delta_t, delta_x)
+            num_s += 1
+            
+            if num_s % 500 == 1:
+                writer.write(num_s, s)
+            t += delta_t
+    
+    # Rendering afterwards
+    render_snapshots(snapshots.name, "./images", vmin=0, vmax=1,
+                     gif="./images/diffusion.gif")
+    snapshots.cleanup()
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+Iterative maps (linear and logistic): cobwebs, bifurcation diagrams and
+orbit statistics, see iterative_maps.py.
+
+Importing the package or its modules only needs numpy: the drawing
+functions (iterative_map, draw_cobweb, save_cobwebs) and plotting.py import
+matplotlib when called. Experiments run headless from the command line, see
+__main__.py:
+
+    python -m iterative_maps lyapunov --num 10000 --output-dir results/maps
+"""
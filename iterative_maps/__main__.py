@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Headless experiments of the iterative maps.
+
+    python -m iterative_maps cobweb --map logistic --gamma 3.1 3.5 3.9 \
+        --tmax 100 --output-dir results/cobweb --plot
+    python -m iterative_maps lyapunov --gamma-min 2.4 --gamma-max 4 \
+        --num 1000000 --workers 8 --output-dir results/lyapunov
+
+Each experiment writes its arrays (.npz, or .npy for the orbit statistics)
+and {experiment}.json (parameters and summary) in the output directory,
+plus {experiment}.png with --plot (the only case where matplotlib is
+imported). Without --s0, the initial state is drawn uniformly in (0, 1)
+from the seed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+
+def _save(args, summary, **arrays):
+    name = os.path.join(args.output_dir, args.experiment)
+    if arrays:
+        np.savez(name + ".npz", **arrays)
+    parameters = {key: value for key, value in vars(args).items()
+                  if key not in ("run", "output_dir", "plot")}
+    with open(name + ".json", "w") as file:
+        json.dump({"parameters": parameters, "summary": summary}, file,
+                  indent=2)
+    return name
+
+def _maps():
+    from .iterative_maps import F_linear, F_logistic, dF_linear, dF_logistic
+    return {"linear": (F_linear, dF_linear),
+            "logistic": (F_logistic, dF_logistic)}
+
+def _cobweb(args):
+    from .iterative_maps import cobweb, save_cobwebs
+    F, _ = _maps()[args.map]
+    states = np.array([cobweb(args.s0, args.tmax, F, gamma=gamma)[0]
+                       for gamma in args.gamma])
+    summary = {"final_states": states[:, -1].tolist()}
+    name = _save(args, summary, gammas=np.array(args.gamma), states=states)
+    if args.plot:
+        save_cobwebs(name + ".png", args.s0, args.tmax, F,
+                     [{"gamma": gamma} for gamma in args.gamma],
+                     ncols=min(len(args.gamma), 2),
+                     titles=[fr"$\gamma$={gamma}" for gamma in args.gamma])
+    return summary
+
+def _lyapunov(args):
+    from .iterative_maps import orbit_statistics_grid
+    F, dF = _maps()[args.map]
+    gammas = np.linspace(args.gamma_min, args.gamma_max, args.num)
+    start = time.perf_counter()
+    stats = orbit_statistics_grid(os.path.join(args.output_dir,
+                                               "lyapunov.npy"),
+                                  args.s0, gammas, F, dF=dF,
+                                  chunk_size=args.chunk_size,
+                                  n_workers=args.workers,
+                                  n_transient=args.n_transient,
+                                  n_iter=args.n_iter)
+    elapsed = time.perf_counter() - start
+    summary = {"fraction_chaotic": np.mean(stats["period"] == 0),
+               "fraction_diverging": np.mean(stats["period"] == -1),
+               "max_lyapunov": np.max(stats["lyapunov"]),
+               "gammas_per_s": args.num/elapsed}
+    name = _save(args, summary)
+    if args.plot:
+        from .plotting import plot_orbit_statistics
+        plot_orbit_statistics(name + ".png", stats,
+                              title=f"{args.map} map, $s_0$={args.s0:.3g}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m iterative_maps",
+                                     description=__doc__.split("\n\n")[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--seed", type=int, default=0,
+                        help="seed of the initial state (without --s0)")
+    common.add_argument("--output-dir", default=".")
+    common.add_argument("--plot", action="store_true",
+                        help="also save a figure (imports matplotlib)")
+    common.add_argument("--map", choices=["linear", "logistic"],
+                        default="logistic")
+    common.add_argument("--s0", type=float, default=None)
+    experiments = parser.add_subparsers(dest="experiment", required=True)
+
+    cobweb = experiments.add_parser("cobweb", parents=[common],
+                                    help="orbits (and cobwebs) for a few "
+                                         "gammas")
+    cobweb.add_argument("--gamma", type=float, nargs="+",
+                        default=[3.1, 3.4, 3.5, 3.9])
+    cobweb.add_argument("--tmax", type=int, default=10)
+    cobweb.set_defaults(run=_cobweb)
+
+    lyapunov = experiments.add_parser("lyapunov", parents=[common],
+                                      help="Lyapunov exponent, period and "
+                                           "bounds of the attractor on a "
+                                           "grid of gammas")
+    lyapunov.add_argument("--gamma-min", type=float, default=2.4)
+    lyapunov.add_argument("--gamma-max", type=float, default=4.0)
+    lyapunov.add_argument("--num", type=int, default=10000)
+    lyapunov.add_argument("--n-transient", type=int, default=1000)
+    lyapunov.add_argument("--n-iter", type=int, default=1000)
+    lyapunov.add_argument("--chunk-size", type=int, default=100000)
+    lyapunov.add_argument("--workers", type=int, default=None,
+                          help="worker processes (default: one per core)")
+    lyapunov.set_defaults(run=_lyapunov)
+
+    args = parser.parse_args(argv)
+    if args.s0 is None:
+        args.s0 = np.random.default_rng(args.seed).uniform()
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary = args.run(args)
+    print(", ".join(f"{key}={value:.6g}" if isinstance(value, float)
+                    else f"{key}={value}" for key, value in summary.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
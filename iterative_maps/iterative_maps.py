@@ -16,35 +16,113 @@ a fixed point, limit cycle or chaos:
         - Chaos (impredictibility and sensitive to initial cond.)
 """
 import numpy as np
-import matplotlib.pyplot as plt
 
 
-def iterative_map(s_0, tmax, F, **kwargs):
-    xs = np.linspace(0, 1, 100)
-    # Plot the function F:
-    plt.plot(xs, F(xs, **kwargs))
-    # Plotting y=x
-    plt.plot(xs, xs, "k", linestyle='--')
-    
+def cobweb(s_0, tmax, F, **kwargs):
+    # Orbit s_0, ..., s_{tmax+1} (one evaluation of F per step) and the
+    # (2*tmax+2, 2) vertices of the cobweb polyline: from (s_0, 0) up to
+    # (s_0, s_1), then horizontally to y=x at (s_1, s_1), vertically to
+    # (s_1, s_2), and so on.
     s_t = s_0
     states = [s_0]
-    plt.plot(s_0, 0, 'ro', label="start")
-    
-    plt.plot([s_0, s_0], [0, F(s_0, **kwargs)],
-             "r")
-    
-    for i in range(tmax):
+    for t in range(tmax+1):
         s_t = F(s_t, **kwargs)
         states.append(s_t)
-        
-        # Plotting the point
-        plt.plot(s_t, F(s_t, **kwargs), "r.")
-        
-        # Horizontal, go to y=x
-        plt.plot([states[i], s_t], [s_t, s_t], "r")
-        # Vertical
-        plt.plot([s_t, s_t], [s_t, F(s_t, **kwargs)], "r")
-    plt.axis("equal")
+    states = np.array(states, dtype=float)
+    vertices = np.empty((2*tmax+2, 2))
+    vertices[:, 0] = np.repeat(states[:-1], 2)
+    vertices[0, 1] = 0
+    vertices[1:, 1] = np.repeat(states[1:], 2)[:-1]
+    return states, vertices
+
+def _unique_rows(rows, resolution):
+    # Distinct rows once rounded to resolution. Each row is encoded as a
+    # single integer when possible and the distinct integers are marked in
+    # a boolean table when it is small enough (no sort at all), else
+    # sorted (much faster than np.unique(axis=0))
+    rounded = np.round(rows/resolution)
+    rounded = rounded[np.isfinite(rounded).all(axis=1)]
+    if len(rounded) == 0:
+        return rounded
+    low = rounded.min(axis=0)
+    span = int(np.max(rounded - low)) + 1
+    if span**rows.shape[1] >= 2**62:
+        return np.unique(rounded, axis=0)*resolution
+    digits = (rounded - low).astype(np.int64)
+    keys = np.zeros(len(digits), dtype=np.int64)
+    for j in range(rows.shape[1]):
+        keys = keys*span + digits[:, j]
+    if span**rows.shape[1] > max(2**20, 8*len(keys)):
+        _, first = np.unique(keys, return_index=True)
+        return rounded[first]*resolution
+    seen = np.zeros(span**rows.shape[1], dtype=bool)
+    seen[keys] = True
+    keys = np.flatnonzero(seen)
+    digits = np.empty((len(keys), rows.shape[1]))
+    for j in reversed(range(rows.shape[1])):
+        keys, digits[:, j] = np.divmod(keys, span)
+    return (digits + low)*resolution
+
+def draw_cobweb(ax, states, vertices, F=None, color="r", resolution=1e-3,
+                **kwargs):
+    # Draws a cobweb (see cobweb) on ax with a constant number of artists: a
+    # single LineCollection for all the segments and a single line for all
+    # the points. Segments and points are rounded to resolution (well below
+    # a pixel) and duplicates are drawn once: since s_{t+1} = F(s_t), there
+    # are at most ~1/resolution distinct ones whatever the length of the
+    # orbit, so the drawing time doesn't grow with it (resolution=None draws
+    # them all exactly). Each point (a, b) = (s_t, s_{t+1}) with
+    # 0 < t < tmax is the end of the vertical segment (a, a)-(a, b) and the
+    # start of the horizontal one (a, b)-(b, b), so only the points are
+    # deduplicated and both segments are drawn from the distinct ones (plus
+    # the first two segments and the last one).
+    # F(x, **kwargs) and y=x are drawn on [0, 1] if F is given.
+    from matplotlib.collections import LineCollection
+    if F is not None:
+        xs = np.linspace(0, 1, 100)
+        ax.plot(xs, F(xs, **kwargs))
+        ax.plot(xs, xs, "k", linestyle='--')
+    segments = np.stack([vertices[:-1], vertices[1:]], axis=1)
+    # Points (s_t, F(s_t)) after the start
+    points = np.stack([states[1:-1], states[2:]], axis=1)
+    if resolution is not None:
+        inner = _unique_rows(points[:-1], resolution)
+        a, b = inner[:, 0], inner[:, 1]
+        segments = np.concatenate([
+            segments[:2], segments[-1:],
+            np.stack([np.stack([a, a], axis=1), inner], axis=1),
+            np.stack([inner, np.stack([b, b], axis=1)], axis=1)])
+        points = np.concatenate([inner, points[-1:]])
+    ax.plot(states[0], 0, 'o', color=color, label="start")
+    ax.add_collection(LineCollection(segments, colors=color))
+    ax.plot(points[:, 0], points[:, 1], ".", color=color)
+    ax.autoscale_view()
+    ax.axis("equal")
+
+def iterative_map(s_0, tmax, F, **kwargs):
+    # Cobweb of the map on the current axes
+    import matplotlib.pyplot as plt
+    states, vertices = cobweb(s_0, tmax, F, **kwargs)
+    draw_cobweb(plt.gca(), states, vertices, F, **kwargs)
+
+def save_cobwebs(path, s_0, tmax, F, params, ncols=2, titles=None):
+    # Grid of cobwebs (one per dict of kwargs of F in params) saved without
+    # pyplot (no GUI backend needed, the figure isn't kept by pyplot): for
+    # batch exports
+    from matplotlib.figure import Figure
+    nrows = -(-len(params)//ncols)
+    fig = Figure(figsize=(4*ncols, 4*nrows))
+    axs = fig.subplots(nrows, ncols, squeeze=False).ravel()
+    for i, kwargs in enumerate(params):
+        states, vertices = cobweb(s_0, tmax, F, **kwargs)
+        draw_cobweb(axs[i], states, vertices, F, **kwargs)
+        if titles is not None:
+            axs[i].set_title(titles[i])
+    for ax in axs[len(params):]:
+        ax.set_axis_off()
+    fig.tight_layout()
+    fig.savefig(path)
+    return fig
     
     
 def iterate(s_0, tmax, F, **kwargs):
@@ -62,13 +140,160 @@ def iterate(s_0, tmax, F, **kwargs):
         
     return bifurcations_xs
     
+def bifurcation_diagram(s_0, gammas, F, n_transient=1000, n_keep=256,
+                        tol=1e-6, max_period=64):
+    # Same idea as iterate but for a whole grid of gammas at once: all the
+    # orbits are iterated together (one numpy array), the first n_transient
+    # states are discarded and only the last n_keep ones are kept.
+    # The period of each gamma is the smallest shift under which this tail
+    # matches itself within tol, and the attractor points are its last
+    # period states (see attractor): linear in the number of iterations
+    # instead of comparing each state with the whole history.
+    # Orbits without a period up to max_period are considered chaotic
+    # (period 0) and all their n_keep points are returned, diverging orbits
+    # have a period -1 and no points.
+    #
+    # Returns flat arrays (gamma, x) of the attractor points and the period
+    # of each gamma.
+    gammas = np.asarray(gammas, dtype=float)
+    s_t = np.full(gammas.shape, s_0, dtype=float)
+    tail = np.empty((len(gammas), n_keep))
+    with np.errstate(over="ignore", invalid="ignore"):
+        for t in range(n_transient):
+            s_t = F(s_t, gamma=gammas)
+        for t in range(n_keep):
+            s_t = F(s_t, gamma=gammas)
+            tail[:, t] = s_t
+    
+    tail, new_value, periods = attractor(tail, tol, max_period)
+    rows, cols = np.nonzero(new_value)
+    return gammas[rows], tail[rows, cols], periods
+
+def attractor(tail, tol=1e-6, max_period=64):
+    # Period of each of the (G, n_keep) tails: smallest p such that the
+    # tail matches itself shifted by p, |x_{t+p} - x_t| <= tol*(1 + |x_t|)
+    # for all t (no rounding, so values close to a rounding boundary don't
+    # count twice). 0 if chaotic (no period up to max_period), -1 if
+    # diverging. Only the rows whose last state comes back within tol after
+    # p steps are compared for each p.
+    # Returns the tails, the mask of the attractor points (last period
+    # states of each row, all the states of chaotic rows) and the periods.
+    n_keep = tail.shape[1]
+    periods = np.zeros(len(tail), dtype=int)
+    undecided = np.all(np.isfinite(tail), axis=1)
+    periods[~undecided] = -1
+    scale = tol*(1 + np.abs(tail))
+    with np.errstate(invalid="ignore"):
+        for p in range(1, min(max_period, n_keep - 1) + 1):
+            rows = np.flatnonzero(undecided
+                                  & (np.abs(tail[:, -1-p] - tail[:, -1])
+                                     <= scale[:, -1-p]))
+            match = np.all(np.abs(tail[rows, p:] - tail[rows, :-p])
+                           <= scale[rows, :-p], axis=1)
+            periods[rows[match]] = p
+            undecided[rows[match]] = False
+    new_value = np.arange(n_keep) >= n_keep - periods[:, None]
+    new_value[periods == 0] = True
+    return tail, new_value, periods
+
+ORBIT_DTYPE = np.dtype([("gamma", float), ("lyapunov", float),
+                        ("period", np.int32), ("x_min", float),
+                        ("x_max", float)])
+
+def orbit_statistics(s_0, gammas, F, dF=None, n_transient=1000, n_iter=1000,
+                     n_keep=256, tol=1e-6, max_period=64):
+    # For each gamma (vectorized over the whole grid):
+    #   - Lyapunov exponent: mean of log|F'(s_t)| along the orbit (after
+    #     the transient), < 0 for fixed points/limit cycles, > 0 for chaos.
+    #     dF is the derivative of F (central finite differences if None).
+    #     |F'| is clamped to the smallest positive float, so that a
+    #     superstable orbit (F' = 0 on the orbit, e.g. gamma = 2 for the
+    #     logistic map) has a large negative exponent instead of -inf
+    #   - period of the attractor (see attractor) on the last n_keep states
+    #   - bounds of the attractor
+    # Returns a structured array (ORBIT_DTYPE).
+    gammas = np.asarray(gammas, dtype=float)
+    if dF is None:
+        def dF(s_t, **kwargs):
+            h = 1e-7*(1 + np.abs(s_t))
+            return (F(s_t + h, **kwargs) - F(s_t - h, **kwargs))/(2*h)
+    s_t = np.full(gammas.shape, s_0, dtype=float)
+    log_dF = np.zeros(gammas.shape)
+    tiny = np.finfo(float).tiny
+    x_min = np.full(gammas.shape, np.inf)
+    x_max = np.full(gammas.shape, -np.inf)
+    tail = np.empty((len(gammas), min(n_keep, n_iter)))
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for t in range(n_transient):
+            s_t = F(s_t, gamma=gammas)
+        for t in range(n_iter):
+            log_dF += np.log(np.maximum(np.abs(dF(s_t, gamma=gammas)), tiny))
+            s_t = F(s_t, gamma=gammas)
+            np.minimum(x_min, s_t, out=x_min)
+            np.maximum(x_max, s_t, out=x_max)
+            if t >= n_iter - tail.shape[1]:
+                tail[:, t - n_iter + tail.shape[1]] = s_t
+    
+    stats = np.empty(gammas.shape, dtype=ORBIT_DTYPE)
+    stats["gamma"] = gammas
+    stats["lyapunov"] = log_dF/n_iter
+    stats["period"] = attractor(tail, tol, max_period)[2]
+    stats["x_min"] = x_min
+    stats["x_max"] = x_max
+    return stats
+
+def _orbit_statistics_chunk(path, start, stop, args, kwargs):
+    # Computes the statistics of gammas[start:stop] and writes them in the
+    # .npy file (each worker writes its own slice)
+    out = np.load(path, mmap_mode="r+")
+    out[start:stop] = orbit_statistics(args[0], out["gamma"][start:stop],
+                                       *args[1:], **kwargs)
+    out.flush()
+
+def orbit_statistics_grid(path, s_0, gammas, F, dF=None, chunk_size=100000,
+                          n_workers=None, **kwargs):
+    # orbit_statistics on a large grid of gammas (millions), chunk by chunk
+    # on a pool of processes (F and dF must be picklable, e.g. F_logistic
+    # and dF_logistic), the results going directly in a memory-mapped .npy
+    # file. The diagram can then be re-rendered from
+    # np.load(path, mmap_mode="r") without recomputation.
+    from concurrent.futures import ProcessPoolExecutor
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=ORBIT_DTYPE,
+                                    shape=(len(gammas), ))
+    out["gamma"] = gammas
+    out.flush()
+    del out
+    chunks = [(start, min(start + chunk_size, len(gammas)))
+              for start in range(0, len(gammas), chunk_size)]
+    if n_workers == 1:
+        for start, stop in chunks:
+            _orbit_statistics_chunk(path, start, stop, (s_0, F, dF), kwargs)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [pool.submit(_orbit_statistics_chunk, path, start, stop,
+                                   (s_0, F, dF), kwargs)
+                       for start, stop in chunks]
+            for future in futures:
+                future.result()
+    return np.load(path, mmap_mode="r")
+
 def F_linear(s_t, **kwargs):
     return kwargs["gamma"]*s_t
 
 def F_logistic(s_t, **kwargs):
     return kwargs["gamma"]*s_t*(1-s_t)
 
+def dF_linear(s_t, **kwargs):
+    return kwargs["gamma"]*np.ones_like(s_t)
+
+def dF_logistic(s_t, **kwargs):
+    return kwargs["gamma"]*(1-2*s_t)
+
 if __name__ == "__main__":
+    import os
+    # ./images next to this file
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    import matplotlib.pyplot as plt
     tmax = 10
     s_0 = 0.45
     fig, axs = plt.subplots(2, 2)
@@ -101,4 +326,37 @@ if __name__ == "__main__":
             plt.plot(gamma, x, '.')
     plt.title("My bifurcation diagram")
     plt.xlabel(r"$\gamma$")
-    plt.ylabel(r"$x$")
\ No newline at end of file
+    plt.ylabel(r"$x$")
+    
+    # Same on a much finer grid: all the gammas are iterated at once and
+    # the points are drawn with a single call
+    gammas, xs, periods = bifurcation_diagram(s_0, np.linspace(2.4, 4, 10000),
+                                              F_logistic)
+    plt.figure()
+    plt.plot(gammas, xs, ",k", alpha=0.5)
+    plt.title("Bifurcation diagram of the logistic map")
+    plt.xlabel(r"$\gamma$")
+    plt.ylabel(r"$x$")
+    
+    # Lyapunov exponents (< 0: fixed point or limit cycle, > 0: chaos),
+    # the memory-mapped statistics in a temporary directory
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        stats = np.array(orbit_statistics_grid(
+            os.path.join(directory, "logistic_orbits.npy"), s_0,
+            np.linspace(2.4, 4, 10000), F_logistic, dF=dF_logistic))
+    plt.figure()
+    plt.plot(stats["gamma"], stats["lyapunov"], "k", linewidth=0.5)
+    plt.axhline(0, color="r", linestyle="--")
+    plt.title("Lyapunov exponent of the logistic map")
+    plt.xlabel(r"$\gamma$")
+    plt.ylabel(r"$\lambda$")
+    
+    # Drawing time of a cobweb vs its length (headless export)
+    import time
+    with tempfile.TemporaryDirectory() as directory:
+        for tmax in [10, 10**5]:
+            start = time.perf_counter()
+            save_cobwebs(f"{directory}/cobwebs.png", s_0, tmax, F_logistic,
+                         [{"gamma": gamma} for gamma in [3.1, 3.4, 3.5, 3.9]])
+            print(f"{tmax} steps: {time.perf_counter()-start:.2f} s")
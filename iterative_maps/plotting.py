@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Figures of the command line experiments (__main__.py), drawn on
+matplotlib.figure.Figure without pyplot (no GUI backend needed).
+matplotlib is only imported when this module is. Cobwebs are drawn by
+save_cobwebs of iterative_maps.py.
+"""
+import numpy as np
+from matplotlib.figure import Figure
+
+
+def plot_orbit_statistics(path, stats, title=None):
+    # Attractor bounds (envelope of the bifurcation diagram) and Lyapunov
+    # exponent of each gamma (structured array of orbit_statistics)
+    fig = Figure(figsize=(8, 8))
+    axs = fig.subplots(2, 1, sharex=True)
+    finite = stats["period"] >= 0
+    axs[0].fill_between(stats["gamma"][finite], stats["x_min"][finite],
+                        stats["x_max"][finite], color="k", alpha=0.5,
+                        linewidth=0)
+    axs[0].set_ylabel(r"$x$")
+    axs[1].plot(stats["gamma"], np.clip(stats["lyapunov"], -5, None), "k",
+                linewidth=0.5)
+    axs[1].axhline(0, color="r", linestyle="--")
+    axs[1].set_xlabel(r"$\gamma$")
+    axs[1].set_ylabel(r"$\lambda$")
+    if title is not None:
+        fig.suptitle(title)
+    fig.tight_layout()
+    fig.savefig(path)
+    return fig
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo methods: MCMC (mcmc, multivariate_mcmc), Ising model
+(ising_model, ising_cluster, parallel_tempering), importance sampling
+(importance_sampling, streaming_importance_sampling,
+adaptive_importance_sampling, qmc), resampling and recording.
+
+Importing the package or its modules only needs numpy: figures are made by
+the __main__ demos and by plotting.py, which import matplotlib when called.
+Experiments run headless from the command line, see __main__.py:
+
+    python -m monte_carlo_methods ising --n 32 --temperature 1.5 \
+        --seed 0 --output-dir results/ising
+"""
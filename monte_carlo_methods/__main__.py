@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Headless experiments of the Monte Carlo methods.
+
+    python -m monte_carlo_methods mcmc --sigma 2 --steps 100000 \
+        --seed 0 --output-dir results/mcmc
+    python -m monte_carlo_methods ising --n 32 --temperature 1.5 \
+        --update wolff --sweeps 1000 --output-dir results/ising --plot
+    python -m monte_carlo_methods importance-sampling --rtol 1e-3 \
+        --output-dir results/is
+
+Each experiment writes {experiment}.npz (arrays) and {experiment}.json
+(parameters and summary) in the output directory, plus {experiment}.png
+with --plot (the only case where matplotlib is imported).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+
+def _save(args, summary, **arrays):
+    name = os.path.join(args.output_dir, args.experiment)
+    if arrays:
+        np.savez(name + ".npz", **arrays)
+    parameters = {key: value for key, value in vars(args).items()
+                  if key not in ("run", "output_dir", "plot")}
+    with open(name + ".json", "w") as file:
+        json.dump({"parameters": parameters, "summary": summary}, file,
+                  indent=2)
+    return name
+
+def _mcmc(args):
+    from .mcmc import mcmc
+    rng = np.random.default_rng(args.seed)
+    log_f = lambda x: -(x - args.mu)**2/(2*args.sigma**2)
+    sample_candidate = lambda x: rng.normal(x, args.proposal_std)
+    start = time.perf_counter()
+    samples, logs = mcmc(log_f, args.mu, tmax=args.steps,
+                         burn_in=args.burn_in, log_density=True,
+                         return_logs=True, rng=rng,
+                         algorithm=("glauber" if args.algorithm == "glauber"
+                                    else "metropolis-hastings"),
+                         sample_candidate=sample_candidate,
+                         proposal_distr=lambda x_new, x: 1)
+    elapsed = time.perf_counter() - start
+    samples = np.array(samples)
+    summary = {"mean": samples.mean(), "variance": samples.var(),
+               "acceptance_rate": logs["acceptance_rate"],
+               "steps_per_s": args.steps/elapsed}
+    name = _save(args, summary, samples=samples)
+    if args.plot:
+        from .plotting import plot_samples
+        pdf = lambda x: (np.exp(-(x - args.mu)**2/(2*args.sigma**2))
+                         /np.sqrt(2*np.pi*args.sigma**2))
+        plot_samples(name + ".png", samples, pdf,
+                     title=f"{args.algorithm}, N({args.mu}, {args.sigma}$^2$)")
+    return summary
+
+def _ising(args):
+    from .ising_model import ising_mcmc, ising_checkerboard
+    from .ising_cluster import wolff, swendsen_wang
+    rng = np.random.default_rng(args.seed)
+    num_spins = args.n**2
+    s = 2*rng.integers(2, size=num_spins) - 1
+    start = time.perf_counter()
+    if args.update == "checkerboard":
+        s = s.reshape(args.n, args.n).astype(np.int8)
+        logs = ising_checkerboard(s, args.J, args.temperature, args.sweeps,
+                                  rng=rng)
+    elif args.update == "wolff":
+        logs = wolff(s, args.J, args.temperature, args.sweeps, rng=rng)
+    elif args.update == "swendsen-wang":
+        logs = swendsen_wang(s, args.J, args.temperature, args.sweeps, rng=rng)
+    else:
+        logs = ising_mcmc(s, args.J, args.temperature, args.sweeps,
+                          algorithm=args.update, rng=rng)
+    elapsed = time.perf_counter() - start
+    energies = np.asarray(logs["energies"], dtype=float)
+    magnetizations = np.asarray(logs["magnetizations"], dtype=float)
+    kept = slice(min(args.burn_in, len(energies)-1), None)
+    summary = {"mean_abs_magnetization":
+                   np.mean(np.abs(magnetizations[kept]))/num_spins,
+               "mean_energy": np.mean(energies[kept])/num_spins,
+               "updates_per_s": args.sweeps/elapsed}
+    lattice = s.reshape(args.n, args.n)
+    name = _save(args, summary, energies=energies,
+                 magnetizations=magnetizations, lattice=lattice)
+    if args.plot:
+        from .plotting import plot_ising
+        plot_ising(name + ".png", lattice, {"energies": energies,
+                                            "magnetizations": magnetizations},
+                   num_spins, title=f"{args.update}, $k_B T$={args.temperature}")
+    return summary
+
+def _importance_sampling(args):
+    # E_f[h] for f = Laplace(mu, b), g = N(0, 1), h(x) = 0.1*sin(x-1-(mu-2))
+    # as in importance_sampling.py
+    from .streaming_importance_sampling import iter_importance_sampling
+    log_f = lambda x: -np.log(2*args.b) - np.abs(x - args.mu)/args.b
+    log_g = lambda x: -0.5*np.log(2*np.pi) - x**2/2
+    sample_g = lambda rng, n: rng.normal(size=n)
+    h = lambda x: 0.1*np.sin(x - 1 - (args.mu - 2))
+    start = time.perf_counter()
+    results = list(iter_importance_sampling(log_f, log_g, sample_g, h,
+                                            chunk_size=args.chunk_size,
+                                            max_samples=args.max_samples,
+                                            rtol=args.rtol, seed=args.seed,
+                                            n_workers=args.workers))
+    elapsed = time.perf_counter() - start
+    summary = dict(results[-1], samples_per_s=results[-1]["n"]/elapsed)
+    name = _save(args, summary, **{key: np.array([r[key] for r in results])
+                                   for key in results[-1]})
+    if args.plot:
+        from .plotting import plot_convergence
+        plot_convergence(name + ".png", results)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m monte_carlo_methods",
+                                     description=__doc__.split("\n\n")[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--seed", type=int, default=0)
+    common.add_argument("--output-dir", default=".")
+    common.add_argument("--plot", action="store_true",
+                        help="also save a figure (imports matplotlib)")
+    experiments = parser.add_subparsers(dest="experiment", required=True)
+
+    mcmc = experiments.add_parser("mcmc", parents=[common],
+                                  help="random walk MCMC on N(mu, sigma^2)")
+    mcmc.add_argument("--algorithm", choices=["metropolis", "glauber"],
+                      default="metropolis")
+    mcmc.add_argument("--mu", type=float, default=0.0)
+    mcmc.add_argument("--sigma", type=float, default=1.0)
+    mcmc.add_argument("--proposal-std", type=float, default=2.4)
+    mcmc.add_argument("--steps", type=int, default=10**5)
+    mcmc.add_argument("--burn-in", type=int, default=None)
+    mcmc.set_defaults(run=_mcmc)
+
+    ising = experiments.add_parser("ising", parents=[common],
+                                   help="Ising model on an n x n lattice")
+    ising.add_argument("--update", default="glauber",
+                       choices=["glauber", "metropolis", "checkerboard",
+                                "wolff", "swendsen-wang"])
+    ising.add_argument("--n", type=int, default=32)
+    ising.add_argument("--J", type=float, default=1/4)
+    ising.add_argument("--temperature", type=float, default=1.5,
+                       help="k_B*T")
+    ising.add_argument("--sweeps", type=int, default=1000,
+                       help="number of sweeps (cluster updates for wolff)")
+    ising.add_argument("--burn-in", type=int, default=100,
+                       help="updates left out of the summary")
+    ising.set_defaults(run=_ising)
+
+    sampling = experiments.add_parser("importance-sampling", parents=[common],
+                                      help="streaming importance sampling of "
+                                           "E[h] under Laplace(mu, b)")
+    sampling.add_argument("--mu", type=float, default=1.5)
+    sampling.add_argument("--b", type=float, default=1.0)
+    sampling.add_argument("--chunk-size", type=int, default=10**6)
+    sampling.add_argument("--max-samples", type=int, default=10**7)
+    sampling.add_argument("--rtol", type=float, default=1e-2)
+    sampling.add_argument("--workers", type=int, default=1)
+    sampling.set_defaults(run=_importance_sampling)
+
+    args = parser.parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary = args.run(args)
+    print(", ".join(f"{key}={value:.6g}" if isinstance(value, float)
+                    else f"{key}={value}" for key, value in summary.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive importance sampling (population Monte Carlo / AMIS): instead of a
+fixed proposal g, the proposal is a mixture of Gaussians (or Student-t's)
+refitted after each round with weighted EM on the weighted samples drawn so
+far, so that it gets closer to the target and the importance weights less
+spread.
+
+All the past samples are reused with deterministic mixture weights: a sample
+x drawn at any round gets the weight
+
+    f(x)/(sum_t N_t q_t(x)/sum_t N_t)
+
+where q_t is the proposal of round t (N_t samples). Only the proposals are
+re-evaluated on the past samples, the target f is evaluated once per sample.
+"""
+from math import lgamma
+import numpy as np
+
+
+def log_component_pdfs(x, means, scales, dof=None):
+    # (n, K) log-densities of each component (Gaussian if dof is None,
+    # Student-t with dof degrees of freedom otherwise) at the samples x
+    z = (np.asarray(x)[:, None] - means)/scales
+    if dof is None:
+        return -0.5*z**2 - np.log(scales) - 0.5*np.log(2*np.pi)
+    log_c = (lgamma((dof+1)/2) - lgamma(dof/2) - 0.5*np.log(dof*np.pi))
+    return log_c - np.log(scales) - (dof+1)/2*np.log1p(z**2/dof)
+
+def mixture_logpdf(x, weights, means, scales, dof=None):
+    log_p = np.log(weights) + log_component_pdfs(x, means, scales, dof)
+    return np.logaddexp.reduce(log_p, axis=1)
+
+def mixture_sample(rng, n, weights, means, scales, dof=None):
+    k = rng.choice(len(weights), size=n, p=weights)
+    if dof is None:
+        z = rng.normal(size=n)
+    else:
+        z = rng.standard_t(dof, size=n)
+    return means[k] + scales[k]*z
+
+def weighted_em(x, log_w, weights, means, scales, dof=None, n_iter=5,
+                min_scale=1e-3):
+    # EM updates of the mixture fitted to the samples x weighted by
+    # exp(log_w) (weighted moments of each component given the
+    # responsibilities, and the latent scales of the Student-t's)
+    w = np.exp(log_w - np.max(log_w))
+    w /= w.sum()
+    for _ in range(n_iter):
+        log_r = np.log(weights) + log_component_pdfs(x, means, scales, dof)
+        r = np.exp(log_r - np.logaddexp.reduce(log_r, axis=1)[:, None])
+        wr = w[:, None]*r
+        if dof is not None:
+            z2 = ((x[:, None] - means)/scales)**2
+            wr_u = wr*(dof+1)/(dof+z2)
+        else:
+            wr_u = wr
+        weights = np.maximum(wr.sum(axis=0), 1e-12)
+        weights /= weights.sum()
+        means = (wr_u*x[:, None]).sum(axis=0)/np.maximum(wr_u.sum(axis=0), 1e-300)
+        variances = ((wr_u*(x[:, None] - means)**2).sum(axis=0)
+                     /np.maximum(wr.sum(axis=0), 1e-300))
+        scales = np.maximum(np.sqrt(variances), min_scale)
+    return weights, means, scales
+
+def adaptive_importance_sampling(log_f,
+                                 h,
+                                 means,
+                                 scales,
+                                 n_per_round=1000,
+                                 n_rounds=10,
+                                 dof=None,
+                                 rng=None):
+    # log_f: log of the target (normalized for the unnormalized estimate),
+    # h: function whose expectation under f is estimated, means/scales:
+    # initial mixture components (equal weights).
+    # Returns the estimates with all the samples (deterministic mixture
+    # weights), the number of target evaluations and the proposals.
+    rng = np.random.default_rng() if rng is None else rng
+    means = np.array(means, dtype=float)
+    scales = np.array(scales, dtype=float)
+    weights = np.ones(len(means))/len(means)
+
+    n_max = n_per_round*n_rounds
+    xs = np.empty(n_max)
+    log_fs = np.empty(n_max)
+    # log q_t(x) of the proposal of each round t at each sample
+    log_qs = np.empty((n_max, n_rounds))
+    proposals = []
+    for t in range(n_rounds):
+        proposals.append((weights, means, scales))
+        new = slice(t*n_per_round, (t+1)*n_per_round)
+        xs[new] = mixture_sample(rng, n_per_round, weights, means, scales, dof)
+        log_fs[new] = log_f(xs[new])
+        # Past proposals on the new samples, new proposal on all samples
+        for s, proposal in enumerate(proposals[:-1]):
+            log_qs[new, s] = mixture_logpdf(xs[new], *proposal, dof)
+        n = (t+1)*n_per_round
+        log_qs[:n, t] = mixture_logpdf(xs[:n], weights, means, scales, dof)
+        # Every round has the same number of samples: equal mixture weights
+        log_w = log_fs[:n] - (np.logaddexp.reduce(log_qs[:n, :t+1], axis=1)
+                              - np.log(t+1))
+        weights, means, scales = weighted_em(xs[:n], log_w, weights, means,
+                                             scales, dof)
+
+    w = np.exp(log_w - log_w.max())
+    h_x = h(xs)
+    return {"estimate": np.exp(log_w.max())*np.mean(w*h_x),
+            "snis_estimate": np.sum(w*h_x)/np.sum(w),
+            "ess": np.sum(w)**2/np.sum(w**2),
+            "n_target_evals": n,
+            "proposals": proposals}
+
+
+if __name__ == "__main__":
+    # Same example as importance_sampling.py: f = Laplace(1.5, 1),
+    # h(x) = 0.1*sin(x-1-(1.5-2)), fixed proposal N(0, 1)
+    mu_laplace = 1.5
+    b_laplace = 1
+    log_f = lambda x: -np.log(2*b_laplace) - np.abs(x-mu_laplace)/b_laplace
+    h = lambda x: 0.1*np.sin(x-1-(mu_laplace-2))
+    xs = np.linspace(-30, 30, 600001)
+    reference = np.sum(np.exp(log_f(xs))*h(xs))*(xs[1]-xs[0])
+
+    # Variance of the estimates over independent runs with the same number
+    # of target evaluations
+    n_runs = 200
+    n_evals = 5000
+    rng = np.random.default_rng(0)
+    fixed = []
+    for _ in range(n_runs):
+        x = rng.normal(size=n_evals)
+        log_w = log_f(x) - (-0.5*np.log(2*np.pi) - x**2/2)
+        fixed.append(np.mean(np.exp(log_w)*h(x)))
+    print(f"Reference: {reference:.5f}")
+    print(f"Fixed N(0, 1): {np.mean(fixed):.5f}, variance {np.var(fixed):.3e}")
+    for name, dof in [("Gaussian", None), ("Student-t (3 dof)", 3)]:
+        adaptive = [adaptive_importance_sampling(log_f, h, [-1, 0, 1],
+                                                 [1, 1, 1],
+                                                 n_per_round=n_evals//10,
+                                                 n_rounds=10, dof=dof,
+                                                 rng=rng)
+                    for _ in range(n_runs)]
+        estimates = [result["estimate"] for result in adaptive]
+        print(f"Adaptive {name} mixture: {np.mean(estimates):.5f}, "
+              f"variance {np.var(estimates):.3e} "
+              f"({np.var(fixed)/np.var(estimates):.1f}x less with the same "
+              f"{n_evals} target evaluations), "
+              f"ESS {np.mean([r['ess'] for r in adaptive]):.0f}")
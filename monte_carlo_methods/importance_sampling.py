@@ -7,9 +7,10 @@ Created on Fri Apr 14 10:30:34 2023
 Importance sampling and sampling importance resampling
 """
 import numpy as np
-import matplotlib.pyplot as plt
+from .resampling import resample, effective_sample_size
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
     xs = np.linspace(-5, 10, 100)
     # Pdf (Laplacian distribution shifted a little bit)
     f_general = lambda x, mu, b: 1/(2*b)*np.exp(-np.abs(x-mu)/b)
@@ -67,7 +68,11 @@ if __name__ == "__main__":
     sample_mean = (importance_weights*h(samples)).mean()
     print(sample_mean)
     
-    resamples = [np.random.choice(samples, p=importance_weights/importance_weights.sum()) for _ in range(n_samples)]
+    # n draws with probabilities given by the normalized importance weights
+    # (multinomial resampling, O(n))
+    log_weights = np.log(importance_weights)
+    resamples = samples[resample(log_weights, scheme="multinomial")]
+    print(f"ESS: {effective_sample_size(log_weights):.1f} out of {n_samples}")
     plt.figure(figsize=(10, 6))
     plt.plot(xs, f(xs), "--",
              label=fr"$f=\rho$=Laplace({mu_laplace}, {b_laplace})")
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Cluster updates for the Ising model (same flattened lattice, energy
+E = -J sum_i s_i sum_jneighbor s_j and k_B_times_T as in ising_model.py):
+
+    - Wolff: grow one cluster from a random spin and flip it
+    - Swendsen-Wang: split the whole lattice into clusters (union-find) and
+      flip each of them with probability 1/2
+
+Neighbouring aligned spins are bonded with probability
+p = 1 - exp(-4J/k_B T) (each pair is counted twice in E, hence 4J and not
+2J). Near the critical temperature, flipping whole clusters decorrelates
+much faster than single spin flips (critical slowing down).
+"""
+import time
+import numpy as np
+from .ising_model import neighbour_table, ising_energy, ising_mcmc
+from .recording import autocorrelation, integrated_autocorr_time
+
+
+def bond_probability(J, k_B_times_T):
+    if J <= 0:
+        raise ValueError("Cluster updates need a ferromagnetic coupling J > 0")
+    return 1 - np.exp(-4*J/k_B_times_T)
+
+def wolff(s, J, k_B_times_T, num_updates, rng=None):
+    # num_updates Wolff single-cluster updates of the flattened n x n
+    # lattice s (modified in place). Energy, magnetization and cluster size
+    # are logged after each update.
+    rng = np.random if rng is None else rng
+    num_spins = s.size
+    n = int(round(np.sqrt(num_spins)))
+    nbrs = neighbour_table(n)
+    p_add = bond_probability(J, k_B_times_T)
+    nbrs_list = nbrs.tolist()
+    spins = s.tolist() + [0]
+
+    E = ising_energy(s, nbrs, J)
+    M = int(np.sum(s))
+    logs = {"energies": [E], "magnetizations": [M], "cluster_sizes": []}
+    for update in range(num_updates):
+        seed = int(rng.uniform()*num_spins)
+        s_seed = spins[seed]
+        cluster = {seed}
+        stack = [seed]
+        while stack:
+            i = stack.pop()
+            for j in nbrs_list[i]:
+                if (spins[j] == s_seed and j not in cluster
+                        and rng.uniform() < p_add):
+                    cluster.add(j)
+                    stack.append(j)
+        # Only the bonds between the cluster and the rest change of sign:
+        # dE = 4*J*s_seed*sum of the spins outside next to the cluster
+        h = 0
+        for i in cluster:
+            spins[i] = -s_seed
+            for j in nbrs_list[i]:
+                if j not in cluster:
+                    h += spins[j]
+        E += 4*J*s_seed*h
+        M -= 2*s_seed*len(cluster)
+        logs["cluster_sizes"].append(len(cluster))
+        logs["energies"].append(E)
+        logs["magnetizations"].append(M)
+
+    s[:] = spins[:num_spins]
+    for key in logs:
+        logs[key] = np.array(logs[key])
+    return logs
+
+def find(parents, i):
+    # Root of i in the union-find forest (with path halving)
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+def swendsen_wang(s, J, k_B_times_T, num_sweeps, rng=None):
+    # num_sweeps Swendsen-Wang updates of the flattened n x n lattice s
+    # (modified in place). Energy, magnetization and number of clusters are
+    # logged after each sweep.
+    rng = np.random if rng is None else rng
+    num_spins = s.size
+    n = int(round(np.sqrt(num_spins)))
+    nbrs = neighbour_table(n)
+    p_add = bond_probability(J, k_B_times_T)
+    # Each pair once: right and down neighbours
+    pairs = np.concatenate([np.stack([np.arange(num_spins), nbrs[:, k]], axis=1)
+                            for k in (1, 3)])
+    pairs = pairs[pairs[:, 1] < num_spins]
+
+    logs = {"energies": [ising_energy(s, nbrs, J)],
+            "magnetizations": [int(np.sum(s))], "num_clusters": []}
+    for sweep in range(num_sweeps):
+        bonded = ((s[pairs[:, 0]] == s[pairs[:, 1]])
+                  & (rng.uniform(size=len(pairs)) < p_add))
+        parents = list(range(num_spins))
+        for i, j in pairs[bonded].tolist():
+            root_i, root_j = find(parents, i), find(parents, j)
+            if root_i != root_j:
+                parents[max(root_i, root_j)] = min(root_i, root_j)
+        roots = np.array([find(parents, i) for i in range(num_spins)])
+        # Flip each cluster with probability 1/2
+        flip = rng.uniform(size=num_spins) < 0.5
+        s[flip[roots]] *= -1
+        logs["num_clusters"].append(np.count_nonzero(roots == np.arange(num_spins)))
+        logs["energies"].append(ising_energy(s, nbrs, J))
+        logs["magnetizations"].append(int(np.sum(s)))
+
+    for key in logs:
+        logs[key] = np.array(logs[key])
+    return logs
+
+def effective_samples_per_second(run, observable="magnetizations",
+                                 num_updates=2000, discard=200):
+    # Effective number of independent samples of |observable| per CPU
+    # second: n/tau where tau is the integrated autocorrelation time
+    start = time.process_time()
+    logs = run(num_updates)
+    cpu_time = time.process_time() - start
+    x = np.abs(logs[observable][discard:])
+    tau = integrated_autocorr_time(autocorrelation(x, max_lag=len(x)//4))
+    return len(x)/tau/cpu_time, tau
+
+
+if __name__ == "__main__":
+    # Effective independent samples of |M| per CPU-second, single spin flip
+    # (one sweep = n**2 proposals) vs cluster updates, around the critical
+    # temperature k_B T_c = 4J/ln(1+sqrt(2)) ~ 1.13 for J=1/4
+    J = 1/4
+    for n in [16, 32]:
+        num_spins = n**2
+        print(f"n={n}")
+        for k_B_times_T in [0.9, 1.0, 1.13, 1.3, 1.6]:
+            results = {}
+            for name, update in [("single flip", ising_mcmc),
+                                 ("Wolff", wolff),
+                                 ("Swendsen-Wang", swendsen_wang)]:
+                s = np.ones(num_spins, dtype=int)
+                run = lambda num_updates: update(s, J, k_B_times_T,
+                                                 num_updates)
+                results[name] = effective_samples_per_second(run)
+            print(f"  k_B T={k_B_times_T}: " + ", ".join(
+                f"{name} {ess:.3g}/s (tau={tau:.1f})"
+                for name, (ess, tau) in results.items()))
@@ -8,24 +8,184 @@ Ising model: model of magnetic material. Lattice of spins.
 
 Use Markov Chain Monte Carlo to sample from the pdf of steady states.
 """
+import time
 import numpy as np
-import matplotlib.pyplot as plt
-from mcmc import mcmc
+from .mcmc import mcmc
+from .recording import Recorder
 
 def flip_spin(s, spin):
     new_s = s.copy()
     new_s[spin] = -new_s[spin]
     return new_s
 
+def neighbour_table(n):
+    # Indices of the left, right, up and down neighbours of each spin of
+    # the flattened n x n lattice (no periodic boundaries: a missing
+    # neighbour points to the extra index n**2, a spin always equal to 0)
+    i = np.arange(n**2)
+    row, col = i//n, i%n
+    return np.stack([np.where(col > 0, i-1, n**2),
+                     np.where(col < n-1, i+1, n**2),
+                     np.where(row > 0, i-n, n**2),
+                     np.where(row < n-1, i+n, n**2)], axis=1)
+
+def ising_energy(s, nbrs, J):
+    # E = -J sum_i s_i sum_jneighbor s_j (each pair counted twice, same
+    # definition as energy in the script below)
+    s_pad = np.append(s, 0)
+    return -J*np.sum(s*s_pad[nbrs].sum(axis=1))
+
+def ising_mcmc(s, J, k_B_times_T, num_sweeps, algorithm="glauber", rng=None,
+               recorder=None, instrument=None):
+    # Single spin flip MCMC (Glauber or Metropolis rule) on the flattened
+    # n x n lattice s, modified in place. A sweep is n**2 proposals of
+    # flipping one random spin. Instead of recomputing the energy of a
+    # copied lattice, the energy difference of a flip only depends on the
+    # 4 neighbours: dE = 4*J*s_i*sum_jneighbor s_j. Running energy and
+    # magnetization are logged after each sweep (and passed to the
+    # recorder if given, with the acceptance rate and the lattice).
+    # instrument (see common/instrumentation.py) gets the counters, energy and
+    # magnetization after each sweep.
+    rng = np.random if rng is None else rng
+    num_spins = s.size
+    n = int(round(np.sqrt(num_spins)))
+    nbrs = neighbour_table(n).tolist()
+    # Python lists are much faster than numpy arrays for scalar access
+    spins = s.tolist() + [0]
+    
+    # Acceptance probabilities for each possible s_i*h in {-4, ..., 4}
+    dE = 4*J*np.arange(-4, 5)
+    with np.errstate(over="ignore"):
+        if algorithm == "glauber":
+            P_accept = 1/(1 + np.exp(dE/k_B_times_T))
+        elif algorithm == "metropolis":
+            P_accept = np.minimum(1, np.exp(-dE/k_B_times_T))
+        else:
+            raise ValueError(f"Unknown algorithm {algorithm}")
+    P_accept = P_accept.tolist()
+    
+    E = ising_energy(s, neighbour_table(n), J)
+    M = int(np.sum(s))
+    logs = {"energies": [E], "magnetizations": [M], "n_accepted": 0}
+    if instrument is not None:
+        instrument.begin(algorithm=algorithm, num_spins=num_spins)
+    for sweep in range(num_sweeps):
+        n_accepted = logs["n_accepted"]
+        sites = (rng.uniform(size=num_spins)*num_spins).astype(int).tolist()
+        us = rng.uniform(size=num_spins).tolist()
+        for i, u in zip(sites, us):
+            left, right, up, down = nbrs[i]
+            s_i = spins[i]
+            s_h = s_i*(spins[left] + spins[right] + spins[up] + spins[down])
+            if u < P_accept[s_h + 4]:
+                spins[i] = -s_i
+                E += 4*J*s_h
+                M -= 2*s_i
+                logs["n_accepted"] += 1
+        logs["energies"].append(E)
+        logs["magnetizations"].append(M)
+        if recorder is not None:
+            recorder.record(lambda: spins[:num_spins], energy=E,
+                            magnetization=M,
+                            acceptance=(logs["n_accepted"]-n_accepted)/num_spins)
+        if instrument is not None:
+            instrument.count("proposals", num_spins)
+            instrument.count("accepted", logs["n_accepted"]-n_accepted)
+            instrument.step(energy=E, magnetization=M)
+    
+    if instrument is not None:
+        instrument.end(energy=E, magnetization=M)
+    s[:] = spins[:num_spins]
+    logs["energies"] = np.array(logs["energies"])
+    logs["magnetizations"] = np.array(logs["magnetizations"])
+    return logs
+
+
+def neighbour_sum(s, out=None):
+    # Sum of the left, right, up and down neighbours of each spin of a
+    # (..., n, n) stack of lattices (no periodic boundaries)
+    h = np.zeros(s.shape, dtype=np.int8) if out is None else out
+    h[...] = 0
+    h[..., 1:, :] += s[..., :-1, :]
+    h[..., :-1, :] += s[..., 1:, :]
+    h[..., :, 1:] += s[..., :, :-1]
+    h[..., :, :-1] += s[..., :, 1:]
+    return h
+
+def ising_checkerboard(s, J, k_B_times_T, num_sweeps, algorithm="glauber",
+                       rng=None, recorder=None):
+    # Vectorized sweeps: spins of one color of the checkerboard (red-black)
+    # don't interact, so all of them are updated at once with the Glauber
+    # (heat-bath) or Metropolis rule, then the other color.
+    #
+    # s: (..., n, n) stack of lattices (modified in place), J and
+    # k_B_times_T broadcastable to s.shape[:-2], e.g. one temperature per
+    # lattice to advance a whole temperature scan at once.
+    # Energies and magnetizations of each lattice are logged after each
+    # sweep, shape (num_sweeps+1, ...), and passed to the recorder if given.
+    rng = np.random if rng is None else rng
+    n = s.shape[-1]
+    J = np.asarray(J, dtype=float)[..., None]
+    beta = 1/np.asarray(k_B_times_T, dtype=float)[..., None]
+    # The lattices live in a zero-padded copy (the padding stands for the
+    # missing neighbours), so that the spins of one color and their four
+    # neighbours are gathered by flat indices and only that half of the
+    # lattice is computed and drawn for
+    padded = np.zeros(s.shape[:-2] + (n + 2, n + 2), dtype=s.dtype)
+    inner = padded[..., 1:-1, 1:-1]
+    inner[...] = s
+    flat = padded.reshape(s.shape[:-2] + (-1,))
+    rows, columns = np.indices((n, n))
+    sites = [(n + 2)*(rows[color] + 1) + columns[color] + 1
+             for color in [(rows + columns) % 2 == 0,
+                           (rows + columns) % 2 == 1]]
+    
+    h = np.zeros(s.shape, dtype=np.int8)
+    energy = lambda: -np.sum(J[..., None]*inner*neighbour_sum(inner, out=h),
+                             axis=(-2, -1))
+    logs = {"energies": [energy()],
+            "magnetizations": [inner.sum(axis=(-2, -1))], "n_accepted": 0}
+    for sweep in range(num_sweeps):
+        n_flipped = 0
+        for site in sites:
+            spins = flat[..., site]
+            h_site = (flat[..., site - 1] + flat[..., site + 1]
+                      + flat[..., site - (n + 2)] + flat[..., site + n + 2])
+            # dE of flipping each spin = 4*J*s_i*h_i
+            dE_beta = 4*J*beta*(spins*h_site)
+            with np.errstate(over="ignore"):
+                if algorithm == "glauber":
+                    P_accept = 1/(1 + np.exp(dE_beta))
+                elif algorithm == "metropolis":
+                    P_accept = np.exp(-np.maximum(dE_beta, 0))
+                else:
+                    raise ValueError(f"Unknown algorithm {algorithm}")
+            flip = rng.uniform(size=spins.shape) < P_accept
+            flat[..., site] = np.where(flip, -spins, spins)
+            n_flipped = n_flipped + np.count_nonzero(flip, axis=-1)
+        logs["n_accepted"] += np.sum(n_flipped)
+        logs["energies"].append(energy())
+        logs["magnetizations"].append(inner.sum(axis=(-2, -1)))
+        if recorder is not None:
+            recorder.record(inner, energy=logs["energies"][-1],
+                            magnetization=logs["magnetizations"][-1],
+                            acceptance=n_flipped/n**2)
+    s[...] = inner
+
+    logs["energies"] = np.array(logs["energies"])
+    logs["magnetizations"] = np.array(logs["magnetizations"])
+    return logs
+
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
     n = 20
     num_spins = n**2
     s = 2*np.random.randint(2, size=(num_spins, ))-1
     
     # Metropolis with uniform proposal distribution selecting one random neighbor
     # neighbors = lambda x: [flip_spin(s, spin) for spin in range(num_spins)]
-    sample_candidate = lambda x: flip_spin(s, np.random.randint(num_spins))
+    sample_candidate = lambda x: flip_spin(x, np.random.randint(num_spins))
     proposal_distr = lambda x_prime, x: 1/num_spins #if (np.count_nonzero(x_prime-x) == 1 and
                                                     #    np.linalg.norm(x_prime-x,ord=1)) else 0
     
@@ -41,21 +201,58 @@ if __name__ == "__main__":
                                       np.where(np.arange(num_spins) < num_spins-1-(n-1), np.roll(s,-n), 0))
 
     energy = lambda s, J: -J*np.sum(s_i_times_s_j(s))
-    f_unnorm = lambda x: np.exp(-1/k_B_times_T*energy(x, J))
+    # log of exp(-E/kT): the ratio of densities would overflow/underflow
+    log_f_unnorm = lambda x: -1/k_B_times_T*energy(x, J)
     
     num_steps = 500
-    samples = mcmc(f_unnorm,
-                    s,
-                    algorithm="glauber",
-                    sample_candidate=sample_candidate,
-                    proposal_distr=proposal_distr,
-                    tmax=num_steps*num_spins)
+    # Only keep one int8 lattice per sweep (and streaming observables)
+    # instead of all the num_steps*num_spins states
+    recorder = Recorder((n, n), n_snapshots=num_steps, every=num_spins)
+    start = time.perf_counter()
+    mcmc(log_f_unnorm,
+         s,
+         algorithm="glauber",
+         log_density=True,
+         sample_candidate=sample_candidate,
+         proposal_distr=proposal_distr,
+         tmax=num_steps*num_spins,
+         recorder=recorder)
+    print(f"mcmc: {(time.perf_counter()-start)/num_steps*1e3:.3f} ms/sweep")
+    print("Acceptance rate:", recorder.stats["accepted"].mean)
     
     fig, axs = plt.subplots(1, 5)
-    axs[0].imshow(samples[0].reshape(n, n))
-    axs[1].imshow(samples[20*num_spins].reshape(n, n))
-    axs[2].imshow(samples[50*num_spins].reshape(n, n))
-    axs[3].imshow(samples[-1].reshape(n, n))
+    axs[0].imshow(recorder.snapshot(0))
+    axs[1].imshow(recorder.snapshot(20))
+    axs[2].imshow(recorder.snapshot(50))
+    axs[3].imshow(recorder.snapshot(-1))
     axs[4].imshow(s.reshape(n, n))
-
-    
\ No newline at end of file
+    
+    # Same chain with incremental energy updates (and in place flips)
+    s = 2*np.random.randint(2, size=(num_spins, ))-1
+    fig, axs = plt.subplots(1, 4)
+    axs[0].imshow(s.reshape(n, n))
+    start = time.perf_counter()
+    logs = ising_mcmc(s, J, k_B_times_T, 20)
+    axs[1].imshow(s.reshape(n, n))
+    logs = ising_mcmc(s, J, k_B_times_T, 30)
+    axs[2].imshow(s.reshape(n, n))
+    logs = ising_mcmc(s, J, k_B_times_T, num_steps-50)
+    axs[3].imshow(s.reshape(n, n))
+    print(f"ising_mcmc: {(time.perf_counter()-start)/num_steps*1e3:.3f} ms/sweep")
+    print("Energy:", logs["energies"][-1], energy(s, J))
+    
+    # Temperature scan: one lattice per temperature, all updated at once
+    # with checkerboard sweeps (one color of spins at a time)
+    k_B_times_Ts = np.linspace(0.3, 2, 18)
+    lattices = 2*np.random.randint(2, size=(len(k_B_times_Ts), n, n))-1
+    start = time.perf_counter()
+    logs = ising_checkerboard(lattices, J, k_B_times_Ts, 2000)
+    print(f"ising_checkerboard: {len(k_B_times_Ts)*num_spins*2000/(time.perf_counter()-start):.3g} spin updates/s")
+    fig, axs = plt.subplots(1, 2, figsize=(8, 4))
+    axs[0].plot(k_B_times_Ts, np.abs(logs["magnetizations"][200:]).mean(axis=0)/num_spins, "o-")
+    axs[0].set_xlabel(r"$k_B T$")
+    axs[0].set_ylabel(r"$|M|/N$")
+    axs[1].plot(k_B_times_Ts, logs["energies"][200:].mean(axis=0)/num_spins, "o-")
+    axs[1].set_xlabel(r"$k_B T$")
+    axs[1].set_ylabel(r"$E/N$")
+    plt.tight_layout()
@@ -16,49 +16,214 @@ One also needs to choose some proposal distribution such that don't reject
 too often.
 """
 import numpy as np
-import matplotlib.pyplot as plt
 
 
+def log_P_accept(algorithm, log_f_new, log_f_x, log_g_ratio=0):
+    # Log of the acceptance probability computed from log-densities so that
+    # f ratios like exp(-E/kT) don't overflow/underflow.
+    # log_g_ratio = log g(x | x_new) - log g(x_new | x) (Metropolis-Hastings)
+    with np.errstate(invalid="ignore"):
+        log_ratio = log_f_new - log_f_x + log_g_ratio
+        if algorithm == "glauber":
+            # f(x_new)/(f(x)+f(x_new)) = 1/(1+exp(-log_ratio))
+            return -np.logaddexp(0, -log_ratio)
+        return np.minimum(0, log_ratio)
+
+def _log_density(f, log_density):
+    if log_density:
+        return f
+    def log_f(*args):
+        with np.errstate(divide="ignore"):
+            return np.log(f(*args))
+    return log_f
+
+def _counted(log_f, counts, size=lambda value: 1):
+    # log_f counting its evaluations in counts[0] (size(value) per call, e.g.
+    # the number of states of a batched call)
+    def counted_log_f(x):
+        value = log_f(x)
+        counts[0] += size(value)
+        return value
+    return counted_log_f
+
 def mcmc(f,
          x0,
          algorithm=None,
          tmax=100000,
+         burn_in=None,
+         thin=1,
+         log_density=False,
+         return_logs=False,
+         rng=None,
+         recorder=None,
+         instrument=None,
          **kwargs):
+    # f is the (unnormalized) pdf, or its log if log_density.
+    # The log-density of the current state is cached: f is evaluated once
+    # per proposal and the acceptance is computed in log space.
+    # If return_logs, also returns counters (density evaluations, counted
+    # on the calls of f, accepted moves, ...) and the last state with its
+    # log-density.
+    # If a recorder (see recording.py) is given, the kept states are passed
+    # to it (with log_f and accepted as observables) instead of being
+    # appended to the returned samples.
+    # instrument (see common/instrumentation.py) gets the counters and the
+    # state after each step, and the time of each phase in profile mode.
+    rng = np.random if rng is None else rng
+    log_f = _log_density(f, log_density)
+    n_evals = [0]
+    if return_logs:
+        log_f = _counted(log_f, n_evals)
+    burn_in = tmax//10 if burn_in is None else burn_in
+    
     # Initial point
     x = x0
     samples = []
     
-    if algorithm is None:
-        # Metropolis with Isotropic gaussian proposal distribution
-        # with std 0.1 by default..
-        sample_candidate = lambda x: np.random.normal(x, 0.1)
-        P_accept = lambda x_new, x: min(1, f(x_new)/f(x))
-        
+    if algorithm is None or algorithm == "glauber":
+        if algorithm == "glauber" and "sample_candidate" in kwargs:
+            sample_candidate = kwargs["sample_candidate"]
+        else:
+            # Metropolis with Isotropic gaussian proposal distribution
+            # with std 0.1 by default.. (same one for Glauber)
+            sample_candidate = lambda x: rng.normal(x, 0.1)
+        log_g_ratio = lambda x_new, x: 0
     elif algorithm == "metropolis-hastings":
         # Sampling from the proposal distribution g(x_new | x)
-        sample_candidate = lambda x: kwargs["sample_candidate"](x)
-        g = kwargs["proposal_distr"]
-        P_accept = lambda x_new, x: min(1, f(x_new)*g(x, x_new)/(f(x)*g(x_new, x)))
-    elif algorithm == "glauber":
-        if "sample_candidate" in kwargs:
-            sample_candidate = lambda x: kwargs["sample_candidate"](x)
-        else:
-            # Let's use the same proposal distribution as the default
-            sample_candidate = lambda x: np.random.normal(x, 0.1)
-        P_accept = lambda x_new, x: f(x_new)/(f(x)+f(x_new))
-        
+        sample_candidate = kwargs["sample_candidate"]
+        g = _log_density(kwargs["proposal_distr"], False)
+        log_g_ratio = lambda x_new, x: g(x, x_new) - g(x_new, x)
+    else:
+        raise ValueError(f"Unknown algorithm {algorithm}")
+    
+    append = samples.append
+    record = None if recorder is None else recorder.record
+    P_accept = log_P_accept
+    if instrument is not None:
+        instrument.begin(algorithm=algorithm or "metropolis")
+        if instrument.profile:
+            sample_candidate = instrument.timed("proposal", sample_candidate)
+            log_f = instrument.timed("density", log_f)
+            P_accept = instrument.timed("acceptance", P_accept)
+            append = instrument.timed("recording", append)
+            if record is not None:
+                record = instrument.timed("recording", record)
+    
+    log_f_x = log_f(x)
+    logs = {"n_accepted": 0}
     for t in range(tmax):
         x_new = sample_candidate(x)
+        log_f_new = log_f(x_new)
         # Metropolis Hastings rule, accept the selected 
-        if np.random.uniform() < P_accept(x_new, x):
+        accepted = np.log(rng.uniform()) < P_accept(algorithm, log_f_new,
+                                                    log_f_x,
+                                                    log_g_ratio(x_new, x))
+        if accepted:
             x = x_new
+            log_f_x = log_f_new
+            logs["n_accepted"] += 1
         # ignore the first samples because not following distribution
         # we would want samples coming from the equilibrium distribution
-        if t > tmax//10:
-            samples.append(x)
+        if t > burn_in and (t - burn_in - 1) % thin == 0:
+            if record is None:
+                append(x)
+            else:
+                record(x, log_f=log_f_x, accepted=accepted)
+        if instrument is not None:
+            instrument.count("proposals")
+            instrument.count("density_evals")
+            instrument.count("accepted", int(accepted))
+            instrument.step(log_f=log_f_x)
+    
+    if instrument is not None:
+        instrument.end(log_f=log_f_x)
+    if return_logs:
+        logs["n_evals"] = n_evals[0]
+        logs["acceptance_rate"] = logs["n_accepted"]/max(tmax, 1)
+        logs["x"] = x
+        logs["log_f"] = log_f_x
+        return samples, logs
+    return samples
+
+def mcmc_chains(f,
+                x0s,
+                algorithm=None,
+                tmax=100000,
+                burn_in=None,
+                thin=1,
+                log_density=False,
+                return_logs=False,
+                rng=None,
+                **kwargs):
+    # Same algorithms as mcmc but for K independent chains advanced in
+    # lockstep: one batched proposal, one batched density evaluation and
+    # one vectorized accept/reject per step.
+    #
+    # x0s: (K, ) for 1D or (K, dim) initial states.
+    # f (or log f if log_density), sample_candidate and proposal_distr are
+    # called with the K states stacked along the last axis, i.e. x of shape
+    # (dim, K) so that x[0], x[1] are the coordinates (like the 2D lambdas
+    # of multivariate_mcmc.py). They must return (K, ) values ((dim, K) for
+    # sample_candidate).
+    #
+    # Returns the samples kept after burn_in (default tmax//10 like mcmc),
+    # every thin steps, in a (n_kept, K, dim) array (and the logs if
+    # return_logs, with per-chain counts of accepted moves).
+    rng = np.random if rng is None else rng
+    x0s = np.asarray(x0s, dtype=float)
+    x = (x0s[:, None] if x0s.ndim == 1 else x0s).T.copy()  # (dim, K)
+    dim, K = x.shape
+    burn_in = tmax//10 if burn_in is None else burn_in
+    
+    log_f = _log_density(f, log_density)
+    n_evals = [0]
+    if return_logs:
+        log_f = _counted(log_f, n_evals, size=np.size)
+    batched_log_f = lambda x: np.reshape(log_f(x), (K, ))
+    if algorithm is None or algorithm == "glauber":
+        if algorithm == "glauber" and "sample_candidate" in kwargs:
+            sample_candidate = kwargs["sample_candidate"]
+        else:
+            sample_candidate = lambda x: x + rng.normal(0, 0.1, size=x.shape)
+        log_g_ratio = lambda x_new, x: 0
+    elif algorithm == "metropolis-hastings":
+        sample_candidate = kwargs["sample_candidate"]
+        g = _log_density(kwargs["proposal_distr"], False)
+        log_g_ratio = lambda x_new, x: np.reshape(g(x, x_new) - g(x_new, x),
+                                                  (K, ))
+    else:
+        raise ValueError(f"Unknown algorithm {algorithm}")
+    
+    kept = range(burn_in + 1, tmax, thin)
+    samples = np.empty((len(kept), K, dim))
+    log_f_x = batched_log_f(x)  # only changes when a move is accepted
+    n_accepted = np.zeros(K, dtype=int)
+    i = 0
+    for t in range(tmax):
+        x_new = np.reshape(sample_candidate(x), (dim, K))
+        log_f_new = batched_log_f(x_new)
+        accept = np.log(rng.uniform(size=K)) < log_P_accept(
+            algorithm, log_f_new, log_f_x, log_g_ratio(x_new, x))
+        x[:, accept] = x_new[:, accept]
+        log_f_x[accept] = log_f_new[accept]
+        n_accepted += accept
+        
+        if t > burn_in and (t - burn_in - 1) % thin == 0:
+            samples[i] = x.T
+            i += 1
+    
+    if return_logs:
+        logs = {"n_evals": n_evals[0],
+                "n_accepted": n_accepted,
+                "acceptance_rate": n_accepted/max(tmax, 1)}
+        return samples, logs
     return samples
 
 if __name__ == "__main__":
+    import os
+    # ./images/mcmc.png next to this file
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    import matplotlib.pyplot as plt
     xs = np.linspace(-4, 4, 100)
     # Pdf
     f_general = lambda x, mu, std: 1/np.sqrt(2*np.pi*std**2)*np.exp(-1/2*(x-mu)**2/std**2)
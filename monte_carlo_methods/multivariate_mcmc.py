@@ -5,12 +5,15 @@ Created on Fri Apr 14 10:31:58 2023
 @author: steph
 """
 import numpy as np
-import matplotlib.pyplot as plt
 
-from mcmc import mcmc
-from matplotlib.colors import LogNorm
+from .mcmc import mcmc
 
 if __name__ == "__main__":
+    import os
+    # ./images/mcmc_metropolis_2d.png next to this file
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
     xs = np.arange(200)/199
     XX, YY = np.meshgrid(xs, xs)
     # Pdf
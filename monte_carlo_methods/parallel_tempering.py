@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel tempering (replica exchange): replicas of the system are sampled at
+a ladder of temperatures T_0 = 1 < T_1 < ... and, periodically, replicas
+at neighbouring temperatures swap their temperatures with probability
+
+    min(1, exp((1/T_i - 1/T_j)*(E_i - E_j)))
+
+where E = -log f (so that the target at temperature T is f**(1/T)). Hot
+replicas cross the barriers between modes, the swaps bring these moves
+down to the cold chain.
+
+Replicas live in worker processes (each one with its own RNG stream derived
+from a SeedSequence): only temperatures and energies go through the pipes
+by default, the states stay in the workers. An observable of the states is
+sent back each round only if one is given.
+"""
+import copy
+import time
+import traceback
+import multiprocessing as mp
+import numpy as np
+from .mcmc import mcmc
+from .ising_model import ising_mcmc
+
+
+def mcmc_sampler(energy, **kwargs):
+    # Replica sampler using mcmc (kwargs are passed to it, e.g. algorithm,
+    # sample_candidate) on the tempered log-density -E(x)/T
+    def sampler(x, temperature, n_steps, rng):
+        _, logs = mcmc(lambda x: -energy(x)/temperature, x, tmax=n_steps,
+                       burn_in=n_steps, log_density=True, return_logs=True,
+                       rng=rng, **kwargs)
+        return logs["x"], -logs["log_f"]*temperature
+    return sampler
+
+def ising_sampler(J, algorithm="glauber"):
+    # Replica sampler doing n_steps sweeps of single spin flips (ising_mcmc)
+    # on a flattened lattice, k_B_times_T being the temperature
+    def sampler(s, temperature, n_steps, rng):
+        logs = ising_mcmc(s, J, temperature, n_steps, algorithm=algorithm,
+                          rng=rng)
+        return s, logs["energies"][-1]
+    return sampler
+
+def _run_replicas(sampler, observable, replicas, temperatures, n_steps):
+    # replicas: {replica_id: [state, rng]}, temperatures: {replica_id: T}.
+    # The observables (None without observable) are copied: without
+    # workers, observable(state) (e.g. the state itself) would otherwise
+    # change with the next rounds of in-place samplers
+    results = {}
+    for r, T in temperatures.items():
+        state, rng = replicas[r]
+        state, energy = sampler(state, T, n_steps, rng)
+        replicas[r][0] = state
+        results[r] = (energy, None if observable is None
+                      else copy.deepcopy(observable(state)))
+    return results
+
+def _worker(connection, sampler, observable, replicas):
+    # Replies (True, results) or, if the sampler raised, (False, (exception,
+    # traceback)) and waits for the stop message. On stop (None), replies
+    # with the final states.
+    while True:
+        message = connection.recv()
+        if message is None:
+            try:
+                connection.send((True, {r: replica[0]
+                                        for r, replica in replicas.items()}))
+            except (BrokenPipeError, OSError):  # parent gone after an error
+                pass
+            break
+        temperatures, n_steps = message
+        try:
+            reply = (True, _run_replicas(sampler, observable, replicas,
+                                         temperatures, n_steps))
+        except Exception as error:
+            reply = (False, (error, traceback.format_exc()))
+        try:
+            connection.send(reply)
+        except Exception:  # unpicklable exception
+            connection.send((False, (RuntimeError(repr(reply[1][0])),
+                                     reply[1][1])))
+
+def _receive(connection):
+    # Result of a worker, re-raising its exception (with the traceback of
+    # the worker as cause), EOFError if it died
+    ok, reply = connection.recv()
+    if not ok:
+        error, remote_traceback = reply
+        raise error from RuntimeError("Traceback of the replica worker:\n"
+                                      + remote_traceback)
+    return reply
+
+def tune_ladder(temperatures, swap_rates, kappa=1.0):
+    # Move the intermediate temperatures (T_0 and T_max fixed) so that the
+    # swap rates get closer to each other: the log-spacing between
+    # neighbours with a high swap rate is increased, and vice versa
+    log_spacings = np.diff(np.log(temperatures))
+    log_spacings = log_spacings*np.exp(kappa*(swap_rates - swap_rates.mean()))
+    log_spacings *= np.log(temperatures[-1]/temperatures[0])/log_spacings.sum()
+    return temperatures[0]*np.exp(np.concatenate([[0], np.cumsum(log_spacings)]))
+
+def parallel_tempering(sampler,
+                       x0s,
+                       temperatures,
+                       n_rounds,
+                       steps_per_round=100,
+                       observable=None,
+                       n_workers=None,
+                       seed=None,
+                       tune_rounds=0,
+                       tune_every=10):
+    # sampler(state, temperature, n_steps, rng) -> (state, energy) advances
+    # one replica (see mcmc_sampler and ising_sampler), x0s are the initial
+    # states of the replicas (one per temperature).
+    # Each round, every replica does steps_per_round steps, then swaps are
+    # proposed between the pairs (0, 1), (2, 3), ... or (1, 2), (3, 4), ...
+    # (alternating). During the first tune_rounds rounds, the ladder is
+    # tuned every tune_every rounds (see tune_ladder).
+    # observable(state) is recorded after each round for each temperature
+    # if given (default: nothing but the energies, e.g. lambda x: x records
+    # the whole states, which are then sent through the pipes each round).
+    #
+    # Returns a dict with the temperatures, the swap rates of each pair
+    # (after tuning), the energies (n_rounds, n_temperatures) and
+    # observables (n_rounds, n_temperatures, ...) or None without
+    # observable, and the final states
+    # (list), ordered by temperature. x0s is not modified (the states are
+    # copied), and an exception of the sampler in a worker is re-raised.
+    temperatures = np.array(temperatures, dtype=float)
+    n_replicas = len(temperatures)
+    n_workers = min(n_replicas, mp.cpu_count() if n_workers is None
+                    else n_workers)
+    seeds = np.random.SeedSequence(seed).spawn(n_replicas + 1)
+    rng = np.random.default_rng(seeds[-1])  # for the swaps
+    replicas = {r: [copy.deepcopy(x0s[r]), np.random.default_rng(seeds[r])]
+                for r in range(n_replicas)}
+
+    # Replicas are dealt to the workers once and for all
+    groups = [list(range(n_replicas))[w::n_workers] for w in range(n_workers)]
+    connections = []
+    processes = []
+    replica_at = np.arange(n_replicas)  # replica at each temperature index
+    energies = np.empty((n_rounds, n_replicas))
+    observables = [None]*n_rounds
+    n_proposed = np.zeros(n_replicas-1)
+    n_swapped = np.zeros(n_replicas-1)
+    try:
+        if n_workers > 1:
+            # fork: the sampler (often a closure) doesn't need to be
+            # picklable
+            context = mp.get_context("fork" if "fork" in
+                                     mp.get_all_start_methods() else None)
+            for group in groups:
+                parent, child = context.Pipe()
+                process = context.Process(target=_worker,
+                                          args=(child, sampler, observable,
+                                                {r: replicas[r]
+                                                 for r in group}),
+                                          daemon=True)
+                process.start()
+                child.close()  # recv raises EOFError if the worker dies
+                connections.append(parent)
+                processes.append(process)
+
+        for t in range(n_rounds):
+            temperature_of = {r: temperatures[i]
+                              for i, r in enumerate(replica_at)}
+            if connections:
+                for connection, group in zip(connections, groups):
+                    connection.send(({r: temperature_of[r] for r in group},
+                                     steps_per_round))
+                results = {}
+                for connection in connections:
+                    results.update(_receive(connection))
+            else:
+                results = _run_replicas(sampler, observable, replicas,
+                                        temperature_of, steps_per_round)
+            energies[t] = [results[r][0] for r in replica_at]
+            if observable is not None:
+                observables[t] = [results[r][1] for r in replica_at]
+
+            # Swaps of temperature labels between neighbours
+            for i in range(t % 2, n_replicas-1, 2):
+                log_P = ((1/temperatures[i] - 1/temperatures[i+1])
+                         * (energies[t, i] - energies[t, i+1]))
+                n_proposed[i] += 1
+                if np.log(rng.uniform()) < log_P:
+                    replica_at[[i, i+1]] = replica_at[[i+1, i]]
+                    n_swapped[i] += 1
+
+            if t < tune_rounds and (t+1) % tune_every == 0:
+                temperatures = tune_ladder(temperatures,
+                                           n_swapped/np.maximum(n_proposed, 1))
+                n_proposed[:] = 0
+                n_swapped[:] = 0
+
+        states = {r: replica[0] for r, replica in replicas.items()}
+        for connection in connections:
+            connection.send(None)
+            states.update(_receive(connection))
+    finally:
+        # Workers are told to stop (a worker stopped above just gets an
+        # error) and joined, also after an exception
+        for connection in connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+    return {"temperatures": temperatures,
+            "swap_rates": n_swapped/np.maximum(n_proposed, 1),
+            "energies": energies,
+            "observables": (None if observable is None
+                            else np.array(observables)),
+            "states": [states[r] for r in replica_at]}
+
+
+if __name__ == "__main__":
+    # Bimodal target: a single Metropolis chain with std 0.1 stays in the
+    # mode it starts in, parallel tempering visits both
+    energy = lambda x: -np.logaddexp(-(x+3)**2/(2*0.5**2), -(x-3)**2/(2*0.5**2))
+    temperatures = np.geomspace(1, 30, 8)
+    results = parallel_tempering(mcmc_sampler(energy), [-3.0]*8,
+                                 temperatures, n_rounds=2000,
+                                 steps_per_round=50,
+                                 observable=lambda x: x, seed=0,
+                                 tune_rounds=1000, tune_every=50)
+    cold = results["observables"][1000:, 0]
+    print("Temperatures:", np.round(results["temperatures"], 2))
+    print("Swap rates:", np.round(results["swap_rates"], 2))
+    print(f"Fraction of cold samples in x > 0: {np.mean(cold > 0):.2f}")
+
+    # Low temperature Ising model: the magnetization of the cold chain
+    # changes sign thanks to the swaps
+    n = 20
+    J = 1/4
+    temperatures = np.geomspace(0.8, 3, 8)
+    x0s = [2*np.random.randint(2, size=(n**2, ))-1 for _ in temperatures]
+    for n_workers in [1, mp.cpu_count()]:
+        start = time.perf_counter()
+        results = parallel_tempering(ising_sampler(J), x0s,
+                                     temperatures, n_rounds=200,
+                                     steps_per_round=5,
+                                     observable=lambda s: np.sum(s)/s.size,
+                                     n_workers=n_workers, seed=0)
+        elapsed = time.perf_counter() - start
+        print(f"{n_workers} worker(s): {8*200*5/elapsed:.3g} sweeps/s, "
+              f"swap rates {np.round(results['swap_rates'], 2)}")
+    magnetizations = results["observables"][:, 0]
+    print("Sign changes of the cold magnetization:",
+          np.count_nonzero(np.diff(np.sign(magnetizations))))
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Figures of the command line experiments (__main__.py), drawn on
+matplotlib.figure.Figure without pyplot: no GUI backend is needed and
+nothing is kept alive after savefig. matplotlib is only imported when this
+module is, i.e. when a figure is requested.
+"""
+import numpy as np
+from matplotlib.figure import Figure
+
+
+def plot_samples(path, samples, pdf, title=None, bins=60):
+    # Histogram of the samples against the target pdf, and the trace
+    fig = Figure(figsize=(10, 4))
+    axs = fig.subplots(1, 2)
+    xs = np.linspace(np.min(samples), np.max(samples), 200)
+    axs[0].hist(samples, bins=bins, density=True, alpha=0.5, label="samples")
+    axs[0].plot(xs, pdf(xs), "r", label="target")
+    axs[0].legend()
+    axs[1].plot(samples, linewidth=0.5)
+    axs[1].set_xlabel("Step")
+    if title is not None:
+        fig.suptitle(title)
+    fig.tight_layout()
+    fig.savefig(path)
+    return fig
+
+def plot_ising(path, lattice, logs, num_spins, title=None):
+    # Final lattice, |M|/N and E/N after each update
+    fig = Figure(figsize=(12, 4))
+    axs = fig.subplots(1, 3)
+    axs[0].imshow(lattice, cmap="gray", vmin=-1, vmax=1)
+    axs[0].set_axis_off()
+    axs[1].plot(np.abs(logs["magnetizations"])/num_spins)
+    axs[1].set_ylabel(r"$|M|/N$")
+    axs[2].plot(logs["energies"]/num_spins)
+    axs[2].set_ylabel(r"$E/N$")
+    for ax in axs[1:]:
+        ax.set_xlabel("Update")
+    if title is not None:
+        fig.suptitle(title)
+    fig.tight_layout()
+    fig.savefig(path)
+    return fig
+
+def plot_convergence(path, results, reference=None):
+    # Estimates +- 2 standard errors against the number of samples
+    n = np.array([result["n"] for result in results])
+    fig = Figure(figsize=(8, 5))
+    ax = fig.subplots()
+    for key, label in [("estimate", "importance sampling"),
+                       ("snis_estimate", "self-normalized")]:
+        estimate = np.array([result[key] for result in results])
+        se = np.array([result[key.replace("estimate", "se")]
+                       for result in results])
+        ax.plot(n, estimate, "o-", label=label)
+        ax.fill_between(n, estimate - 2*se, estimate + 2*se, alpha=0.2)
+    if reference is not None:
+        ax.axhline(reference, color="k", linestyle="--", label="reference")
+    ax.set_xscale("log")
+    ax.set_xlabel("Number of samples")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    return fig
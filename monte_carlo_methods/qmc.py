@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Randomized quasi-Monte Carlo sample sources: scrambled Sobol and Halton
+sequences. Their points fill [0, 1)^d much more evenly than pseudo-random
+ones, so for smooth low-dimensional integrands the error decreases almost
+like O(1/n) instead of O(1/sqrt(n)). Randomizing the sequence (scrambling)
+keeps the estimates unbiased, and independent scrambles give error bars.
+
+QMCSource has the uniform/normal/random methods of np.random.Generator, so
+it can be passed as the rng of the samplers (the points of the sequence are
+consumed in order), and the proposals are obtained by inverse-CDF transforms
+(e.g. norm_ppf). qmc_sampler makes a sample_g(rng, n) for the importance
+samplers of streaming_importance_sampling.py: each call (each chunk) draws
+from an independent scramble seeded by rng.
+"""
+import numpy as np
+
+
+# Joe & Kuo (new-joe-kuo-6.21201) direction numbers of the dimensions 2 to
+# 10: degree s, coefficients a of the primitive polynomial, initial m_k
+SOBOL_PARAMETERS = [(1, 0, [1]),
+                    (2, 1, [1, 3]),
+                    (3, 1, [1, 3, 1]),
+                    (3, 2, [1, 1, 1]),
+                    (4, 1, [1, 1, 3, 3]),
+                    (4, 4, [1, 3, 5, 13]),
+                    (5, 2, [1, 1, 5, 5, 17]),
+                    (5, 4, [1, 1, 5, 5, 5]),
+                    (5, 7, [1, 1, 7, 11, 19])]
+PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53]
+N_BITS = 32
+
+
+def sobol_direction_numbers(dim):
+    # (dim, N_BITS) direction numbers v_k = m_k/2**k stored as integers
+    # (first bit = most significant bit)
+    if dim > len(SOBOL_PARAMETERS) + 1:
+        raise ValueError(f"Sobol sequences available up to dimension "
+                         f"{len(SOBOL_PARAMETERS) + 1}")
+    V = np.zeros((dim, N_BITS), dtype=np.uint64)
+    V[0] = [1 << (N_BITS-1-k) for k in range(N_BITS)]  # van der Corput
+    for d in range(1, dim):
+        s, a, m = SOBOL_PARAMETERS[d-1]
+        m = list(m)
+        for k in range(s, N_BITS):
+            new_m = m[k-s] ^ (m[k-s] << s)
+            for j in range(1, s):
+                if (a >> (s-1-j)) & 1:
+                    new_m ^= m[k-j] << j
+            m.append(new_m)
+        V[d] = [m[k] << (N_BITS-1-k) for k in range(N_BITS)]
+    return V
+
+def linear_matrix_scramble(V, rng):
+    # Multiply the direction numbers (seen as columns of bits) by a random
+    # lower triangular binary matrix with unit diagonal (Matousek)
+    positions = np.arange(N_BITS-1, -1, -1, dtype=np.uint64)
+    scrambled = np.zeros_like(V)
+    for d in range(V.shape[0]):
+        L = (np.tril(rng.integers(2, size=(N_BITS, N_BITS)), -1)
+             + np.eye(N_BITS, dtype=int))
+        bits = (V[d][:, None] >> positions) & np.uint64(1)  # (k, bit)
+        new_bits = (bits.astype(int) @ L.T) % 2
+        scrambled[d] = (new_bits.astype(np.uint64) << positions).sum(axis=1)
+    return scrambled
+
+def sobol_points(V, start, n, shift=None):
+    # Points start, ..., start+n-1 of the (scrambled) Sobol sequence:
+    # x_i = xor of the v_k for the bits k of i (xor digital shift)
+    i = np.arange(start, start+n, dtype=np.uint64)
+    x = np.zeros((n, V.shape[0]), dtype=np.uint64)
+    for k in range(N_BITS):
+        bit = ((i >> np.uint64(k)) & np.uint64(1)).astype(bool)
+        x[bit] ^= V[:, k]
+    if shift is not None:
+        x ^= shift
+    return (x.astype(float) + 0.5*(shift is not None))/2.0**N_BITS
+
+def halton_points(permutations, start, n):
+    # Points start, ..., start+n-1 of the Halton sequence: radical inverse of
+    # i in the base of each dimension, the digits being randomly permuted
+    # (one permutation per digit position) if permutations are given
+    i = np.arange(start, start+n)
+    x = np.zeros((n, len(permutations)))
+    for d, digit_permutations in enumerate(permutations):
+        base = PRIMES[d]
+        q = i.copy()
+        scale = 1/base
+        for perm in digit_permutations:
+            x[:, d] += perm[q % base]*scale
+            q //= base
+            scale /= base
+    return x
+
+def norm_ppf(u):
+    # Inverse CDF of the standard normal distribution (Acklam's rational
+    # approximation, relative error < 1.2e-9)
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+         3.754408661907416e+00]
+    u = np.asarray(u, dtype=float)
+    x = np.empty_like(u)
+    low = u < 0.02425
+    high = u > 1 - 0.02425
+    mid = ~(low | high)
+    q = np.sqrt(-2*np.log(np.where(low, u, 1 - u)[low | high]))
+    tail = (((((c[0]*q+c[1])*q+c[2])*q+c[3])*q+c[4])*q+c[5]) / \
+        ((((d[0]*q+d[1])*q+d[2])*q+d[3])*q+1)
+    x[low | high] = np.where(low[low | high], tail, -tail)
+    q = u[mid] - 0.5
+    r = q*q
+    x[mid] = (((((a[0]*r+a[1])*r+a[2])*r+a[3])*r+a[4])*r+a[5])*q / \
+        (((((b[0]*r+b[1])*r+b[2])*r+b[3])*r+b[4])*r+1)
+    return x
+
+
+class QMCSource:
+    # Randomized Sobol or Halton points in dimension dim, consumed in order.
+    # engine="sobol" (linear matrix scrambling + digital shift),
+    # engine="halton" (random digit permutations) or engine="random"
+    # (pseudo-random, for comparisons).
+    def __init__(self, dim=1, engine="sobol", scramble=True, seed=None):
+        self.dim = dim
+        self.engine = engine
+        self.scramble = scramble
+        self.index = 0
+        self.seed_sequence = (seed if isinstance(seed, np.random.SeedSequence)
+                              else np.random.SeedSequence(seed))
+        rng = np.random.default_rng(self.seed_sequence)
+        self.rng = rng
+        if engine == "sobol":
+            self.V = sobol_direction_numbers(dim)
+            self.shift = None
+            if scramble:
+                self.V = linear_matrix_scramble(self.V, rng)
+                self.shift = rng.integers(0, 2**N_BITS, size=dim,
+                                          dtype=np.uint64)
+        elif engine == "halton":
+            if dim > len(PRIMES):
+                raise ValueError(f"Halton sequences available up to dimension "
+                                 f"{len(PRIMES)}")
+            # Enough digits for double precision
+            self.permutations = [
+                [rng.permutation(p) if scramble else np.arange(p)
+                 for _ in range(int(np.ceil(53*np.log(2)/np.log(p))))]
+                for p in PRIMES[:dim]]
+        elif engine != "random":
+            raise ValueError(f"Unknown engine {engine}")
+
+    def spawn(self, n):
+        # n independent scrambles of the same sequence
+        return [QMCSource(self.dim, self.engine, self.scramble, seed)
+                for seed in self.seed_sequence.spawn(n)]
+
+    def random(self, size=None):
+        # Next points in [0, 1): size=n gives (n, ) if dim is 1 and (n, dim)
+        # otherwise, size=(n, dim) gives (n, dim)
+        n = 1 if size is None else np.atleast_1d(size)[0]
+        if self.engine == "sobol":
+            x = sobol_points(self.V, self.index, n, self.shift)
+        elif self.engine == "halton":
+            x = halton_points(self.permutations, self.index, n)
+        else:
+            x = self.rng.uniform(size=(n, self.dim))
+        self.index += n
+        if size is None:
+            return x[0, 0] if self.dim == 1 else x[0]
+        if self.dim == 1 and np.ndim(size) == 0:
+            return x[:, 0]
+        return x
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + (high - low)*self.random(size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        return loc + scale*norm_ppf(self.random(size))
+
+
+def rqmc_estimate(integrand, n, dim=1, n_scrambles=16, engine="sobol",
+                  seed=None):
+    # Mean of integrand(u) over n points of n_scrambles independent
+    # scrambles (u of shape (n, dim)). The standard error comes from the
+    # spread between the scrambles.
+    sources = QMCSource(dim, engine, seed=seed).spawn(n_scrambles)
+    means = np.array([np.mean(integrand(source.random((n, dim))))
+                      for source in sources])
+    return means.mean(), means.std(ddof=1)/np.sqrt(n_scrambles)
+
+def qmc_sampler(ppf, dim=1, engine="sobol"):
+    # sample_g(rng, n) of iter_importance_sampling: ppf(u) for the first n
+    # points u of a new scramble seeded by rng (shape (n, ) if dim is 1 and
+    # (n, dim) otherwise), so that the chunks are independent RQMC
+    # replicates (chunk sizes are best powers of 2 for Sobol points). The
+    # standard errors of iter_importance_sampling treat the points as
+    # independent, which overestimates the error of QMC points
+    def sample_g(rng, n):
+        source = QMCSource(dim, engine, seed=rng.integers(2**63))
+        return ppf(source.random(n))
+    return sample_g
+
+if __name__ == "__main__":
+    # Convergence of the importance sampling estimate of
+    # importance_sampling.py (f = Laplace(1.5, 1), h(x) = 0.1*sin(x-1-(1.5-2)))
+    # with a N(mu, std) proposal, pseudo-random (MC) vs randomized QMC: 16
+    # chunks of n points, each one from an independent scramble.
+    # With N(0, 1), f**2/g isn't integrable (the weights have an infinite
+    # variance): neither of them converges nicely
+    from .streaming_importance_sampling import importance_sampling
+    mu_laplace = 1.5
+    b_laplace = 1
+    log_f = lambda x: -np.log(2*b_laplace) - np.abs(x-mu_laplace)/b_laplace
+    h = lambda x: 0.1*np.sin(x-1-(mu_laplace-2))
+    xs = np.linspace(-30, 30, 600001)
+    reference = np.sum(np.exp(log_f(xs))*h(xs))*(xs[1]-xs[0])
+
+    for mu, std in [(0, 1), (1.5, 2)]:
+        log_g = lambda x: -0.5*np.log(2*np.pi*std**2) - (x-mu)**2/(2*std**2)
+        ppf_g = lambda u: mu + std*norm_ppf(u)
+        print(f"Proposal N({mu}, {std}):")
+        for m in range(6, 19, 3):
+            n = 2**m
+            errors = []
+            for engine in ["random", "sobol", "halton"]:
+                result = importance_sampling(log_f, log_g,
+                                             qmc_sampler(ppf_g, engine=engine),
+                                             h, chunk_size=n,
+                                             max_samples=16*n, seed=0)
+                errors.append(f"{engine} "
+                              f"{abs(result['estimate']-reference):.1e}")
+            print(f"  n=2^{m}: errors " + ", ".join(errors))
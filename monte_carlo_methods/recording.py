@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Recording of MCMC/Ising trajectories without keeping every state in memory:
+
+    - Snapshots of the state every `every` records, stored as floats, int8
+      or bit-packed spins (+1 -> 1, -1 -> 0), in RAM or in a memory-mapped
+      .npy file for runs bigger than RAM
+    - Streaming observables (energy, magnetization, acceptance, ...):
+      running mean/variance and autocorrelation up to some lag, computed
+      on the fly
+"""
+import numpy as np
+
+
+def autocorrelation(x, max_lag=None):
+    # Normalized autocorrelation of a 1D series (computed with the FFT)
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    max_lag = n-1 if max_lag is None else min(max_lag, n-1)
+    x = x - x.mean()
+    f = np.fft.rfft(x, n=2*n)
+    acf = np.fft.irfft(f*np.conj(f))[:max_lag+1]
+    return acf/acf[0] if acf[0] > 0 else np.ones_like(acf)
+
+def integrated_autocorr_time(rho, c=5):
+    # tau = 1 + 2 sum_k rho(k), summed up to the first lag k >= c*tau(k)
+    # (Sokal's automatic window) to not add up the noise of the tail
+    taus = 2*np.cumsum(rho) - 1
+    window = np.arange(len(taus)) >= c*taus
+    k = np.argmax(window) if np.any(window) else len(taus)-1
+    return max(taus[k], 1.0)
+
+
+class RunningStats:
+    # Streaming mean, variance and autocorrelation (up to max_lag) of a
+    # scalar or array valued observable, using the last max_lag values only.
+    # Values are buffered and the sums are updated batch_size values at a
+    # time (vectorized over the batch), so an update is a list append.
+    def __init__(self, max_lag=100, batch_size=1024):
+        self.max_lag = max_lag
+        self.batch_size = batch_size
+        self.n = 0
+        self._mean = 0.0
+        self._M2 = 0.0
+        self._buffer = []
+        self.tail = None  # last max_lag values before the buffer
+        self.lagged_products = None  # sum_t x_t*x_{t-k}
+        self.lagged_sums = None  # sum_t x_t and sum_t x_{t-k}
+
+    def update(self, x):
+        self._buffer.append(x)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        block = np.asarray(self._buffer, dtype=float)
+        self._buffer = []
+        if self.lagged_products is None:
+            self.tail = np.empty((0, ) + block.shape[1:])
+            self.lagged_products = np.zeros((self.max_lag+1, ) + block.shape[1:])
+            self.lagged_sums = np.zeros((2, self.max_lag+1) + block.shape[1:])
+        # Mean and M2 of the batch merged with the running ones (Chan et al.)
+        m = len(block)
+        n = self.n + m
+        block_mean = block.mean(axis=0)
+        delta = block_mean - self._mean
+        self._mean = self._mean + delta*m/n
+        self._M2 = (self._M2 + np.sum((block - block_mean)**2, axis=0)
+                    + delta**2*self.n*m/n)
+        # Pairs (x_t, x_{t-k}) with x_t in the batch and t-k >= 0: lag k
+        # pairs the batch with the window of the previous values starting
+        # max_lag-k before it (zeros before the first value)
+        K = min(self.max_lag, n-1) + 1
+        previous = np.concatenate([np.zeros((self.max_lag - len(self.tail), )
+                                            + block.shape[1:]),
+                                   self.tail, block])
+        windows = np.lib.stride_tricks.sliding_window_view(
+            previous, m, axis=0)[::-1][:K]
+        self.lagged_products[:K] += np.einsum("k...i,i...->k...", windows,
+                                              block)
+        self.lagged_sums[1, :K] += windows.sum(axis=-1)
+        prefix = np.concatenate([np.zeros((1, ) + block.shape[1:]),
+                                 np.cumsum(block, axis=0)])
+        skipped = np.clip(np.arange(K) - self.n, 0, m)
+        self.lagged_sums[0, :K] += prefix[m] - prefix[skipped]
+        self.tail = previous[len(previous)-self.max_lag:]
+        self.n = n
+
+    @property
+    def mean(self):
+        self.flush()
+        return self._mean
+
+    @property
+    def var(self):
+        self.flush()
+        return self._M2/max(self.n - 1, 1)
+
+    def autocorrelation(self):
+        self.flush()
+        lags = np.arange(min(self.n, self.max_lag+1))
+        counts = (self.n - lags).reshape((-1, ) + (1, )*np.ndim(self.mean))
+        cov = (self.lagged_products[lags]/counts
+               - self.lagged_sums[0, lags]*self.lagged_sums[1, lags]/counts**2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(cov[0] > 0, cov/cov[0], 1.0)
+
+    def integrated_autocorr_time(self):
+        rho = self.autocorrelation()
+        if rho.ndim == 1:
+            return integrated_autocorr_time(rho)
+        return np.reshape([integrated_autocorr_time(r)
+                           for r in rho.reshape(len(rho), -1).T],
+                          rho.shape[1:])
+
+    def summary(self):
+        tau = self.integrated_autocorr_time()
+        return {"mean": self.mean, "std": np.sqrt(self.var),
+                "tau": tau, "ess": self.n/tau}
+
+
+class Recorder:
+    # Records a trajectory: call record(state, **observables) once per step
+    # (or sweep). The state is stored every `every` calls (never if
+    # n_snapshots is 0) as:
+    #   - storage="float": as is (for continuous states)
+    #   - storage="int8": spins as int8
+    #   - storage="packbits": 1 bit per spin (s > 0)
+    # in RAM, or in the memory-mapped .npy file `path` if given. By default
+    # (storage=None) it depends on the first state: int8 for integer or
+    # boolean states in the int8 range, float otherwise. A state that the
+    # storage can't represent exactly (e.g. 0.7 as int8) raises a
+    # ValueError instead of being truncated.
+    # The state can be given as a function returning it so that it is
+    # only built when a snapshot is taken.
+    def __init__(self, shape, n_snapshots=0, every=1, storage=None,
+                 path=None, max_lag=100):
+        if storage not in (None, "float", "int8", "packbits"):
+            raise ValueError(f"Unknown storage {storage}")
+        self.shape = tuple(shape)
+        self.every = every
+        self.storage = storage
+        self.path = path
+        self.n_records = 0
+        self.n_snapshots = 0
+        self.capacity = n_snapshots
+        self.stats = {}
+        self.max_lag = max_lag
+        self.snapshots = None
+        if storage is not None:
+            self._allocate()
+
+    def _allocate(self):
+        size = int(np.prod(self.shape))
+        if self.storage == "packbits":
+            dtype, row_shape = np.uint8, ((size + 7)//8, )
+        elif self.storage == "int8":
+            dtype, row_shape = np.int8, self.shape
+        else:
+            dtype, row_shape = float, self.shape
+        if self.path is None:
+            self.snapshots = np.empty((self.capacity, ) + row_shape,
+                                      dtype=dtype)
+        else:
+            self.snapshots = np.lib.format.open_memmap(
+                self.path, mode="w+", dtype=dtype,
+                shape=(self.capacity, ) + row_shape)
+
+    def _check(self, state):
+        if self.storage is None:
+            integral = (state.dtype.kind in "biu" and
+                        (state.size == 0 or (state.min() >= -128
+                                             and state.max() <= 127)))
+            self.storage = "int8" if integral else "float"
+            self._allocate()
+        if self.storage == "float" or state.dtype.kind == "b":
+            return
+        if self.storage == "packbits":
+            exact = np.all(np.abs(state) == 1)
+        else:
+            exact = np.array_equal(state, state.astype(np.int8))
+        if not exact:
+            raise ValueError(f"State not representable with storage="
+                             f"{self.storage!r} (use storage='float')")
+
+    def wants_state(self):
+        # True if the next record will store a snapshot
+        return (self.n_records % self.every == 0
+                and self.n_snapshots < self.capacity)
+
+    def record(self, state=None, **observables):
+        if self.wants_state():
+            state = state() if callable(state) else state
+            state = np.asarray(state).reshape(self.shape)
+            self._check(state)
+            if self.storage == "packbits":
+                self.snapshots[self.n_snapshots] = np.packbits(state.ravel() > 0)
+            else:
+                self.snapshots[self.n_snapshots] = state
+            self.n_snapshots += 1
+        for name, value in observables.items():
+            if name not in self.stats:
+                self.stats[name] = RunningStats(self.max_lag)
+            self.stats[name].update(value)
+        self.n_records += 1
+
+    def snapshot(self, i):
+        # Decoded i-th snapshot (spins in {-1, 1} for packbits)
+        i = range(self.n_snapshots)[i]
+        if self.storage == "packbits":
+            bits = np.unpackbits(self.snapshots[i],
+                                 count=int(np.prod(self.shape)))
+            return (2*bits.astype(np.int8) - 1).reshape(self.shape)
+        return np.asarray(self.snapshots[i])
+
+    def summary(self):
+        return {name: stats.summary() for name, stats in self.stats.items()}
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Resampling schemes for sampling importance resampling (and particle
+filters). They all take (unnormalized) log-weights and return the indices of
+the resampled particles, so that paired arrays can be resampled with
+samples[indices] without copying them in the loop. Each scheme is O(n): one
+cumulative sum of the weights and one searchsorted.
+
+    - multinomial: n i.i.d. draws from the normalized weights
+    - stratified: one uniform draw in each [i/n, (i+1)/n)
+    - systematic: the same uniform offset in each [i/n, (i+1)/n)
+    - residual: floor(n*w_i) copies of each particle, the rest multinomial
+"""
+import numpy as np
+
+
+def normalize_log_weights(log_weights):
+    # Normalized weights from log-weights (log-sum-exp: no overflow)
+    log_weights = np.asarray(log_weights, dtype=float)
+    weights = np.exp(log_weights - log_weights.max())
+    return weights/weights.sum()
+
+def effective_sample_size(log_weights):
+    # ESS = (sum w)^2/sum w^2
+    weights = normalize_log_weights(log_weights)
+    return 1/np.sum(weights**2)
+
+def _search(weights, us):
+    # Indices i such that cumsum(w)[i-1] <= u < cumsum(w)[i]
+    cumulative = np.cumsum(weights)
+    cumulative[-1] = 1  # avoid rounding errors on the last one
+    return np.searchsorted(cumulative, us, side="right")
+
+def multinomial(log_weights, n=None, rng=None):
+    rng = np.random if rng is None else rng
+    weights = normalize_log_weights(log_weights)
+    n = len(weights) if n is None else n
+    # Sorted uniforms in O(n) from normalized cumulated exponential
+    # spacings (searching sorted values is much more cache friendly)
+    us = np.cumsum(rng.exponential(size=n+1))
+    return _search(weights, us[:-1]/us[-1])
+
+def stratified(log_weights, n=None, rng=None):
+    rng = np.random if rng is None else rng
+    weights = normalize_log_weights(log_weights)
+    n = len(weights) if n is None else n
+    return _search(weights, (np.arange(n) + rng.uniform(size=n))/n)
+
+def systematic(log_weights, n=None, rng=None):
+    rng = np.random if rng is None else rng
+    weights = normalize_log_weights(log_weights)
+    n = len(weights) if n is None else n
+    # No search needed: the number of points (k + u)/n below cumsum(w)[i]
+    # is ceil(n*cumsum(w)[i] - u)
+    cumulative = np.cumsum(weights)
+    cumulative[-1] = 1
+    below = np.clip(np.ceil(n*cumulative - rng.uniform()), 0, n).astype(int)
+    return np.repeat(np.arange(len(weights)), np.diff(below, prepend=0))
+
+def residual(log_weights, n=None, rng=None):
+    rng = np.random if rng is None else rng
+    weights = normalize_log_weights(log_weights)
+    n = len(weights) if n is None else n
+    copies = np.floor(n*weights).astype(int)
+    deterministic = np.repeat(np.arange(len(weights)), copies)
+    n_rest = n - len(deterministic)
+    if n_rest == 0:
+        return deterministic
+    rest = n*weights - copies
+    us = np.cumsum(rng.exponential(size=n_rest+1))
+    random = _search(rest/rest.sum(), us[:-1]/us[-1])
+    return np.concatenate([deterministic, random])
+
+SCHEMES = {"multinomial": multinomial,
+           "stratified": stratified,
+           "systematic": systematic,
+           "residual": residual}
+
+def resample(log_weights, n=None, scheme="systematic", rng=None):
+    # Indices of the resampled particles with the given scheme
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown resampling scheme {scheme}")
+    return SCHEMES[scheme](log_weights, n=n, rng=rng)
+
+
+if __name__ == "__main__":
+    import time
+    n = 10**7
+    log_weights = np.random.normal(size=n)
+    print(f"ESS: {effective_sample_size(log_weights):.4g} out of {n}")
+    for scheme in SCHEMES:
+        start = time.perf_counter()
+        indices = resample(log_weights, scheme=scheme)
+        print(f"{scheme}: {time.perf_counter()-start:.3f} s for {n} particles")
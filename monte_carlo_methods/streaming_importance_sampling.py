@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming importance sampling: E_f[h] is estimated from samples of a
+proposal g processed in chunks of fixed size, so the number of samples isn't
+limited by the memory. Only running weighted sums are kept, shifted by the
+running maximum log-weight (log-sum-exp trick) so that weights
+w = f/g = exp(log f - log g) never overflow.
+
+After each chunk we get:
+    - the (unnormalized) importance sampling estimate 1/n sum w_i h(x_i)
+      (f must be normalized) with its standard error
+    - the self-normalized estimate sum w_i h(x_i)/sum w_i (f can be
+      unnormalized) with its (delta method) standard error
+    - the effective sample size (sum w_i)^2/sum w_i^2
+and we can stop as soon as the relative standard error is below rtol.
+
+Chunk k always uses the random stream SeedSequence(seed, spawn_key=(k, )),
+so the results only depend on the seed and the chunk size, also when the
+chunks are computed by a pool of threads or processes.
+"""
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+def chunk_sums(log_f, log_g, sample_g, h, chunk_size, seed, k):
+    # Shift and weighted sums of the k-th chunk. If all the samples have a
+    # zero target density (log_f = -inf), the sums are zero and the shift
+    # -inf (the chunk contributes nothing, see merge_sums)
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(k, )))
+    x = sample_g(rng, chunk_size)
+    log_w = log_f(x) - log_g(x)
+    shift = np.max(log_w)
+    if shift == -np.inf:
+        return shift, np.zeros(5)
+    w = np.exp(log_w - shift)
+    h_x = h(x)
+    sums = np.array([np.sum(w), np.sum(w*h_x),
+                     np.sum(w**2), np.sum(w**2*h_x), np.sum(w**2*h_x**2)])
+    return shift, sums
+
+def merge_sums(shift, sums, chunk_shift, chunk_sums):
+    # Sums of w (S0, S1) scale as exp(shift), sums of w**2 as exp(2*shift).
+    # A shift of -inf (no sample so far, or a chunk of zero weights) holds
+    # zero sums: exp(-inf - (-inf)) would be nan
+    if chunk_shift == -np.inf:
+        return shift, sums
+    if shift == -np.inf:
+        return chunk_shift, chunk_sums
+    new_shift = max(shift, chunk_shift)
+    powers = np.array([1, 1, 2, 2, 2])
+    return new_shift, (sums*np.exp(powers*(shift - new_shift))
+                       + chunk_sums*np.exp(powers*(chunk_shift - new_shift)))
+
+def estimates(n, shift, sums):
+    # As long as all the weights are zero (shift = -inf), the unnormalized
+    # estimate is 0, the self-normalized one and the ESS are nan
+    S0, S1, S2, S3, S4 = sums
+    mean_wh = S1/n
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        snis = S1/S0
+        scale = np.exp(shift)
+        return {"n": n,
+                "estimate": scale*mean_wh,
+                "se": scale*np.sqrt(max(S4/n - mean_wh**2, 0)/n),
+                "snis_estimate": snis,
+                "snis_se": np.sqrt(max(S4 - 2*snis*S3 + snis**2*S2, 0))/S0,
+                "ess": S0**2/S2,
+                "log_Z": shift + np.log(S0/n)}
+
+def iter_importance_sampling(log_f,
+                             log_g,
+                             sample_g,
+                             h,
+                             chunk_size=10**6,
+                             max_samples=10**9,
+                             rtol=None,
+                             self_normalized=True,
+                             seed=None,
+                             n_workers=1,
+                             executor="thread"):
+    # log_f, log_g: log-densities of the target and of the proposal,
+    # sample_g(rng, n): n samples of the proposal, h: the function whose
+    # expectation under f is estimated (all of them vectorized).
+    # Yields the estimates (see estimates) after each chunk, stops after
+    # max_samples samples or when se/|estimate| < rtol (for the
+    # self-normalized estimate or the unnormalized one).
+    # With n_workers > 1, chunks are computed by a pool of threads or
+    # processes (executor="process" needs picklable functions). The last
+    # chunk is clipped so that no more than max_samples samples are drawn.
+    seed = np.random.SeedSequence(seed).entropy
+    n_chunks = -(-max_samples//chunk_size)
+    shift, sums = -np.inf, np.zeros(5)
+    n = 0
+
+    pool = None
+    if n_workers > 1:
+        pool = (ThreadPoolExecutor if executor == "thread"
+                else ProcessPoolExecutor)(max_workers=n_workers)
+    try:
+        for first in range(0, n_chunks, max(n_workers, 1)):
+            ks = range(first, min(first + max(n_workers, 1), n_chunks))
+            args = [(log_f, log_g, sample_g, h,
+                     min(chunk_size, max_samples - k*chunk_size), seed, k)
+                    for k in ks]
+            if pool is None:
+                results = [chunk_sums(*arg) for arg in args]
+            else:
+                results = list(pool.map(chunk_sums, *zip(*args)))
+            # Merged in order: same results whatever the number of workers
+            for arg, (chunk_shift, chunk) in zip(args, results):
+                shift, sums = merge_sums(shift, sums, chunk_shift, chunk)
+                n += arg[4]
+                result = estimates(n, shift, sums)
+                yield result
+                key = "snis_" if self_normalized else ""
+                if (rtol is not None and result[key + "se"]
+                        < rtol*abs(result[key + "estimate"])):
+                    return
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+def importance_sampling(*args, **kwargs):
+    # Last estimates of iter_importance_sampling
+    result = None
+    for result in iter_importance_sampling(*args, **kwargs):
+        pass
+    if result is None:
+        raise ValueError("No samples were drawn (max_samples must be > 0)")
+    return result
+
+
+if __name__ == "__main__":
+    # Same example as importance_sampling.py: f = Laplace(1.5, 1),
+    # g = N(0, 1), h(x) = 0.1*sin(x-1-(1.5-2))
+    mu_laplace = 1.5
+    b_laplace = 1
+    log_f = lambda x: -np.log(2*b_laplace) - np.abs(x-mu_laplace)/b_laplace
+    log_g = lambda x: -0.5*np.log(2*np.pi) - x**2/2
+    sample_g = lambda rng, n: rng.normal(size=n)
+    h = lambda x: 0.1*np.sin(x-1-(mu_laplace-2))
+
+    xs = np.linspace(-30, 30, 600001)
+    print(f"Reference: {np.sum(np.exp(log_f(xs))*h(xs))*(xs[1]-xs[0]):.6f}")
+    for result in iter_importance_sampling(log_f, log_g, sample_g, h,
+                                           chunk_size=10**6, rtol=1e-2,
+                                           seed=0, n_workers=2):
+        print(f"n={result['n']:,}: "
+              f"{result['estimate']:.6f} +- {result['se']:.1e}, "
+              f"self-normalized {result['snis_estimate']:.6f} "
+              f"+- {result['snis_se']:.1e}, ESS={result['ess']:.3g}")
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+Population growth models (with and without maximum capacity) and their
+numerical integration, see single_population_growth.py.
+
+Importing the package or its modules only needs numpy: figures are made by
+the __main__ demo and by plotting.py, which import matplotlib when called.
+Experiments run headless from the command line, see __main__.py:
+
+    python -m single_population_growth growth --method runge_kutta \
+        --output-dir results/growth
+"""
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Headless experiments of the population growth models.
+
+    python -m single_population_growth growth --model max-capacity \
+        --method runge_kutta --delta-t 0.1 --output-dir results/growth
+    python -m single_population_growth ensemble --scenarios 1000 \
+        --seed 0 --output-dir results/ensemble --plot
+
+Each experiment writes {experiment}.npz (arrays) and {experiment}.json
+(parameters and summary) in the output directory, plus {experiment}.png
+with --plot (the only case where matplotlib is imported).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+
+def _save(args, summary, **arrays):
+    name = os.path.join(args.output_dir, args.experiment)
+    if arrays:
+        np.savez(name + ".npz", **arrays)
+    parameters = {key: value for key, value in vars(args).items()
+                  if key not in ("run", "output_dir", "plot")}
+    with open(name + ".json", "w") as file:
+        json.dump({"parameters": parameters, "summary": summary}, file,
+                  indent=2)
+    return name
+
+def _growth(args):
+    # One initial population, numerical solution against the exact one
+    from .single_population_growth import (euler, runge_kutta, dormand_prince,
+                                           time_grid, P_simple, P_max_capacity,
+                                           slope_simple, slope_max_capacity)
+    if args.model == "simple":
+        slope = lambda P: slope_simple(P, args.r)
+        exact = lambda ts: P_simple(ts, args.P0, args.r)
+    else:
+        slope = lambda P: slope_max_capacity(P, args.r, args.M)
+        exact = lambda ts: P_max_capacity(ts, args.P0, args.r, args.M)
+    start = time.perf_counter()
+    if args.method == "dormand_prince":
+        ts, Ps, logs = dormand_prince(time_grid(args.tmax, args.delta_t),
+                                      args.P0, slope, rtol=args.rtol)
+    else:
+        method = euler if args.method == "euler" else runge_kutta
+        ts, Ps, logs = method(np.array([0, args.tmax]), args.P0, slope,
+                              delta_t=args.delta_t)
+    elapsed = time.perf_counter() - start
+    ts, Ps = np.asarray(ts, dtype=float), np.asarray(Ps, dtype=float)
+    error = np.abs(Ps - exact(ts))
+    summary = {"P_final": Ps[-1], "max_error": np.max(error),
+               "max_relative_error": np.max(error/np.abs(exact(ts))),
+               "seconds": elapsed}
+    name = _save(args, summary, ts=ts, Ps=Ps)
+    if args.plot:
+        from .plotting import plot_growth
+        plot_growth(name + ".png", ts, Ps, exact(ts), label=args.method,
+                    title=f"{args.model}, $P_0$={args.P0}, $r$={args.r}")
+    return summary
+
+def _ensemble(args):
+    # Random scenarios (P0, r) of the model with maximum capacity, all
+    # integrated at once
+    from .single_population_growth import (euler_ensemble,
+                                           runge_kutta_ensemble,
+                                           P_max_capacity, slope_max_capacity)
+    rng = np.random.default_rng(args.seed)
+    P0s = rng.uniform(0.01, 1, size=args.scenarios)*args.M
+    rs = rng.uniform(args.r_min, args.r_max, size=args.scenarios)
+    method = euler_ensemble if args.method == "euler" else runge_kutta_ensemble
+    start = time.perf_counter()
+    ts, Ps, logs = method(np.array([0, args.tmax]), P0s, slope_max_capacity,
+                          delta_t=args.delta_t, r=rs, M=args.M)
+    elapsed = time.perf_counter() - start
+    exact = P_max_capacity(ts[:, None], P0s, rs, args.M)
+    summary = {"max_relative_error": np.max(np.abs(Ps - exact))/args.M,
+               "mean_P_final": np.mean(Ps[-1]),
+               "scenario_steps_per_s": Ps.size/elapsed}
+    name = _save(args, summary, ts=ts, Ps=Ps, P0s=P0s, rs=rs)
+    if args.plot:
+        from .plotting import plot_growth
+        shown = slice(0, min(args.scenarios, 20))
+        plot_growth(name + ".png", ts, Ps[:, shown], exact[:, shown],
+                    title=f"{args.method}, first scenarios")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m single_population_growth",
+                                     description=__doc__.split("\n\n")[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--seed", type=int, default=0,
+                        help="seed of the random scenarios (ensemble)")
+    common.add_argument("--output-dir", default=".")
+    common.add_argument("--plot", action="store_true",
+                        help="also save a figure (imports matplotlib)")
+    common.add_argument("--M", type=float, default=0.65*1.5,
+                        help="maximum capacity")
+    common.add_argument("--tmax", type=float, default=4.0)
+    common.add_argument("--delta-t", type=float, default=0.5)
+    experiments = parser.add_subparsers(dest="experiment", required=True)
+
+    growth = experiments.add_parser("growth", parents=[common],
+                                    help="one initial population")
+    growth.add_argument("--model", choices=["simple", "max-capacity"],
+                        default="max-capacity")
+    growth.add_argument("--method", default="runge_kutta",
+                        choices=["euler", "runge_kutta", "dormand_prince"])
+    growth.add_argument("--P0", type=float, default=0.12)
+    growth.add_argument("--r", type=float, default=2.0)
+    growth.add_argument("--rtol", type=float, default=1e-6,
+                        help="relative tolerance (dormand_prince)")
+    growth.set_defaults(run=_growth)
+
+    ensemble = experiments.add_parser("ensemble", parents=[common],
+                                      help="random scenarios of the model "
+                                           "with maximum capacity")
+    ensemble.add_argument("--method", choices=["euler", "runge_kutta"],
+                          default="runge_kutta")
+    ensemble.add_argument("--scenarios", type=int, default=1000)
+    ensemble.add_argument("--r-min", type=float, default=0.5)
+    ensemble.add_argument("--r-max", type=float, default=3.0)
+    ensemble.set_defaults(run=_ensemble)
+
+    args = parser.parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary = args.run(args)
+    print(", ".join(f"{key}={value:.6g}" if isinstance(value, float)
+                    else f"{key}={value}" for key, value in summary.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Figures of the command line experiments (__main__.py), drawn on
+matplotlib.figure.Figure without pyplot (no GUI backend needed).
+matplotlib is only imported when this module is.
+"""
+from matplotlib.figure import Figure
+
+
+def plot_growth(path, ts, Ps, exact=None, label=None, title=None):
+    # Numerical solution(s) (Ps: one column per scenario) and the exact
+    # one(s) on the same times if given
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    ax.plot(ts, Ps, ".-", label=label)
+    if exact is not None:
+        ax.plot(ts, exact, "k--", linewidth=0.8, label="exact")
+    ax.set_xlabel(r"$t$")
+    ax.set_ylabel(r"$P(t)$")
+    if label is not None:
+        ax.legend()
+    if title is not None:
+        ax.set_title(title)
+    fig.tight_layout()
+    fig.savefig(path)
+    return fig
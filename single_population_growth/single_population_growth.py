@@ -13,7 +13,6 @@ that use either the Euler method or the Runge Kutta (order 2)
 method
 """
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 def P_simple(t, P0, r):
@@ -29,46 +28,287 @@ def P_max_capacity(t, P0, r, M):
     # dP/dt = r*(1-P/M)*P where M is the maximum capacity
     return M/(1+(M-P0)/P0*np.exp(-r*t))
 
-def euler(ts, P0, slope_func, delta_t=0.5):
+def slope_simple(P, r):
+    # dP/dt of the model without maximum capacity
+    return r*P
+
+def slope_max_capacity(P, r, M):
+    # dP/dt of the logistic differential equation
+    return r*(1-P/M)*P
+
+def time_grid(tmax, delta_t=0.5):
+    # Same times as the ones visited by euler and runge_kutta: t is
+    # accumulated (and not computed as i*delta_t) so that we get exactly
+    # the same number of steps and the same floating point values
+    ts = [0]
+    t = delta_t
+    while t <= tmax:
+        ts.append(t)
+        t += delta_t
+    return np.array(ts)
+
+def euler(ts, P0, slope_func, delta_t=0.5, instrument=None):
+    # instrument (see common/instrumentation.py) gets the number of slope
+    # evaluations, t and P after each step
     tmax = ts.max()
     ts_euler = [0]
     Ps_euler = [P0]
     t = delta_t
     logs = {"slopes": []}
+    if instrument is not None:
+        instrument.begin(method="euler")
     
     while t <= tmax:
         ts_euler.append(t)
         P = Ps_euler[-1]
-        new_P = P + delta_t*slope_func(P)
+        slope = slope_func(P)
+        new_P = P + delta_t*slope
         
         Ps_euler.append(new_P)
-        logs["slopes"].append(slope_func(P))
+        logs["slopes"].append(slope)
+        if instrument is not None:
+            instrument.count("slope_evals")
+            instrument.step(t=t, P=new_P)
         
         t += delta_t
         
+    if instrument is not None:
+        instrument.end(t=ts_euler[-1], P=Ps_euler[-1])
     return ts_euler, Ps_euler, logs
 
-def runge_kutta(ts, P0, slope_func, delta_t=0.5):
+def runge_kutta(ts, P0, slope_func, delta_t=0.5, instrument=None):
+    # Same instrument as euler (two slope evaluations per step)
     tmax = ts.max()
     ts_rgk = [0]
     Ps_rgk = [P0]
     t = delta_t
     logs = {"slopes": []}
+    if instrument is not None:
+        instrument.begin(method="runge_kutta")
     
     while t <= tmax:
         ts_rgk.append(t)
         P = Ps_rgk[-1]
-        P_tmp = P + delta_t*slope_func(P)  # just like in Euler
-        new_P = P + delta_t/2*(slope_func(P) + slope_func(P_tmp))
+        slope = slope_func(P)
+        P_tmp = P + delta_t*slope  # just like in Euler
+        new_P = P + delta_t/2*(slope + slope_func(P_tmp))
         
         Ps_rgk.append(new_P)
-        logs["slopes"].append(slope_func(P))
+        logs["slopes"].append(slope)
+        if instrument is not None:
+            instrument.count("slope_evals", 2)
+            instrument.step(t=t, P=new_P)
         
         t += delta_t
         
+    if instrument is not None:
+        instrument.end(t=ts_rgk[-1], P=Ps_rgk[-1])
     return ts_rgk, Ps_rgk, logs
 
+def integrate_stream(P0, slope_func, tmax, delta_t=0.5, method="euler",
+                     chunk_size=4096, every=1, log_slopes=False):
+    # Generator version of euler/runge_kutta with bounded memory: instead
+    # of returning the whole history, it yields chunks (ts, Ps) (or
+    # (ts, Ps, slopes) if log_slopes) of at most chunk_size rows, keeping
+    # only every `every`-th step. Drained to the end, the concatenated
+    # chunks are the same as the lists returned by euler/runge_kutta
+    # (slopes[i] is the slope at Ps[i], the one used to leave that state).
+    # P0 can be an array (element-wise slope_func) for an ensemble.
+    P = np.asarray(P0, dtype=float)
+    
+    def new_chunk():
+        return (np.empty(chunk_size), np.empty((chunk_size, ) + P.shape),
+                np.empty((chunk_size, ) + P.shape) if log_slopes else None)
+    
+    ts_chunk, Ps_chunk, slopes_chunk = new_chunk()
+    n = 0  # rows used in the current chunk
+    t = 0
+    step = 0
+    while True:
+        slope = None
+        if step % every == 0:
+            ts_chunk[n] = t
+            Ps_chunk[n] = P
+            if log_slopes:
+                slope = slope_func(P)
+                slopes_chunk[n] = slope
+            n += 1
+            if n == chunk_size:
+                yield (ts_chunk, Ps_chunk, slopes_chunk)[:3 if log_slopes else 2]
+                ts_chunk, Ps_chunk, slopes_chunk = new_chunk()
+                n = 0
+        
+        # Same time accumulation as in euler/runge_kutta
+        t = delta_t if step == 0 else t + delta_t
+        if t > tmax:
+            break
+        
+        if slope is None:
+            slope = slope_func(P)
+        if method == "euler":
+            P = P + delta_t*slope
+        elif method == "runge_kutta":
+            P_tmp = P + delta_t*slope
+            P = P + delta_t/2*(slope + slope_func(P_tmp))
+        else:
+            raise ValueError(f"Unknown method {method}")
+        step += 1
+    
+    if n > 0:
+        chunk = (ts_chunk[:n], Ps_chunk[:n],
+                 slopes_chunk[:n] if log_slopes else None)
+        yield chunk[:3 if log_slopes else 2]
+
+# Dormand-Prince 5(4) Butcher tableau (the last stage is evaluated at the
+# new point, so it is reused as the first stage of the next step: FSAL)
+DP_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1])
+DP_A = [[],
+        [1/5],
+        [3/40, 9/40],
+        [44/45, -56/15, 32/9],
+        [19372/6561, -25360/2187, 64448/6561, -212/729],
+        [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+        [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+DP_B = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0])
+# Difference between the 5th and the embedded 4th order solutions
+DP_E = np.array([71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525,
+                 -1/40])
+# Continuous extension (dense output of order 4): coefficients of
+# theta, theta^2, theta^3, theta^4 for each of the 7 stages
+DP_P = np.array([
+    [1, -8048581381/2820520608, 8663915743/2820520608,
+     -12715105075/11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200/32700410799, -68118460800/10900136933,
+     87487479700/32700410799],
+    [0, -1754552775/470086768, 14199869525/1410260304,
+     -10690763975/1880347072],
+    [0, 127303824393/49829197408, -318862633887/49829197408,
+     701980252875/199316789632],
+    [0, -282668133/205662961, 2019193451/616988883,
+     -1453857185/822651844],
+    [0, 40617522/29380423, -110615467/29380423, 69997945/29380423]])
+
+def dormand_prince(ts, P0, slope_func, rtol=1e-6, atol=1e-9,
+                   delta_t=None, max_delta_t=np.inf):
+    # Adaptive Runge Kutta 5(4) with error control: a step is accepted if
+    # the (rms) difference between the 5th and 4th order solutions is below
+    # atol + rtol*|P|, otherwise it is rejected and retried with a smaller
+    # delta_t. The solution is returned at the requested ts (dense output)
+    # and not at the internal steps. P0 can be an array (element-wise
+    # slope_func) to integrate several scenarios with a common step.
+    # The ts can be in any order but not negative (integration from t=0).
+    requested_ts = np.asarray(ts, dtype=float)
+    if np.any(requested_ts < 0):
+        raise ValueError("Requested times must be non-negative")
+    order = np.argsort(requested_ts, kind="stable")
+    ts = requested_ts[order]
+    P = np.asarray(P0, dtype=float)
+    Ps = np.empty(ts.shape + P.shape)
+    logs = {"n_evals": 0, "n_accepted": 0, "n_rejected": 0,
+            "ts_steps": [0.0]}
+    
+    t = 0.0
+    tmax = ts.max()
+    Ps[ts == 0] = P
+    i = np.searchsorted(ts, 0, side="right")  # next requested time
+    
+    K = np.empty((7, ) + P.shape)
+    K[0] = slope_func(P)
+    logs["n_evals"] += 1
+    
+    if delta_t is None:
+        # Initial step from the scale of the solution and of its slope
+        scale = atol + rtol*np.abs(P)
+        d0 = np.sqrt(np.mean((P/scale)**2))
+        d1 = np.sqrt(np.mean((K[0]/scale)**2))
+        delta_t = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01*d0/d1
+    delta_t = min(delta_t, max_delta_t)
+    
+    while t < tmax:
+        delta_t = min(delta_t, tmax - t)
+        for stage in range(1, 7):
+            P_stage = P + delta_t*np.tensordot(DP_A[stage], K[:stage],
+                                               axes=1)
+            K[stage] = slope_func(P_stage)
+        new_P = P_stage  # the 7th stage is evaluated at the 5th order sol.
+        logs["n_evals"] += 6
+        
+        scale = atol + rtol*np.maximum(np.abs(P), np.abs(new_P))
+        error = np.sqrt(np.mean((delta_t*np.tensordot(DP_E, K, axes=1)
+                                 / scale)**2))
+        
+        if error <= 1:
+            # Dense output for the requested times inside the step
+            j = np.searchsorted(ts, t + delta_t, side="right")
+            if j > i:
+                theta = (ts[i:j] - t)/delta_t
+                powers = np.cumprod(np.repeat(theta[:, None], 4, axis=1),
+                                    axis=1)
+                Q = np.tensordot(DP_P, K, axes=([0], [0]))  # (4, ...)
+                Ps[i:j] = P + delta_t*np.tensordot(powers, Q, axes=1)
+                i = j
+            t += delta_t
+            P = new_P
+            K[0] = K[6]  # FSAL
+            logs["n_accepted"] += 1
+            logs["ts_steps"].append(t)
+        else:
+            logs["n_rejected"] += 1
+        
+        # Step size controller (safety factor and bounded growth/shrink)
+        factor = 5 if error == 0 else min(5, max(0.2, 0.9*error**(-1/5)))
+        delta_t = min(delta_t*factor, max_delta_t)
+    
+    Ps[i:] = P
+    # Back to the requested order
+    Ps[order] = Ps.copy()
+    return requested_ts, Ps, logs
+
+def _ensemble(ts, P0s, slope_func, delta_t, method, params):
+    # Scenarios are along the last axis: P0s and every parameter
+    # are broadcast together to shape (n_scenarios, )
+    P0s, *values = np.broadcast_arrays(np.asarray(P0s, dtype=float),
+                                       *[np.asarray(v, dtype=float)
+                                         for v in params.values()])
+    P0s = np.atleast_1d(P0s)
+    params = {k: np.atleast_1d(v) for k, v in zip(params.keys(), values)}
+    
+    ts_ens = time_grid(ts.max(), delta_t)
+    Ps = np.empty((len(ts_ens), P0s.size))
+    slopes = np.empty((len(ts_ens)-1, P0s.size))
+    Ps[0] = P0s.ravel()
+    params = {k: v.ravel() for k, v in params.items()}
+    
+    for i in range(len(ts_ens)-1):
+        P = Ps[i]
+        # Each stage slope is evaluated once for the whole ensemble
+        slope = slope_func(P, **params)
+        slopes[i] = slope
+        if method == "euler":
+            Ps[i+1] = P + delta_t*slope
+        else:
+            P_tmp = P + delta_t*slope
+            Ps[i+1] = P + delta_t/2*(slope + slope_func(P_tmp, **params))
+    return ts_ens, Ps, {"slopes": slopes}
+
+def euler_ensemble(ts, P0s, slope_func, delta_t=0.5, **params):
+    # Euler method on many scenarios (P0, r, M, ...) at once.
+    # slope_func(P, **params) must work element-wise on arrays, e.g.
+    # slope_max_capacity. Returns ts (n_steps, ), Ps (n_steps, n_scenarios)
+    # and logs["slopes"] (n_steps-1, n_scenarios), column j matching
+    # euler(ts, P0s[j], lambda P: slope_func(P, **params_j), delta_t)
+    return _ensemble(ts, P0s, slope_func, delta_t, "euler", params)
+
+def runge_kutta_ensemble(ts, P0s, slope_func, delta_t=0.5, **params):
+    # Runge Kutta (order 2) version of euler_ensemble
+    return _ensemble(ts, P0s, slope_func, delta_t, "runge_kutta", params)
+
 if __name__ == "__main__":
+    import os
+    # ./images of this directory, whatever the working directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    import matplotlib.pyplot as plt
     ### Population model without maximum capacity
     M = 0.65*1.5
     r = 2
@@ -190,4 +430,23 @@ if __name__ == "__main__":
     plt.plot(ts_rgk, Ps_rgk, 'x-',
              label=fr"$P_0=${1.2}, Runge Kutta order 2")
     plt.legend()
-    plt.savefig("./images/max_capacity.png")
\ No newline at end of file
+    plt.savefig("./images/max_capacity.png")
+    
+    
+    ### Slope evaluations needed to reach a given accuracy (max error w.r.t.
+    ### the analytical solution of the logistic model)
+    slope_func = lambda P: slope_max_capacity(P, r, M)
+    for P0 in [0.12, 1.2]:
+        exact = lambda t: P_max_capacity(np.asarray(t), P0, r, M)
+        for rtol in [1e-4, 1e-6, 1e-8]:
+            _, Ps_dp, logs = dormand_prince(ts, P0, slope_func,
+                                            rtol=rtol, atol=rtol*1e-3)
+            print(f"P0={P0}, Dormand-Prince rtol={rtol:.0e}: "
+                  f"error={np.abs(Ps_dp-exact(ts)).max():.2e}, "
+                  f"{logs['n_evals']} slope evaluations")
+        for delta_t in [1e-2, 1e-3]:
+            ts_rgk, Ps_rgk, logs = runge_kutta(ts, P0, slope_func,
+                                               delta_t=delta_t)
+            print(f"P0={P0}, Runge Kutta delta_t={delta_t:.0e}: "
+                  f"error={np.abs(Ps_rgk-exact(ts_rgk)).max():.2e}, "
+                  f"{2*len(logs['slopes'])} slope evaluations")
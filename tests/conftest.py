@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+# The packages are imported from the repository root (as with python -m)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import time
+import numpy as np
+import pytest
+from diffusion_process.diffusion import (DiffusionSolver, ADISolver,
+                                         run_to_steady_state)
+from diffusion_process.snapshots import SnapshotWriter, SnapshotReader
+from diffusion_process.spatio_temporal_diffusion_process_euler_method import (
+    apply_boundary_cond, euler_step)
+
+
+def initial_field(shape, seed=0):
+    s_0 = 0.2 + 0.1*np.random.default_rng(seed).uniform(-1, 1, size=shape)
+    apply_boundary_cond(s_0)
+    return s_0
+
+
+@pytest.mark.parametrize("shape", [(3, 4), (20, 20), (31, 17)])
+def test_in_place_solver_is_bitwise_euler_step(shape):
+    s = initial_field(shape)
+    solver = DiffusionSolver(s, 0.5, 0.1)
+    for num_steps in [1, 2, 50]:
+        for _ in range(num_steps):
+            s = euler_step(s, 0.5, 0.1, 1)
+        np.testing.assert_array_equal(solver.step(num_steps), s)
+    assert solver.num_steps == 53
+
+
+@pytest.mark.parametrize("n_workers", [1, 2, 3])
+def test_strip_parallel_solver_equals_serial(n_workers):
+    from diffusion_process.parallel_diffusion import ParallelDiffusionSolver
+    s_0 = initial_field((41, 23))
+    serial = DiffusionSolver(s_0, 0.5, 0.1)
+    with ParallelDiffusionSolver(s_0, 0.5, 0.1, n_workers=n_workers) as solver:
+        for num_steps in [1, 10, 100]:
+            np.testing.assert_array_equal(solver.step(num_steps),
+                                          serial.step(num_steps))
+        assert solver.num_steps == serial.num_steps
+    with pytest.raises(ValueError):
+        solver.step()
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("num_frames, chunk_size", [(12, 4), (10, 4), (3, 16)])
+def test_snapshots_read_back_bitwise(tmp_path, compress, num_frames,
+                                     chunk_size):
+    rng = np.random.default_rng(0)
+    frames = rng.normal(size=(num_frames, 5, 6))
+    steps = np.cumsum(rng.integers(1, 10, size=num_frames))
+    with SnapshotWriter(tmp_path, chunk_size=chunk_size,
+                        compress=compress, queue_size=2) as writer:
+        for step, s in zip(steps, frames.copy()):
+            writer.write(step, s)
+            s[...] = np.nan  # the writer keeps its own copy
+    reader = SnapshotReader(tmp_path)
+    assert len(reader) == num_frames
+    np.testing.assert_array_equal(reader.steps, steps)
+    for step, s in zip(steps[::-1], frames[::-1]):
+        np.testing.assert_array_equal(reader[step], s)
+    assert [step for step, _ in reader.frames()] == list(steps)
+    with pytest.raises(KeyError):
+        reader[steps[-1] + 1]
+
+def test_snapshots_without_frames(tmp_path):
+    with SnapshotWriter(tmp_path):
+        pass
+    assert len(SnapshotReader(tmp_path)) == 0
+
+def test_snapshot_writer_error_keeps_written_chunks(tmp_path):
+    writer = SnapshotWriter(tmp_path, chunk_size=3)
+    write_chunk = writer._write_chunk
+    def failing_write_chunk(k, frames):
+        if k == 2:
+            raise OSError("disk full")
+        write_chunk(k, frames)
+    writer._write_chunk = failing_write_chunk
+    frames = np.arange(11*4, dtype=float).reshape(11, 2, 2)
+    for step, s in enumerate(frames[:7]):
+        writer.write(step, s)
+    # The third chunk fails once full: later writes raise the error
+    with pytest.raises(OSError, match="disk full"):
+        for step in range(7, 10**4):
+            writer.write(step, frames[step % 11])
+            time.sleep(1e-3)
+    with pytest.raises(OSError, match="disk full"):
+        writer.close()
+    # steps.npy describes the chunks on disk only
+    reader = SnapshotReader(tmp_path)
+    assert len(reader) == 6
+    for step, s in reader.frames():
+        np.testing.assert_array_equal(s, frames[step])
+
+def test_snapshot_writer_error_on_close(tmp_path):
+    writer = SnapshotWriter(tmp_path, chunk_size=4)
+    def failing_write_chunk(k, frames):
+        raise OSError("disk full")
+    writer._write_chunk = failing_write_chunk
+    writer.write(0, np.zeros(3))
+    with pytest.raises(OSError, match="disk full"):
+        writer.close()
+    assert len(SnapshotReader(tmp_path)) == 0
+
+
+@pytest.mark.parametrize("delta_t", [5, 20])
+def test_adi_solver_reaches_the_explicit_steady_state(delta_t):
+    # Far beyond the explicit stability limit delta_x**2/(4*D) = 0.5
+    s_0 = initial_field((12, 17))
+    explicit, _ = run_to_steady_state(DiffusionSolver(s_0, 0.5, 0.1),
+                                      tol=1e-10)
+    s, norm = run_to_steady_state(ADISolver(s_0, 0.5, delta_t), tol=1e-10,
+                                  check_every=10)
+    assert norm < 1e-10
+    np.testing.assert_allclose(s, explicit, atol=1e-8)
+
+@pytest.mark.parametrize("delta_t", [0.5, 1])
+def test_adi_solver_follows_the_explicit_solver(delta_t):
+    s_0 = initial_field((12, 17))
+    explicit = DiffusionSolver(s_0, 0.5, 0.01)
+    explicit.step(2000)
+    solver = ADISolver(s_0, 0.5, delta_t)
+    solver.step(round(20/delta_t))
+    assert solver.t == pytest.approx(explicit.t)
+    # The fields change by ~0.8 over this time
+    np.testing.assert_allclose(solver.s, explicit.s, atol=1e-3)
+
+
+@pytest.mark.parametrize("shape", [(33, 47), (47, 33), (20, 9)])
+@pytest.mark.parametrize("preconditioned", [True, False])
+def test_multigrid_steady_state_on_non_square_grids(shape, preconditioned):
+    from diffusion_process.multigrid import steady_state, residual
+    s_0 = initial_field(shape)
+    explicit, _ = run_to_steady_state(DiffusionSolver(s_0, 0.5, 0.5),
+                                      tol=1e-9)
+    s, norms = steady_state(s_0, tol=1e-9, preconditioned=preconditioned)
+    mask = np.full(shape, np.nan)
+    apply_boundary_cond(mask)
+    free = np.isnan(mask)
+    # Residual recomputed from scratch (not the conjugate gradient one)
+    r = residual(s, np.zeros(shape), free, 1)
+    assert np.max(np.abs(r)) < 1e-9
+    assert norms[-1] < 1e-9
+    np.testing.assert_allclose(s, explicit, atol=1e-7)
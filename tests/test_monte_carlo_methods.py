@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from monte_carlo_methods.mcmc import mcmc, mcmc_chains, log_P_accept
+from monte_carlo_methods.ising_model import (ising_mcmc, ising_checkerboard,
+                                             ising_energy, neighbour_table)
+from monte_carlo_methods.ising_cluster import wolff, swendsen_wang
+from monte_carlo_methods.recording import RunningStats, Recorder
+from monte_carlo_methods.parallel_tempering import (parallel_tempering,
+                                                    mcmc_sampler,
+                                                    ising_sampler)
+from monte_carlo_methods.resampling import SCHEMES, resample
+from monte_carlo_methods.streaming_importance_sampling import (
+    importance_sampling, merge_sums)
+
+
+def double_well(x):
+    return -np.logaddexp(-(x+3)**2/(2*0.5**2), -(x-3)**2/(2*0.5**2))
+
+
+@pytest.mark.parametrize("sampler, x0s", [
+    (mcmc_sampler(double_well), [-3.0]*4),
+    (ising_sampler(1/4), [np.where(np.arange(16) % 3, 1, -1) for _ in range(4)])])
+def test_parallel_tempering_does_not_depend_on_n_workers(sampler, x0s):
+    # Each replica has its own random stream: same results with any number
+    # of worker processes, and the initial states are left untouched. The
+    # states are recorded after each round (also by in-place samplers)
+    originals = [np.copy(x0) for x0 in x0s]
+    results = [parallel_tempering(sampler, x0s, np.geomspace(1, 10, 4),
+                                  n_rounds=20, steps_per_round=5,
+                                  observable=lambda x: x,
+                                  n_workers=n_workers, seed=0)
+               for n_workers in [1, 2, 4]]
+    for other in results[1:]:
+        for key in ["temperatures", "swap_rates", "energies", "observables"]:
+            np.testing.assert_array_equal(other[key], results[0][key])
+        for state, reference in zip(other["states"], results[0]["states"]):
+            np.testing.assert_array_equal(state, reference)
+    for x0, original in zip(x0s, originals):
+        np.testing.assert_array_equal(x0, original)
+
+
+def test_parallel_tempering_only_returns_energies_by_default():
+    x0s = [-3.0]*4
+    with_states = parallel_tempering(mcmc_sampler(double_well), x0s,
+                                     np.geomspace(1, 10, 4), n_rounds=10,
+                                     steps_per_round=5,
+                                     observable=lambda x: x, n_workers=2,
+                                     seed=0)
+    results = parallel_tempering(mcmc_sampler(double_well), x0s,
+                                 np.geomspace(1, 10, 4), n_rounds=10,
+                                 steps_per_round=5, n_workers=2, seed=0)
+    assert results["observables"] is None
+    np.testing.assert_array_equal(results["energies"],
+                                  with_states["energies"])
+    assert len(results["states"]) == 4
+
+
+def test_parallel_tempering_raises_sampler_errors():
+    def sampler(x, temperature, n_steps, rng):
+        raise ZeroDivisionError("in the sampler")
+    with pytest.raises(ZeroDivisionError):
+        parallel_tempering(sampler, [0.0]*2, [1, 2], n_rounds=2, n_workers=2)
+
+
+@pytest.mark.parametrize("scheme", list(SCHEMES))
+@pytest.mark.parametrize("n", [None, 7, 25])
+def test_resampling_counts_are_unbiased(scheme, n):
+    # E[number of copies of particle i] = n*w_i: the mean counts over many
+    # resamplings are within 5 standard errors of the multinomial ones (the
+    # other schemes have smaller variances)
+    rng = np.random.default_rng(0)
+    log_weights = rng.normal(size=10)
+    log_weights[3] = -np.inf  # never resampled
+    weights = np.exp(log_weights - np.max(log_weights))
+    weights /= weights.sum()
+    n_particles = len(weights) if n is None else n
+    n_repeats = 4000
+    counts = np.zeros(len(weights))
+    for _ in range(n_repeats):
+        indices = resample(log_weights, n=n, scheme=scheme, rng=rng)
+        assert len(indices) == n_particles
+        counts += np.bincount(indices, minlength=len(weights))
+    expected = n_particles*weights
+    se = np.sqrt(n_particles*weights*(1 - weights)/n_repeats)
+    assert np.all(np.abs(counts/n_repeats - expected) <= 5*se + 1e-12)
+    assert counts[3] == 0
+
+
+def test_importance_sampling_skips_chunks_of_zero_weights():
+    # Uniform(0, 1) target, N(3, 1) proposal: most chunks of 5 samples have
+    # no sample in (0, 1) and must not turn the running sums into nan
+    log_f = lambda x: np.where((x > 0) & (x < 1), 0.0, -np.inf)
+    log_g = lambda x: -0.5*np.log(2*np.pi) - (x - 3)**2/2
+    sample_g = lambda rng, n: rng.normal(3, 1, size=n)
+    result = importance_sampling(log_f, log_g, sample_g, lambda x: x,
+                                 chunk_size=5, max_samples=5000, seed=0)
+    assert result["n"] == 5000
+    for key in ["estimate", "se", "snis_estimate", "snis_se", "ess",
+                "log_Z"]:
+        assert np.isfinite(result[key])
+    assert abs(result["estimate"] - 0.5) < 5*result["se"]
+    assert abs(result["snis_estimate"] - 0.5) < 5*result["snis_se"]
+
+def test_merge_sums_with_empty_sums():
+    sums = np.arange(1.0, 6.0)
+    for shift, other in [(-np.inf, np.zeros(5)), (2.0, sums)]:
+        merged_shift, merged = merge_sums(shift, other, -np.inf, np.zeros(5))
+        assert merged_shift == shift
+        np.testing.assert_array_equal(merged, other)
+    merged_shift, merged = merge_sums(-np.inf, np.zeros(5), 2.0, sums)
+    assert merged_shift == 2.0
+    np.testing.assert_array_equal(merged, sums)
+
+
+def test_log_acceptance_matches_linear_formulas():
+    # exp(log_P_accept) against the acceptance probabilities computed with
+    # the densities themselves (no overflow at these scales)
+    rng = np.random.default_rng(0)
+    f_new, f_x, g_forward, g_backward = rng.uniform(0.01, 10, size=(4, 1000))
+    log_g_ratio = np.log(g_backward) - np.log(g_forward)
+    np.testing.assert_allclose(
+        np.exp(log_P_accept(None, np.log(f_new), np.log(f_x))),
+        np.minimum(1, f_new/f_x), rtol=1e-12)
+    np.testing.assert_allclose(
+        np.exp(log_P_accept("metropolis-hastings", np.log(f_new),
+                            np.log(f_x), log_g_ratio)),
+        np.minimum(1, f_new*g_backward/(f_x*g_forward)), rtol=1e-12)
+    np.testing.assert_allclose(
+        np.exp(log_P_accept("glauber", np.log(f_new), np.log(f_x))),
+        f_new/(f_x + f_new), rtol=1e-12)
+
+@pytest.mark.parametrize("algorithm", [None, "glauber"])
+def test_mcmc_with_huge_log_densities(algorithm):
+    # exp(-1e6*x**2) underflows to 0 away from 0 (0/0 in linear space)
+    samples, logs = mcmc(lambda x: -1e6*x**2, 1.0, algorithm=algorithm,
+                         tmax=2000, burn_in=0, log_density=True,
+                         return_logs=True, rng=np.random.default_rng(0))
+    assert np.all(np.isfinite(samples))
+    assert np.isfinite(logs["log_f"])
+    assert abs(logs["x"]) < 1.0
+    assert logs["n_accepted"] > 0
+
+def test_mcmc_evaluates_the_density_once_per_step():
+    log_f = lambda x: -x**2/2
+    _, logs = mcmc(log_f, 0.0, tmax=1000, log_density=True,
+                   return_logs=True, rng=np.random.default_rng(0))
+    assert logs["n_evals"] == 1000 + 1
+    _, logs = mcmc_chains(log_f, np.zeros(8), tmax=1000, log_density=True,
+                          return_logs=True, rng=np.random.default_rng(0))
+    assert logs["n_evals"] == 8*(1000 + 1)
+
+@pytest.mark.parametrize("tmax, burn_in, thin", [(100, None, 1), (100, 0, 1),
+                                                 (100, 10, 3), (50, 49, 1),
+                                                 (50, 60, 2)])
+def test_mcmc_kept_samples(tmax, burn_in, thin):
+    # Every proposal x+1 is accepted (constant density), so the state after
+    # step t is t+1: the samples kept are the states after the steps
+    # burn_in+1, burn_in+1+thin, ... (burn_in default: tmax//10)
+    samples = mcmc(lambda x: 1.0, 0, algorithm="metropolis-hastings",
+                   tmax=tmax, burn_in=burn_in, thin=thin,
+                   sample_candidate=lambda x: x + 1,
+                   proposal_distr=lambda x_new, x: 1.0)
+    first = (tmax//10 if burn_in is None else burn_in) + 1
+    np.testing.assert_array_equal(samples,
+                                  np.arange(first, tmax, thin) + 1)
+    chains = mcmc_chains(lambda x: np.ones(x.shape[-1]), np.zeros(3),
+                         algorithm="metropolis-hastings", tmax=tmax,
+                         burn_in=burn_in, thin=thin,
+                         sample_candidate=lambda x: x + 1,
+                         proposal_distr=lambda x_new, x: np.ones(x.shape[-1]))
+    np.testing.assert_array_equal(chains[:, :, 0], np.repeat(
+        (np.arange(first, tmax, thin) + 1)[:, None], 3, axis=1))
+
+
+
+def ar1(n, shape=(), seed=0):
+    # Correlated series x_t = 0.9*x_{t-1} + noise (plus an offset)
+    rng = np.random.default_rng(seed)
+    x = np.empty((n, ) + shape)
+    x[0] = rng.normal(size=shape)
+    for t in range(1, n):
+        x[t] = 0.9*x[t-1] + rng.normal(size=shape)
+    return x + 3
+
+def reference_autocorrelation(x, max_lag):
+    # cov(x_t, x_{t-k}) over the n-k pairs, normalized by lag 0
+    n = len(x)
+    cov = np.array([np.mean(x[k:]*x[:n-k], axis=0)
+                    - np.mean(x[k:], axis=0)*np.mean(x[:n-k], axis=0)
+                    for k in range(min(n, max_lag+1))])
+    return cov/cov[0]
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 1024, 5000])
+@pytest.mark.parametrize("n, shape, max_lag", [(1000, (), 50),
+                                               (300, (2, 3), 20),
+                                               (30, (), 100)])
+def test_running_stats_match_numpy(batch_size, n, shape, max_lag):
+    x = ar1(n, shape)
+    stats = RunningStats(max_lag=max_lag, batch_size=batch_size)
+    for t, value in enumerate(x):
+        stats.update(value)
+        if t == n//3:
+            # Reading flushes a partial batch in the middle of the series
+            np.testing.assert_allclose(stats.mean, x[:t+1].mean(axis=0))
+    np.testing.assert_allclose(stats.mean, x.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(stats.var, x.var(axis=0, ddof=1), rtol=1e-10)
+    np.testing.assert_allclose(stats.autocorrelation(),
+                               reference_autocorrelation(x, max_lag),
+                               rtol=1e-8, atol=1e-10)
+    assert stats.n == n
+
+
+@pytest.mark.parametrize("storage", ["int8", "packbits", "float", None])
+def test_recorder_snapshots_round_trip(storage, tmp_path):
+    rng = np.random.default_rng(0)
+    states = 2*rng.integers(2, size=(10, 5, 7)) - 1
+    for path in [None, str(tmp_path/"snapshots.npy")]:
+        recorder = Recorder((5, 7), n_snapshots=4, every=3, storage=storage,
+                            path=path)
+        for state in states:
+            recorder.record(state, energy=np.sum(state))
+        assert recorder.n_snapshots == 4
+        assert recorder.storage == (storage or "int8")
+        for i in range(4):
+            np.testing.assert_array_equal(recorder.snapshot(i), states[3*i])
+        np.testing.assert_allclose(recorder.stats["energy"].mean,
+                                   np.mean(states.sum(axis=(1, 2))))
+    if path is not None:
+        stored = np.load(path)
+        assert len(stored) == 4
+
+def test_recorder_default_storage_keeps_floats():
+    recorder = Recorder((3, ), n_snapshots=2)
+    recorder.record(np.array([0.7, -1.5, 2.25]))
+    recorder.record(np.array([1, 2, 3]))
+    assert recorder.storage == "float"
+    np.testing.assert_array_equal(recorder.snapshot(0), [0.7, -1.5, 2.25])
+    recorder = Recorder((3, ), n_snapshots=2)
+    recorder.record(np.array([0, 5, -3]))
+    assert recorder.storage == "int8"
+    np.testing.assert_array_equal(recorder.snapshot(0), [0, 5, -3])
+
+@pytest.mark.parametrize("storage, state", [("int8", [0.7, 1, -1]),
+                                            ("int8", [300, 1, -1]),
+                                            ("packbits", [2, 1, -1]),
+                                            ("packbits", [0, 1, -1]),
+                                            (None, [1, 1, 1000])])
+def test_recorder_rejects_unrepresentable_states(storage, state):
+    recorder = Recorder((3, ), n_snapshots=2, storage=storage)
+    if storage is None:
+        recorder.record(np.array([1, -1, 1]))  # int8 from the first state
+    with pytest.raises(ValueError):
+        recorder.record(np.array(state))
+
+
+def script_energy(s, n, J):
+    # Definition of the script of ising_model.py
+    num_spins = n**2
+    s_i_times_s_j = lambda s: s*(np.where(np.arange(num_spins)%n > 0, np.roll(s,1), 0)+
+                                      np.where(np.arange(num_spins)%n < n-1, np.roll(s,-1), 0)+
+                                      np.where(np.arange(num_spins) > n-1, np.roll(s,n), 0)+
+                                      np.where(np.arange(num_spins) < num_spins-1-(n-1), np.roll(s,-n), 0))
+    return -J*np.sum(s_i_times_s_j(s))
+
+@pytest.mark.parametrize("n", [1, 2, 3, 8])
+def test_ising_energy_matches_script(n):
+    rng = np.random.default_rng(n)
+    for _ in range(5):
+        s = 2*rng.integers(2, size=n**2) - 1
+        assert ising_energy(s, neighbour_table(n), 0.25) == \
+            script_energy(s, n, 0.25)
+
+@pytest.mark.parametrize("algorithm", ["glauber", "metropolis"])
+@pytest.mark.parametrize("J, k_B_times_T", [(0.25, 0.1), (1, 2.5), (-1, 1)])
+def test_ising_mcmc_running_energy(algorithm, J, k_B_times_T):
+    n = 6
+    rng = np.random.default_rng(0)
+    s = 2*rng.integers(2, size=n**2) - 1
+    logs = ising_mcmc(s, J, k_B_times_T, 20, algorithm=algorithm, rng=rng)
+    assert logs["energies"][-1] == ising_energy(s, neighbour_table(n), J)
+    assert logs["energies"][-1] == script_energy(s, n, J)
+    assert logs["magnetizations"][-1] == np.sum(s)
+
+
+ISING_PARAMETERS = [(0.25, 0.4), (0.25, 1.0), (1, 2.5)]  # (J, k_B_times_T)
+
+def exact_ising_averages(n, J, k_B_times_T):
+    # <E> and <|M|> by enumerating the 2**(n*n) lattices
+    s = 1 - 2*((np.arange(2**(n*n))[:, None] >> np.arange(n*n)) & 1)
+    s_pad = np.append(s, np.zeros((len(s), 1), dtype=int), axis=1)
+    E = -J*np.sum(s*s_pad[:, neighbour_table(n)].sum(axis=2), axis=1)
+    weights = np.exp(-(E - E.min())/k_B_times_T)
+    weights /= weights.sum()
+    return np.array([weights @ E, weights @ np.abs(s.sum(axis=1))])
+
+def ising_averages(logs, discard=100):
+    return np.array([np.mean(logs["energies"][discard:], axis=0),
+                     np.mean(np.abs(logs["magnetizations"][discard:]), axis=0)])
+
+def test_ising_checkerboard_matches_ising_mcmc():
+    # One stack with 4 lattices per (J, k_B_times_T), against single spin
+    # flips and the exact averages of the 4 x 4 lattice
+    n, replicas = 4, 4
+    rng = np.random.default_rng(0)
+    J, k_B_times_T = np.repeat(ISING_PARAMETERS, replicas, axis=0).T
+    s = 2*rng.integers(2, size=(len(J), n, n)) - 1
+    stack_logs = ising_checkerboard(s, J, k_B_times_T, 4000, rng=rng)
+    assert stack_logs["energies"].shape == (4001, len(J))
+    for k in range(len(J)):
+        assert stack_logs["energies"][-1, k] == \
+            ising_energy(s[k].ravel(), neighbour_table(n), J[k])
+    averages = ising_averages(stack_logs).reshape(2, -1, replicas).mean(axis=2)
+    for k, (J_k, k_B_times_T_k) in enumerate(ISING_PARAMETERS):
+        s_k = 2*rng.integers(2, size=n*n) - 1
+        logs = ising_mcmc(s_k, J_k, k_B_times_T_k, 10000, rng=rng)
+        exact = exact_ising_averages(n, J_k, k_B_times_T_k)
+        np.testing.assert_allclose(averages[:, k], exact, rtol=0.06)
+        np.testing.assert_allclose(ising_averages(logs), exact, rtol=0.06)
+        np.testing.assert_allclose(averages[:, k], ising_averages(logs),
+                                   rtol=0.06)
+
+@pytest.mark.parametrize("algorithm", ["wolff", "swendsen_wang"])
+def test_cluster_updates_match_ising_mcmc(algorithm):
+    update = {"wolff": wolff, "swendsen_wang": swendsen_wang}[algorithm]
+    n = 4
+    rng = np.random.default_rng(1)
+    for J, k_B_times_T in ISING_PARAMETERS:
+        s = 2*rng.integers(2, size=n*n) - 1
+        logs = update(s, J, k_B_times_T, 8000, rng=rng)
+        assert logs["energies"][-1] == ising_energy(s, neighbour_table(n), J)
+        assert logs["magnetizations"][-1] == np.sum(s)
+        s = 2*rng.integers(2, size=n*n) - 1
+        mcmc_logs = ising_mcmc(s, J, k_B_times_T, 10000, rng=rng)
+        exact = exact_ising_averages(n, J, k_B_times_T)
+        np.testing.assert_allclose(ising_averages(logs), exact, rtol=0.06)
+        np.testing.assert_allclose(ising_averages(logs),
+                                   ising_averages(mcmc_logs), rtol=0.06)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from single_population_growth.single_population_growth import (
+    euler, runge_kutta, euler_ensemble, runge_kutta_ensemble, time_grid,
+    integrate_stream, dormand_prince, P_max_capacity, slope_max_capacity)
+
+
+@pytest.mark.parametrize("ensemble, scalar", [(euler_ensemble, euler),
+                                              (runge_kutta_ensemble,
+                                               runge_kutta)])
+def test_ensemble_matches_scalar_method(ensemble, scalar):
+    # Each column of the ensemble is the scalar integration of its scenario
+    # (same operations, so the same floating point values)
+    ts = time_grid(4, 0.1)
+    P0s = np.array([0.1, 0.5, 1.2, 2.0])
+    rs = np.array([2.0, 1.5, 3.0, 0.5])
+    M = 0.975
+    ts_ensemble, Ps, logs = ensemble(ts, P0s, slope_max_capacity, 0.1,
+                                     r=rs, M=M)
+    assert Ps.shape == (len(ts), len(P0s))
+    for j, (P0, r) in enumerate(zip(P0s, rs)):
+        ts_j, Ps_j, logs_j = scalar(ts, P0,
+                                    lambda P: slope_max_capacity(P, r, M),
+                                    0.1)
+        np.testing.assert_array_equal(ts_ensemble, ts_j)
+        np.testing.assert_array_equal(Ps[:, j], Ps_j)
+        np.testing.assert_array_equal(logs["slopes"][:, j], logs_j["slopes"])
+
+
+@pytest.mark.parametrize("method, function", [("euler", euler),
+                                              ("runge_kutta", runge_kutta)])
+@pytest.mark.parametrize("every", [1, 3])
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_integrate_stream_matches_lists(method, function, every, chunk_size):
+    # Drained to the end, the chunks are the same numbers as the lists of
+    # euler/runge_kutta (every every-th step), slopes included
+    slope = lambda P: slope_max_capacity(P, 2, 0.975)
+    ts_list, Ps_list, logs = function(time_grid(10, 0.1), 0.05, slope, 0.1)
+    for log_slopes in [False, True]:
+        chunks = list(integrate_stream(0.05, slope, 10, 0.1, method,
+                                       chunk_size=chunk_size, every=every,
+                                       log_slopes=log_slopes))
+        assert all(len(chunk) == (3 if log_slopes else 2)
+                   for chunk in chunks)
+        assert all(len(chunk[0]) <= chunk_size for chunk in chunks)
+        ts, Ps = (np.concatenate([chunk[i] for chunk in chunks])
+                  for i in range(2))
+        np.testing.assert_array_equal(ts, np.array(ts_list)[::every])
+        np.testing.assert_array_equal(Ps, np.array(Ps_list)[::every])
+        if log_slopes:
+            # The slope of the last state isn't in the logs (never used)
+            slopes = np.concatenate([chunk[2] for chunk in chunks])
+            kept = np.arange(0, len(Ps_list), every)
+            kept = kept[kept < len(logs["slopes"])]
+            np.testing.assert_array_equal(slopes[:len(kept)],
+                                          np.array(logs["slopes"])[kept])
+
+
+@pytest.mark.parametrize("P0", [0.05, 2.0])
+def test_dormand_prince_error_follows_rtol(P0):
+    # Relative error of the dense output against the analytical solution:
+    # within a small factor of rtol, and smaller for smaller rtol
+    ts = np.linspace(0, 10, 101)
+    exact = P_max_capacity(ts, P0, 2, 0.975)
+    errors = []
+    for rtol in [1e-3, 1e-5, 1e-7, 1e-9]:
+        ts_out, Ps, logs = dormand_prince(
+            ts, P0, lambda P: slope_max_capacity(P, 2, 0.975), rtol=rtol,
+            atol=1e-12)
+        np.testing.assert_array_equal(ts_out, ts)
+        errors.append(np.max(np.abs(Ps - exact)/np.abs(exact)))
+        assert errors[-1] < 10*rtol
+    assert np.all(np.diff(errors) < 0)
+
+def test_dormand_prince_unsorted_times():
+    # Same values as the sorted times, in the requested order
+    ts = np.array([3, 1, 2, 0, 10, 2.5, 1])
+    slope_func = lambda P: slope_max_capacity(P, 2, 0.975)
+    ts_out, Ps, _ = dormand_prince(ts, [0.05, 2.0], slope_func, rtol=1e-9,
+                                   atol=1e-12)
+    np.testing.assert_array_equal(ts_out, ts)
+    order = np.argsort(ts)
+    _, sorted_Ps, _ = dormand_prince(ts[order], [0.05, 2.0], slope_func,
+                                     rtol=1e-9, atol=1e-12)
+    np.testing.assert_array_equal(Ps[order], sorted_Ps)
+    for j, P0 in enumerate([0.05, 2.0]):
+        np.testing.assert_allclose(Ps[:, j], P_max_capacity(ts, P0, 2, 0.975),
+                                   rtol=1e-7)
+    with pytest.raises(ValueError):
+        dormand_prince([1, -1, 2], 0.05, slope_func)
+
+def test_dormand_prince_scenarios_share_the_steps():
+    # Several initial populations at once, each one as accurate as alone
+    ts = np.linspace(0, 10, 101)
+    P0s = np.array([0.05, 2.0])
+    _, Ps, _ = dormand_prince(ts, P0s,
+                              lambda P: slope_max_capacity(P, 2, 0.975),
+                              rtol=1e-7, atol=1e-12)
+    assert Ps.shape == (len(ts), len(P0s))
+    for j, P0 in enumerate(P0s):
+        exact = P_max_capacity(ts, P0, 2, 0.975)
+        assert np.max(np.abs(Ps[:, j] - exact)/exact) < 1e-6